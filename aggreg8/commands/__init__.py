@@ -0,0 +1,64 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+##
+# aggreg8.git:aggreg8/commands/__init__.py
+##
+
+## {{{ ---- [ Header ] -----------------------------------------------------------------------------
+
+##
+# Copyright (c) 2021 Francis M <francism@destinatech.com>
+#
+# This program is free software; you can redistribute it and/or modify it under
+# the terms of the GNU General Public License version 2.0 as published by the
+# Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE.  See the GNU General Public License for more
+# details.
+#
+# You should have received a copy of the GNU General Public License along with
+# this program; if not, write to:
+#
+#   Free Software Foundation
+#   51 Franklin Street, Fifth Floor
+#   Boston, MA 02110
+#   USA
+##
+
+## }}} ---- [ Header ] -----------------------------------------------------------------------------
+
+import importlib
+
+## {{{ ---- [ Constants ] --------------------------------------------------------------------------
+
+# Commands bin/a8 runs in-process, mapped to the (module, class) implementing
+# them; modules are only imported once their command is run. Commands not
+# listed here are exec()ed as bin/a8-<command> (e.g. external plugins).
+#
+COMMANDS = {
+  'init': ('aggreg8.commands.init', 'A8Init'),
+  'rss': ('aggreg8.commands.rss', 'A8Rss'),
+}
+
+## }}} ---- [ Constants ] --------------------------------------------------------------------------
+
+## {{{ ---- [ Functions ] --------------------------------------------------------------------------
+
+## {{{ command_factory()
+def command_factory(command):
+  # Return the class implementing command, or None if it isn't registered
+  if command not in COMMANDS:
+    return None
+
+  module, name = COMMANDS[command]
+  return getattr(importlib.import_module(module), name)
+## }}}
+
+## }}} ---- [ Functions ] --------------------------------------------------------------------------
+
+##
+# vim: ts=2 sw=2 tw=100 et fdm=marker :
+##
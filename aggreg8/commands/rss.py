@@ -0,0 +1,375 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+##
+# aggreg8.git:aggreg8/commands/rss.py
+##
+
+## {{{ ---- [ Header ] -----------------------------------------------------------------------------
+
+##
+# Copyright (c) 2021 Francis M <francism@destinatech.com>
+#
+# This program is free software; you can redistribute it and/or modify it under
+# the terms of the GNU General Public License version 2.0 as published by the
+# Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE.  See the GNU General Public License for more
+# details.
+#
+# You should have received a copy of the GNU General Public License along with
+# this program; if not, write to:
+#
+#   Free Software Foundation
+#   51 Franklin Street, Fifth Floor
+#   Boston, MA 02110
+#   USA
+##
+
+## }}} ---- [ Header ] -----------------------------------------------------------------------------
+
+import sys
+
+import signal
+
+from .. import *
+
+from ..config import check_config
+
+from ..database import SCHEMA_VERSION, DatabaseError, factory, migrate
+
+from .. import rss
+
+from .. import url
+
+from ..metrics import Metrics, MetricsError
+
+import config
+
+## {{{ class A8Rss
+
+class A8Rss(A8Base):
+
+  # Database driver object implementing aggreg8.database.Database
+  dbd = None
+
+  # List of valid sub-commands
+  commands = None
+
+  ## {{{ A8Rss.__init__()
+  def __init__(self, argv=sys.argv, command=None):
+    super().__init__(argv, command)
+    self.commands = ['add', 'remove', 'list', 'import', 'export', 'poll', 'daemon']
+  ## }}}
+
+  ## {{{ A8Rss.main()
+  def main(self, argv=sys.argv):
+    # Parse options/arguments nice and early so we can get early
+    # debug/warning/error messages
+    #
+    opts, args = self.parse_argv()
+
+    for opt in opts:
+      if opt in ['-h', '--help']:
+        self.usage()
+      elif opt in ['-v', '--verbose']:
+        self.verbose += 1
+      elif opt in ['-q', '--quiet']:
+        self.verbose = 0
+        self.quiet = True
+      else:
+        die(f"'{opt}' is not an recognised option")
+
+    # -v prints information messages, -vv debug messages too
+    if self.verbose > 1:
+      enable_debug()
+
+    # We need at least one sub-command argument
+    if len(args) < 1:
+      die("sub-command argument required")
+
+    command = args.pop(0)
+    if command not in self.commands:
+      die(f"invalid sub-command '{command}'")
+
+    # Ensure the various A8_* environment variables have been set
+    self.check_env()
+
+    # Verify settings in loeaded config module
+    check_config(config)
+
+    # SQLite only for now...
+    if config.A8_DATABASE_DRIVER != 'sqlite':
+      die(f"support for databases other than SQLite doesn't yet exist")
+
+    # Initialise database driver and connect to/open the respective server/file
+    self.dbd = factory(config.A8_DATABASE_DRIVER)
+    self.dbd.connect(config.A8_SQLITE_DATABASE, config.A8_SQLITE_PRAGMAS,
+      config.A8_SQLITE_CACHED_STATEMENTS)
+
+    # Bring databases created by earlier versions up to date
+    try:
+      version = migrate(self.dbd, f'{config.A8_DATA_DIR}/init.sql')
+    except DatabaseError as ex:
+      die(f"{config.A8_SQLITE_DATABASE}: failed to migrate database: {ex.message}")
+    if version != SCHEMA_VERSION:
+      debug(f"{config.A8_SQLITE_DATABASE}: migrated database from schema version {version}")
+
+    if command == 'add':
+      self.cmd_add(opts, args)
+    elif command == 'list':
+      self.cmd_list(opts, args)
+    elif command == 'import':
+      self.cmd_import(opts, args)
+    elif command == 'export':
+      self.cmd_export(opts, args)
+    elif command == 'poll':
+      self.cmd_poll(opts, args)
+    elif command == 'daemon':
+      self.cmd_daemon(opts, args)
+    else:
+      die_internal(f"support for command '{command}' non-existent")
+
+    self.dbd.close()
+  ## }}}
+
+  ## {{{ A8Rss.cmd_add()
+  def cmd_add(self, opts, args):
+    # We need exactly 3 arguments
+    if len(args) != 3:
+      die(f"3 arguments required but only {len(args)} were given")
+
+    name = args[0]
+    proper_name = args[1]
+    url = args[2]
+    feed = None
+
+    try:
+      feed = rss.RssFeed(name, proper_name, url)
+    except rss.RssFeedError as ex:
+      die(f"RssFeed contructor failed: {ex}")
+
+    feed.insert(self.dbd)
+  ## }}}
+
+  ## {{{ A8Rss.cmd_remove()
+  def cmd_remove(self, opts, args):
+    # We need exactly 1 argument
+    if len(args) != 3:
+      die(f"1 argument required but {len(args)} were given")
+
+    feed_name = args[0]
+
+    if not rss.valid_feed_name(feed_name):
+      die(f"invalid feed name '{feed_name}'")
+
+    try:
+      rss.remove_feed(feed_name)
+    except A8Error as ex:
+      die(f"failed to add feed '{feed_name}': {ex}")
+  ## }}}
+
+  ## {{{ A8Rss.cmd_list()
+  def cmd_list(self, opts, args):
+    # We accept no arguments
+    if len(args) != 0:
+      die(f"list command does not accept argument")
+
+    # Only load the columns we print
+    feeds = rss.RssFeed.feeds(self.dbd, columns=['name', 'proper_name', 'url'])
+    if len(feeds) < 1:
+      perr("No RSS feeds defined")
+      exit(0)
+
+    n = 0
+    for feed in feeds:
+      n += 1
+      if n > 1:
+        pout('')
+
+      name, proper_name, url = feed.get('name'), feed.get('proper_name'), feed.get('url')
+      pout(f'[{proper_name}]')
+      pout(f'Name: {name}')
+      pout(f'URL: {url}')
+  ## }}}
+
+  ## {{{ A8Rss.cmd_import()
+  def cmd_import(self, opts, args):
+    # We need a file ('-' for stdin) and optionally its format, otherwise
+    # implied by its extension
+    #
+    if len(args) not in [1, 2]:
+      die(f"1 or 2 arguments required but {len(args)} were given")
+
+    path = args[0]
+
+    try:
+      format = rss.feed_format(path, args[1] if len(args) > 1 else None)
+
+      # OPML is parsed as bytes, leaving the XML parser to honour the
+      # document's declared encoding
+      #
+      if path == '-':
+        fp = sys.stdin.buffer if format == 'opml' else sys.stdin
+      elif format == 'opml':
+        fp = open(path, 'rb')
+      else:
+        fp = open(path, encoding='utf-8')
+
+      try:
+        added, present, invalid = rss.import_feeds(self.dbd, rss.read_feeds(fp, format),
+          time_now())
+      finally:
+        if path != '-':
+          fp.close()
+    except OSError as ex:
+      die(f"{path}: {ex.strerror}")
+    except rss.RssFeedError as ex:
+      die(f"{path}: {ex}")
+
+    pout(f'{added} feeds added, {present} already present, {invalid} invalid')
+  ## }}}
+
+  ## {{{ A8Rss.cmd_export()
+  def cmd_export(self, opts, args):
+    # We need a file ('-' for stdout) and optionally its format, otherwise
+    # implied by its extension
+    #
+    if len(args) not in [1, 2]:
+      die(f"1 or 2 arguments required but {len(args)} were given")
+
+    path = args[0]
+
+    try:
+      format = rss.feed_format(path, args[1] if len(args) > 1 else None)
+
+      fp = sys.stdout if path == '-' else open(path, 'w', encoding='utf-8')
+      try:
+        rss.write_feeds(fp, rss.export_feeds(self.dbd), format, time_now())
+      finally:
+        if path != '-':
+          fp.close()
+    except OSError as ex:
+      die(f"{path}: {ex.strerror}")
+    except rss.RssFeedError as ex:
+      die(f"{path}: {ex}")
+  ## }}}
+
+  ## {{{ A8Rss.cmd_poll()
+  def cmd_poll(self, opts, args):
+    # We accept no arguments
+    if len(args) != 0:
+      die(f"poll command does not accept argument")
+
+    # Only feeds that are due get loaded; there being none isn't an error
+    try:
+      feeds = rss.RssFeed.due(self.dbd, time_now())
+    except DatabaseError as ex:
+      die(f"failed to load due feeds: {ex.message}: {ex.error}")
+    if len(feeds) < 1:
+      return
+
+    pool = self.pool()
+    poller = self.poller(pool)
+
+    poller.poll(feeds)
+
+    poller.close()
+    pool.close()
+  ## }}}
+
+  ## {{{ A8Rss.cmd_daemon()
+  def cmd_daemon(self, opts, args):
+    # We accept no arguments
+    if len(args) != 0:
+      die(f"daemon command does not accept argument")
+
+    # The connection pool and parser processes are kept for the lifetime of
+    # the daemon
+    #
+    pool = self.pool()
+    poller = self.poller(pool)
+
+    daemon = rss.RssDaemon(self.dbd, poller, reload_interval=config.A8_DAEMON_RELOAD_INTERVAL)
+
+    # Stop cleanly on SIGTERM, finishing the current poll (if any) first
+    signal.signal(signal.SIGTERM, lambda signum, frame: daemon.stop())
+
+    try:
+      daemon.run()
+    finally:
+      poller.close()
+      pool.close()
+  ## }}}
+
+  ## {{{ A8Rss.pool()
+  def pool(self):
+    # One connection pool shared by all polls, so feeds sharing a host reuse
+    # its connections
+    #
+    try:
+      return url.HttpConnectionPool(
+        size=config.A8_HTTP_POOL_SIZE,
+        idle_timeout=config.A8_HTTP_POOL_IDLE_TIMEOUT
+      )
+    except url.UrlRequestError as ex:
+      die(f"HttpConnectionPool constructor failed: {ex}")
+  ## }}}
+
+  ## {{{ A8Rss.poller()
+  def poller(self, pool):
+    try:
+      return rss.RssPoller(
+        self.dbd,
+        workers=config.A8_POLL_WORKERS,
+        host_workers=config.A8_POLL_HOST_WORKERS,
+        timeout=config.A8_POLL_TIMEOUT,
+        stream_threshold=config.A8_POLL_STREAM_THRESHOLD,
+        parser=config.A8_RSS_PARSER,
+        parse_workers=config.A8_POLL_PARSE_WORKERS,
+        pool=pool,
+        batch_size=config.A8_POLL_BATCH_SIZE,
+        batch_interval=config.A8_POLL_BATCH_INTERVAL,
+        cache_compression=config.A8_CACHE_COMPRESSION,
+        dedup=config.A8_DEDUP,
+        dedup_threshold=config.A8_DEDUP_THRESHOLD,
+        dedup_window=config.A8_DEDUP_WINDOW,
+        metrics=self.metrics()
+      )
+    except rss.RssFeedError as ex:
+      die(f"RssPoller constructor failed: {ex}")
+  ## }}}
+
+  ## {{{ A8Rss.metrics()
+  def metrics(self):
+    # Poll metrics are only recorded if there's somewhere to write them to
+    if config.A8_METRICS_FILE is None:
+      return None
+
+    try:
+      return Metrics(config.A8_METRICS_FILE, config.A8_METRICS_FORMAT)
+    except MetricsError as ex:
+      die(f"Metrics constructor failed: {ex}")
+  ## }}}
+
+  ## {{{ A8Rss.usage()
+  def usage(self, short=False):
+    perr(f'Usage: {self.prog} [options]')
+
+    if not short:
+      perr('\nOptions:\n')
+      perr('  -h, --help     Print usage instructions')
+      perr('  -v, --verbose  Print information messages to console')
+      perr('                 (given twice, e.g. -vv, debug messages too)')
+      perr('  -q, --quiet    Print only warnings/errors to console (default)')
+
+    exit(1)
+  ## }}}
+
+## clas A8Rss }}}
+
+##
+# vim: ts=2 sw=2 tw=100 et fdm=marker :
+##
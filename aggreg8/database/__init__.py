@@ -31,6 +31,8 @@
 ## }}} ---- [ Header ] -----------------------------------------------------------------------------
 
 from .main import *
+from .pool import *
+from .schema import *
 from .errors import *
 
 ##
@@ -32,10 +32,27 @@
 
 import os
 
+import time
+
 import sqlite3
 
+from ..metrics import NULL_METRICS
+
 from .errors import DatabaseError
 
+## {{{ ---- [ Constants ] --------------------------------------------------------------------------
+
+# Default number of queued rows a WriteBatch flushes at
+DEFAULT_BATCH_SIZE = 1000
+
+# Default age (in seconds) of its oldest queued row a WriteBatch flushes at
+DEFAULT_BATCH_INTERVAL = 1.0
+
+# Default number of prepared statements cached per SQLite connection
+DEFAULT_CACHED_STATEMENTS = 128
+
+## }}} ---- [ Constants ] --------------------------------------------------------------------------
+
 ## {{{ ---- [ Functions ] --------------------------------------------------------------------------
 
 ## {{{ factory()
@@ -64,27 +81,72 @@ class Database:
 
 class SqliteDatabase(Database):
 
-  def connect(self, path):
-    # Create database file if it doesn't exist
-    fd = os.open(path, os.O_RDONLY | os.O_CREAT, 0o600)
-    os.close(fd)
+  # Whether the connection is read-only
+  readonly = False
 
-    # Ensure the file mode is secore, zeroing group/other mode bits
-    #
-    # FIXME: this should be configurable
+  def connect(self, path, pragmas=None, cached_statements=DEFAULT_CACHED_STATEMENTS, readonly=False,
+      check_same_thread=True):
+    self.readonly = readonly
+
+    # Read-only connections are opened through a mode=ro URI, which never
+    # creates the file
     #
-    os.chmod(path, 0o600)
+    if readonly:
+      import urllib.parse
+      path = f'file:{urllib.parse.quote(os.path.abspath(path))}?mode=ro'
+    else:
+      # Create database file if it doesn't exist
+      fd = os.open(path, os.O_RDONLY | os.O_CREAT, 0o600)
+      os.close(fd)
+
+      # Ensure the file mode is secore, zeroing group/other mode bits
+      #
+      # FIXME: this should be configurable
+      #
+      os.chmod(path, 0o600)
 
     # Open the database file
     #
     try:
-      self._con = sqlite3.connect(path)
+      self._con = sqlite3.connect(path, cached_statements=cached_statements, uri=readonly,
+        check_same_thread=check_same_thread)
     except sqlite3.DatabaseError as ex:
       raise DatabaseError(ex, f'{path}: sqlite3.connect() failed')
 
+    # Apply pragmas (see A8_SQLITE_PRAGMAS), in order; the journal mode is a
+    # property of the database file, which read-only connections can't change
+    #
+    if pragmas is not None:
+      for name, value in pragmas.items():
+        if readonly and name == 'journal_mode':
+          continue
+        self.pragma(name, value)
+
     # Finally, set the connection's row factory
     self._con.row_factory = sqlite3.Row
 
+  def pragma(self, name, value=None):
+    # Pragma names/values can't be bound as parameters, so only accept names
+    # that are identifiers and values that are numbers or identifiers
+    #
+    if not name.isidentifier():
+      raise DatabaseError(None, f"invalid pragma name '{name}'")
+    if value is not None and not isinstance(value, int) and not str(value).isidentifier():
+      raise DatabaseError(None, f"invalid value for pragma '{name}': {value}")
+
+    if value is None:
+      sql = f'PRAGMA {name}'
+    else:
+      sql = f'PRAGMA {name}={value}'
+
+    # Some pragmas (e.g. journal_mode) return the resulting setting
+    try:
+      row = self._con.execute(sql).fetchone()
+    except sqlite3.DatabaseError as ex:
+      raise DatabaseError(ex, f'{sql} failed')
+
+    return None if row is None else row[0]
+
   def cursor(self):
     try:
       return self._con.cursor()
@@ -104,16 +166,33 @@ class SqliteDatabase(Database):
       raise DatabaseError(ex, f'sqlite3.Connection.rollback() failed')
 
   def close(self):
-    # Automatically commit on close
+    # Automatically commit on close; the connection is closed even if that
+    # fails
     try:
-      self._con.commit()
-    except sqlite3.DatabaseError as ex:
-      raise DatabaseError(ex, f'sqlite3.Connection.commit() failed')
-
+      try:
+        self._con.commit()
+      except sqlite3.DatabaseError as ex:
+        raise DatabaseError(ex, f'sqlite3.Connection.commit() failed')
+
+      # Let SQLite refresh the query planner statistics it deems stale; this
+      # is cheap, only analysing tables queries run on this connection would
+      # have benefitted from
+      #
+      if not self.readonly:
+        self.pragma('optimize')
+    finally:
+      try:
+        self._con.close()
+      except sqlite3.DatabaseError as ex:
+        raise DatabaseError(ex, f'sqlite3.Connection.close() failed')
+
+  def ping(self):
+    # Check the connection is usable, returning False if not
     try:
-      self._con.close()
-    except sqlite3.DatabaseError as ex:
-      raise DatabaseError(ex, f'sqlite3.Connection.close() failed')
+      self._con.execute('SELECT 1').fetchone()
+    except sqlite3.Error:
+      return False
+    return True
 
   def execute(self, sql, parameters=None):
     try:
@@ -141,23 +220,168 @@ class SqliteDatabase(Database):
 
 ## class SqliteDatabase }}}
 
+## {{{ class WriteBatch
+
+class WriteBatch:
+
+  """Queue of writes flushed to a database in a single transaction"""
+
+  # Database driver object implementing aggreg8.database.Database
+  dbd = None
+
+  # Number of queued rows and age (in seconds) of the oldest one to flush at
+  size = None
+  interval = None
+
+  # Statements the batch accepts, in the order they're run on flush, or None
+  # to run them in the order they were queued in
+  order = None
+
+  # Queued (statement, parameter rows) runs
+  _queue = None
+
+  # Metrics object (aggreg8.metrics.Metrics) flushes are timed on
+  metrics = None
+
+  # Number of rows queued, and time.monotonic() when the first one was
+  _count = None
+  _started = None
+
+  ## {{{ WriteBatch.__init__()
+  def __init__(self, dbd, size=DEFAULT_BATCH_SIZE, interval=DEFAULT_BATCH_INTERVAL,
+      metrics=NULL_METRICS, order=None):
+    if size < 1:
+      raise DatabaseError(None, f"invalid write batch size '{size}'")
+
+    self.dbd = dbd
+    self.size = size
+    self.interval = interval
+    self.metrics = metrics
+
+    if order is not None:
+      self.order = {sql: index for index, sql in enumerate(order)}
+
+    self._reset()
+  ## }}}
+
+  def __len__(self):
+    return self._count
+
+  ## {{{ WriteBatch._reset()
+  def _reset(self):
+    # Statements of a fixed order each get a single run, set up front
+    if self.order is None:
+      self._queue = []
+    else:
+      self._queue = [(sql, []) for sql in self.order]
+    self._count = 0
+  ## }}}
+
+  ## {{{ WriteBatch.execute()
+  def execute(self, sql, parameters=()):
+    self.executemany(sql, [parameters])
+  ## }}}
+
+  ## {{{ WriteBatch.executemany()
+  def executemany(self, sql, parameters):
+    # Queue rows for sql. Without a fixed order, consecutive rows of the same
+    # statement are run together (through executemany()) and runs are
+    # replayed in the order they were queued in, so rows only ever follow
+    # those they depend on; with one, all rows of a statement are run
+    # together, statements running in the given order, and queueing any
+    # other statement is an error
+    #
+    if self.order is not None:
+      index = self.order.get(sql)
+      if index is None:
+        raise DatabaseError(None, f'statement not in write batch order: {sql}')
+      rows = self._queue[index][1]
+    elif len(self._queue) > 0 and self._queue[-1][0] == sql:
+      rows = self._queue[-1][1]
+    else:
+      rows = []
+      self._queue.append((sql, rows))
+
+    n = len(rows)
+    rows.extend(parameters)
+    if len(rows) == n:
+      return
+
+    if self._count == 0:
+      self._started = time.monotonic()
+    self._count += len(rows) - n
+
+    if self._count >= self.size or time.monotonic() - self._started >= self.interval:
+      self.flush()
+  ## }}}
+
+  ## {{{ WriteBatch.flush()
+  def flush(self):
+    if self._count == 0:
+      return 0
+
+    queue, count = self._queue, self._count
+    self._reset()
+
+    start = self.metrics.clock()
+
+    # Either all of the queued writes make it or none do
+    try:
+      for sql, rows in queue:
+        if len(rows) > 0:
+          self.dbd.executemany(sql, rows)
+    except DatabaseError:
+      self.dbd.rollback()
+      raise
+
+    self.dbd.commit()
+
+    self.metrics.time('db_write', start)
+
+    return count
+  ## }}}
+
+## class WriteBatch }}}
+
 ## {{{ class SqlStatement
 
 class SqlStatement():
 
-  _sql = None
-  _sep = None
+  """Immutable SQL statement, built once per distinct set of tokens"""
+
+  # Statement strings are joined once, on creation, and statements are
+  # interned so building the same one again is a dict lookup; being reused
+  # as the exact same string also gets them the prepared statement kept in
+  # sqlite3's per-connection statement cache (see cached_statements)
+  #
+  __slots__ = ('_sql',)
 
-  def __init__(self, *args, sep=' '):
-    self._sep = sep
-    self._sql = []
-    for arg in args:
-      self._sql.append(arg)
+  # Interned statements, keyed by (tokens, separator)
+  _interned = {}
+
+  ## {{{ SqlStatement.__new__()
+  def __new__(cls, *args, sep=' '):
+    key = (args, sep)
+
+    statement = cls._interned.get(key)
+    if statement is None:
+      statement = super().__new__(cls)
+      object.__setattr__(statement, '_sql', sep.join(args))
+      statement = cls._interned.setdefault(key, statement)
+
+    return statement
+  ## }}}
+
+  def __setattr__(self, name, value):
+    raise AttributeError(f"'{type(self).__name__}' object is immutable")
 
   def __str__(self):
-    return self._sep.join(self._sql)
+    return self._sql
 
-## class SqliteDatabase }}}
+  def __repr__(self):
+    return f'SqlStatement({self._sql!r})'
+
+## class SqlStatement }}}
 
 ## }}} ---- [ Classes ] ----------------------------------------------------------------------------
 
@@ -0,0 +1,235 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+##
+# aggreg8.git:aggreg8/database/pool.py
+##
+
+## {{{ ---- [ Header ] -----------------------------------------------------------------------------
+
+##
+# Copyright (c) 2021 Francis M <francism@destinatech.com>
+#
+# This program is free software; you can redistribute it and/or modify it under
+# the terms of the GNU General Public License version 2.0 as published by the
+# Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE.  See the GNU General Public License for more
+# details.
+#
+# You should have received a copy of the GNU General Public License along with
+# this program; if not, write to:
+#
+#   Free Software Foundation
+#   51 Franklin Street, Fifth Floor
+#   Boston, MA 02110
+#   USA
+##
+
+## }}} ---- [ Header ] -----------------------------------------------------------------------------
+
+## {{{ ---- [ Imports ] ----------------------------------------------------------------------------
+
+import time
+
+import threading
+
+import contextlib
+
+from .errors import DatabaseError
+
+from .main import DEFAULT_CACHED_STATEMENTS, SqliteDatabase
+
+## }}} ---- [ Imports ] ----------------------------------------------------------------------------
+
+## {{{ ---- [ Constants ] --------------------------------------------------------------------------
+
+# Default maximum number of read-only connections
+DEFAULT_POOL_READERS = 4
+
+# Default number of seconds to wait for a read-only connection to free up
+DEFAULT_POOL_TIMEOUT = 30
+
+## }}} ---- [ Constants ] --------------------------------------------------------------------------
+
+## {{{ ---- [ Classes ] ----------------------------------------------------------------------------
+
+## {{{ class SqliteConnectionPool
+
+class SqliteConnectionPool:
+
+  """Pool of one writer and several read-only connections to an SQLite database"""
+
+  # Path to the database file, and the pragmas/statement cache size every
+  # connection is opened with (see SqliteDatabase.connect())
+  path = None
+  pragmas = None
+  cached_statements = None
+
+  # Maximum number of read-only connections
+  readers = None
+
+  # Number of seconds reader() waits for a read-only connection to free up
+  timeout = None
+
+  # Writer connection, and the lock serialising its users
+  _writer = None
+  _writer_lock = None
+
+  # Idle read-only connections, and the number open (idle or not)
+  _idle = None
+  _open = None
+
+  _cond = None
+
+  ## {{{ SqliteConnectionPool.__init__()
+  def __init__(self, path, readers=DEFAULT_POOL_READERS, pragmas=None,
+      cached_statements=DEFAULT_CACHED_STATEMENTS, timeout=DEFAULT_POOL_TIMEOUT):
+    if readers < 1:
+      raise DatabaseError(None, f"invalid number of pool readers '{readers}'")
+
+    self.path = path
+    self.pragmas = pragmas
+    self.cached_statements = cached_statements
+    self.readers = readers
+    self.timeout = timeout
+
+    # Connections are handed between threads, though only ever used by one
+    # at a time
+    #
+    self._writer = self._connect(readonly=False)
+    self._writer_lock = threading.Lock()
+
+    self._idle = []
+    self._open = 0
+    self._cond = threading.Condition()
+  ## }}}
+
+  ## {{{ SqliteConnectionPool.writer()
+  @contextlib.contextmanager
+  def writer(self):
+    # Check out the writer connection, committing on success and rolling back
+    # on error; other threads wanting to write wait their turn
+    #
+    with self._writer_lock:
+      if not self._writer.ping():
+        self._discard(self._writer)
+        self._writer = self._connect(readonly=False)
+
+      try:
+        yield self._writer
+      except BaseException:
+        self._writer.rollback()
+        raise
+
+      self._writer.commit()
+  ## }}}
+
+  ## {{{ SqliteConnectionPool.reader()
+  @contextlib.contextmanager
+  def reader(self, timeout=None):
+    # Check out a read-only connection, opening a new one if none are idle
+    # and there's room for it, or waiting up to timeout seconds for one to be
+    # checked back in otherwise
+    #
+    dbd = self._checkout(self.timeout if timeout is None else timeout)
+
+    try:
+      yield dbd
+    finally:
+      self._checkin(dbd)
+  ## }}}
+
+  ## {{{ SqliteConnectionPool.close()
+  def close(self):
+    with self._cond:
+      idle, self._idle = self._idle, []
+      self._open -= len(idle)
+
+    for dbd in idle:
+      dbd.close()
+
+    with self._writer_lock:
+      self._writer.close()
+  ## }}}
+
+  ## {{{ SqliteConnectionPool._connect()
+  def _connect(self, readonly):
+    dbd = SqliteDatabase()
+    dbd.connect(self.path, self.pragmas, self.cached_statements, readonly=readonly,
+      check_same_thread=False)
+    return dbd
+  ## }}}
+
+  ## {{{ SqliteConnectionPool._checkout()
+  def _checkout(self, timeout):
+    deadline = time.monotonic() + timeout
+
+    with self._cond:
+      while len(self._idle) < 1 and self._open >= self.readers:
+        remaining = deadline - time.monotonic()
+        if remaining <= 0 or not self._cond.wait(remaining):
+          raise DatabaseError(None, f'{self.path}: timed out waiting for a read-only connection')
+
+      if len(self._idle) > 0:
+        dbd = self._idle.pop()
+      else:
+        dbd = None
+        self._open += 1
+
+    # Connections are opened/checked outside the lock; a connection failing
+    # its health check is replaced
+    #
+    try:
+      if dbd is not None and not dbd.ping():
+        self._discard(dbd)
+        dbd = None
+      if dbd is None:
+        dbd = self._connect(readonly=True)
+    except DatabaseError:
+      with self._cond:
+        self._open -= 1
+        self._cond.notify()
+      raise
+
+    return dbd
+  ## }}}
+
+  ## {{{ SqliteConnectionPool._discard()
+  def _discard(self, dbd):
+    # Close a connection that's being replaced, which being broken is likely
+    # to fail in some way or other
+    try:
+      dbd.close()
+    except DatabaseError:
+      pass
+  ## }}}
+
+  ## {{{ SqliteConnectionPool._checkin()
+  def _checkin(self, dbd):
+    # End any read transaction left open, so the connection doesn't hold on
+    # to an old snapshot of the database (and stop WAL checkpoints) while idle
+    #
+    try:
+      dbd.rollback()
+    except DatabaseError:
+      self._discard(dbd)
+      dbd = None
+
+    with self._cond:
+      if dbd is None:
+        self._open -= 1
+      else:
+        self._idle.append(dbd)
+      self._cond.notify()
+  ## }}}
+
+## class SqliteConnectionPool }}}
+
+## }}} ---- [ Classes ] ----------------------------------------------------------------------------
+
+##
+# vim: ts=2 sw=2 tw=100 et fdm=marker :
+##
@@ -0,0 +1,107 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+##
+# aggreg8.git:aggreg8/database/schema.py
+##
+
+## {{{ ---- [ Header ] -----------------------------------------------------------------------------
+
+##
+# Copyright (c) 2021 Francis M <francism@destinatech.com>
+#
+# This program is free software; you can redistribute it and/or modify it under
+# the terms of the GNU General Public License version 2.0 as published by the
+# Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE.  See the GNU General Public License for more
+# details.
+#
+# You should have received a copy of the GNU General Public License along with
+# this program; if not, write to:
+#
+#   Free Software Foundation
+#   51 Franklin Street, Fifth Floor
+#   Boston, MA 02110
+#   USA
+##
+
+## }}} ---- [ Header ] -----------------------------------------------------------------------------
+
+## {{{ ---- [ Imports ] ----------------------------------------------------------------------------
+
+from .errors import DatabaseError
+
+## }}} ---- [ Imports ] ----------------------------------------------------------------------------
+
+## {{{ ---- [ Constants ] --------------------------------------------------------------------------
+
+# Schema version data/init.sql creates, as recorded in PRAGMA user_version
+SCHEMA_VERSION = 1
+
+## Statements bringing a database from the schema version they're keyed by to
+# the next, data/init.sql then creating whatever else is missing (new tables,
+# indexes and triggers):
+#
+#   0 = the original schema: rss_feeds has no next_due (its now unused entries
+#       column is left be), and rss_feed_cache holds feed bodies inline with
+#       no validators; being just a cache, it's dropped and refilled by the
+#       next poll
+#
+MIGRATIONS = {
+  0: [
+    'ALTER TABLE rss_feeds ADD COLUMN next_due INTEGER NOT NULL DEFAULT 0',
+    'DROP TABLE IF EXISTS rss_feed_cache',
+  ],
+}
+
+## }}} ---- [ Constants ] --------------------------------------------------------------------------
+
+## {{{ ---- [ Functions ] --------------------------------------------------------------------------
+
+## {{{ migrate()
+def migrate(dbd, init_path):
+  # Bring the database up to SCHEMA_VERSION, in a single transaction, given
+  # the path to data/init.sql; returns the version it was at
+  version = dbd.pragma('user_version')
+  if version == SCHEMA_VERSION:
+    return version
+  elif version > SCHEMA_VERSION:
+    raise DatabaseError(None,
+      f'database schema version {version} is newer than supported ({SCHEMA_VERSION})')
+
+  try:
+    with open(init_path, encoding='utf-8') as fp:
+      init = fp.read()
+  except OSError as ex:
+    raise DatabaseError(ex, f'{init_path}: {ex.strerror}')
+
+  # A database that was never initialised has nothing to migrate
+  steps = range(version, SCHEMA_VERSION)
+  sql = "SELECT name FROM sqlite_master WHERE type='table' AND name='rss_feeds'"
+  if dbd.execute(sql).fetchone() is None:
+    steps = []
+
+  script = ['BEGIN;']
+  for step in steps:
+    script.extend(f'{sql};' for sql in MIGRATIONS[step])
+  script.append(init)
+  script.append(f'PRAGMA user_version={SCHEMA_VERSION};')
+  script.append('COMMIT;')
+
+  try:
+    dbd.executescript('\n'.join(script))
+  except DatabaseError:
+    dbd.rollback()
+    raise
+
+  return version
+## }}}
+
+## }}} ---- [ Functions ] --------------------------------------------------------------------------
+
+##
+# vim: ts=2 sw=2 tw=100 et fdm=marker :
+##
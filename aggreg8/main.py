@@ -39,9 +39,14 @@ import atexit
 
 import collections
 
+import importlib
+
 # Program filename
 PROG_NAME = os.path.basename(sys.argv[0])
 
+# Whether debug() prints anything, see enable_debug()
+_debug = False
+
 ## {{{ ---- [ Functions ] --------------------------------------------------------------------------
 
 ## {{{ func_name()
@@ -59,8 +64,19 @@ def perr(s, end='\n', flush=True):
   print(s, file=sys.stderr, end=end, flush=flush)
 ## }}}
 
+## {{{ enable_debug()
+def enable_debug(enabled=True):
+  global _debug
+  _debug = enabled
+## }}}
+
 ## {{{ debug()
 def debug(message):
+  # Return straight away unless enabled, so calls can be left in hot paths:
+  # the caller's frame is only looked up for messages actually printed
+  #
+  if not _debug:
+    return
   perr(f'{PROG_NAME}: debug: {func_name(2)}: {message}')
 ## }}}
 
@@ -101,6 +117,31 @@ def time_now():
   return int(time.time())
 ## }}}
 
+## {{{ lazy_getattr()
+def lazy_getattr(package, namespace, submodules):
+  # Return a module __getattr__() for package, whose namespace is passed
+  # in, that imports the given submodules in order until one of them
+  # defines the missing name. Each submodule imported has its public names
+  # copied into the package, just as "from .submodule import *" would have
+  # done, so later lookups don't come back here; this keeps the heavy
+  # dependencies of rarely used submodules out of every command's startup
+  #
+  def __getattr__(name):
+    for submodule in submodules:
+      module = importlib.import_module(f'.{submodule}', package)
+
+      for key, value in vars(module).items():
+        if not key.startswith('_'):
+          namespace.setdefault(key, value)
+
+      if name in namespace:
+        return namespace[name]
+
+    raise AttributeError(f"module '{package}' has no attribute '{name}'")
+
+  return __getattr__
+## }}}
+
 ## }}} ---- [ Functions ] --------------------------------------------------------------------------
 
 ## {{{ ---- [ Classes ] ----------------------------------------------------------------------------
@@ -125,11 +166,22 @@ class A8Base:
   verbose = None
   quiet = None
 
+  # Command name, if run in-process by bin/a8 rather than exec()ed as
+  # bin/a8-<command>, and the program name used in usage instructions
+  command = None
+  prog = None
+
   ## {{{ A8Base.__init__()
-  def __init__(self, argv=sys.argv):
+  def __init__(self, argv=sys.argv, command=None):
     # Duplicate argv
     self.argv = argv[:]
 
+    self.command = command
+    if command is None:
+      self.prog = PROG_NAME
+    else:
+      self.prog = f'{PROG_NAME} {command}'
+
     # Set a restricted umask nice and early
     os.umask(0o077)
 
@@ -151,8 +203,13 @@ class A8Base:
     while len(argv) > 0:
       arg = argv.pop(0)
       if arg.startswith('-'):
-        # Option argument
-        opts.append(arg)
+        # Option argument; combined short options (e.g. -vv) are split up,
+        # none of them taking a value
+        #
+        if len(arg) > 2 and not arg.startswith('--'):
+          opts.extend(f'-{opt}' for opt in arg[1:])
+        else:
+          opts.append(arg)
         continue
 
       # Non-option argument
@@ -164,6 +221,12 @@ class A8Base:
 
   ## {{{ A8Base.check_env()
   def check_env(self):
+    # Commands run in-process were handed their name by bin/a8 itself, and
+    # share its environment: there's nothing to check
+    #
+    if self.command is not None:
+      return
+
     if 'A8_INSTANCE_DIR' not in os.environ.keys():
       die_internal('A8_INSTANCE_DIR has not been set in environment')
     elif not os.path.isfile(f"{os.environ['A8_INSTANCE_DIR']}/bin/a8"):
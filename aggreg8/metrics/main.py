@@ -0,0 +1,375 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+##
+# aggreg8.git:aggreg8/metrics/main.py
+##
+
+## {{{ ---- [ Header ] -----------------------------------------------------------------------------
+
+##
+# Copyright (c) 2021 Francis M <francism@destinatech.com>
+#
+# This program is free software; you can redistribute it and/or modify it under
+# the terms of the GNU General Public License version 2.0 as published by the
+# Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE.  See the GNU General Public License for more
+# details.
+#
+# You should have received a copy of the GNU General Public License along with
+# this program; if not, write to:
+#
+#   Free Software Foundation
+#   51 Franklin Street, Fifth Floor
+#   Boston, MA 02110
+#   USA
+##
+
+## }}} ---- [ Header ] -----------------------------------------------------------------------------
+
+## {{{ ---- [ Imports ] ----------------------------------------------------------------------------
+
+import os
+
+import time
+
+import threading
+
+from .errors import MetricsError
+
+## }}} ---- [ Imports ] ----------------------------------------------------------------------------
+
+## {{{ ---- [ Constants ] --------------------------------------------------------------------------
+
+# Poll stages timed, in the order they happen:
+#
+#   connect    = DNS lookup, TCP connect and TLS handshake of new connections
+#   ttfb       = request sent until the response headers are in
+#   download   = reading the body off the connection
+#   decompress = undoing its Content-Encoding
+#   hash       = hashing it (content_hash)
+#   parse      = parsing it into entries
+#   serialize  = compressing the cached copy and building entry rows
+#   db_write   = write batches being committed
+#
+METRICS_STAGES = ('connect', 'ttfb', 'download', 'decompress', 'hash', 'parse', 'serialize',
+  'db_write')
+
+# Poll counters, and what they count
+METRICS_COUNTERS = {
+  'fetched': 'Feeds downloaded (HTTP 200)',
+  'not_modified': 'Feeds the server reported unchanged (HTTP 304)',
+  'cache_hits': 'Feeds downloaded, but identical to their cached copy',
+  'errors': 'Feeds that failed to fetch or parse',
+  'bytes_received': 'Body bytes received, before decompression',
+  'bytes_decoded': 'Body bytes after decompression',
+}
+
+# Formats metrics can be written out in
+METRICS_FORMATS = ['prometheus', 'json']
+
+# Prefix of the Prometheus metric names
+PROMETHEUS_PREFIX = 'a8_poll'
+
+## }}} ---- [ Constants ] --------------------------------------------------------------------------
+
+## {{{ ---- [ Classes ] ----------------------------------------------------------------------------
+
+## {{{ class NullMetrics
+
+class NullMetrics:
+
+  """Metrics sink recording nothing, used when metrics are disabled"""
+
+  # Instrumented code is written as:
+  #
+  #   start = metrics.clock()
+  #   ...
+  #   metrics.time('stage', start)
+  #
+  # so that, disabled, all it costs is a couple of calls to methods doing
+  # nothing: no clock reads, locking or frame introspection
+  #
+
+  ## {{{ NullMetrics.clock()
+  def clock(self):
+    return 0
+  ## }}}
+
+  ## {{{ NullMetrics.time()
+  def time(self, stage, start, exclude=0):
+    return 0
+  ## }}}
+
+  ## {{{ NullMetrics.add()
+  def add(self, stage, elapsed):
+    pass
+  ## }}}
+
+  ## {{{ NullMetrics.count()
+  def count(self, name, n=1):
+    pass
+  ## }}}
+
+  ## {{{ NullMetrics.elapsed()
+  def elapsed(self, *stages):
+    return 0
+  ## }}}
+
+  ## {{{ NullMetrics.feed()
+  def feed(self, name):
+    return self
+  ## }}}
+
+  ## {{{ NullMetrics.write()
+  def write(self):
+    pass
+  ## }}}
+
+## class NullMetrics }}}
+
+## {{{ class Metrics
+
+class Metrics(NullMetrics):
+
+  """Per-stage (and per-feed) timers and counters of feed polls"""
+
+  # File metrics are written to by write(), if any, and its format (see
+  # METRICS_FORMATS)
+  path = None
+  format = None
+
+  # Stage timers, as [calls, seconds, max seconds] lists keyed by stage;
+  # counters keyed by name; per-feed stage seconds, keyed by feed name then
+  # stage
+  _timers = None
+  _counters = None
+  _feeds = None
+
+  # Per-feed views (see feed()), keyed by feed name
+  _views = None
+
+  # Lock serialising updates from fetch threads
+  _lock = None
+
+  ## {{{ Metrics.__init__()
+  def __init__(self, path=None, format='prometheus'):
+    if format not in METRICS_FORMATS:
+      raise MetricsError(f"invalid metrics format '{format}'")
+
+    self.path = path
+    self.format = format
+
+    self._timers = {stage: [0, 0.0, 0.0] for stage in METRICS_STAGES}
+    self._counters = {name: 0 for name in METRICS_COUNTERS}
+    self._feeds = {}
+    self._views = {}
+
+    self._lock = threading.Lock()
+  ## }}}
+
+  ## {{{ Metrics.clock()
+  def clock(self):
+    return time.perf_counter()
+  ## }}}
+
+  ## {{{ Metrics.time()
+  def time(self, stage, start, exclude=0):
+    # Record the time since start (as returned by clock()) against stage,
+    # less exclude seconds spent in other stages meanwhile
+    elapsed = time.perf_counter() - start - exclude
+    self.add(stage, elapsed)
+    return elapsed
+  ## }}}
+
+  ## {{{ Metrics.add()
+  def add(self, stage, elapsed, feed=None):
+    with self._lock:
+      timer = self._timers.setdefault(stage, [0, 0.0, 0.0])
+      timer[0] += 1
+      timer[1] += elapsed
+      timer[2] = max(timer[2], elapsed)
+
+      if feed is not None:
+        stages = self._feeds.setdefault(feed, {})
+        stages[stage] = stages.get(stage, 0.0) + elapsed
+  ## }}}
+
+  ## {{{ Metrics.count()
+  def count(self, name, n=1):
+    with self._lock:
+      self._counters[name] = self._counters.get(name, 0) + n
+  ## }}}
+
+  ## {{{ Metrics.elapsed()
+  def elapsed(self, *stages):
+    # Total seconds recorded against the given stages so far
+    with self._lock:
+      return sum(self._timers[stage][1] for stage in stages if stage in self._timers)
+  ## }}}
+
+  ## {{{ Metrics.feed()
+  def feed(self, name):
+    # Views are kept, so that stage times recorded on a feed's view (e.g. in
+    # a fetch thread) show in elapsed() of any other taken of it later
+    with self._lock:
+      view = self._views.get(name)
+      if view is None:
+        view = self._views[name] = FeedMetrics(self, name)
+      return view
+  ## }}}
+
+  ## {{{ Metrics.summary()
+  def summary(self):
+    # Everything recorded so far, as a JSON-serialisable dict
+    with self._lock:
+      return {
+        'stages': {
+          stage: {
+            'calls': calls,
+            'seconds': seconds,
+            'max_seconds': max_seconds,
+            'mean_seconds': seconds / calls if calls > 0 else 0.0,
+          }
+          for stage, (calls, seconds, max_seconds) in self._timers.items()
+        },
+        'counters': dict(self._counters),
+        'feeds': {feed: dict(stages) for feed, stages in self._feeds.items()},
+      }
+  ## }}}
+
+  ## {{{ Metrics.prometheus()
+  def prometheus(self):
+    # Everything recorded so far, in the Prometheus text exposition format
+    summary = self.summary()
+    lines = []
+
+    def metric(name, type, help, samples):
+      lines.append(f'# HELP {PROMETHEUS_PREFIX}_{name} {help}')
+      lines.append(f'# TYPE {PROMETHEUS_PREFIX}_{name} {type}')
+      for labels, value in samples:
+        lines.append(f'{PROMETHEUS_PREFIX}_{name}{labels} {value}')
+
+    stages = summary['stages'].items()
+    metric('stage_seconds_total', 'counter', 'Time spent in each poll stage',
+      [(f'{{stage="{stage}"}}', timer['seconds']) for stage, timer in stages])
+    metric('stage_calls_total', 'counter', 'Number of times each poll stage was timed',
+      [(f'{{stage="{stage}"}}', timer['calls']) for stage, timer in stages])
+    metric('stage_max_seconds', 'gauge', 'Longest single time spent in each poll stage',
+      [(f'{{stage="{stage}"}}', timer['max_seconds']) for stage, timer in stages])
+
+    for name, value in summary['counters'].items():
+      metric(f'{name}_total', 'counter', METRICS_COUNTERS.get(name, name), [('', value)])
+
+    # Feed names are restricted to characters needing no escaping
+    metric('feed_stage_seconds_total', 'counter', 'Time spent in each poll stage, by feed',
+      [(f'{{feed="{feed}",stage="{stage}"}}', seconds)
+        for feed, stages in summary['feeds'].items() for stage, seconds in stages.items()])
+
+    return '\n'.join(lines) + '\n'
+  ## }}}
+
+  ## {{{ Metrics.write()
+  def write(self):
+    # Write everything recorded so far to self.path, if set; the file is
+    # replaced atomically so collectors (e.g. node_exporter's textfile
+    # collector) never see it half-written
+    #
+    if self.path is None:
+      return
+
+    if self.format == 'json':
+      import json
+      data = json.dumps(self.summary(), indent=2, sort_keys=True) + '\n'
+    else:
+      data = self.prometheus()
+
+    tmp = f'{self.path}.{os.getpid()}.tmp'
+    try:
+      with open(tmp, 'w', encoding='utf-8') as fp:
+        fp.write(data)
+      os.replace(tmp, self.path)
+    except OSError as ex:
+      raise MetricsError(f'{self.path}: failed to write metrics: {ex.strerror}')
+  ## }}}
+
+## class Metrics }}}
+
+## {{{ class FeedMetrics
+
+class FeedMetrics(NullMetrics):
+
+  """View of a Metrics object recording stage times against one feed too"""
+
+  # Metrics object recorded to, and name of the feed
+  metrics = None
+  name = None
+
+  # Seconds recorded against each stage through this view
+  _elapsed = None
+
+  ## {{{ FeedMetrics.__init__()
+  def __init__(self, metrics, name):
+    self.metrics = metrics
+    self.name = name
+
+    self._elapsed = {}
+  ## }}}
+
+  ## {{{ FeedMetrics.clock()
+  def clock(self):
+    return time.perf_counter()
+  ## }}}
+
+  ## {{{ FeedMetrics.time()
+  def time(self, stage, start, exclude=0):
+    elapsed = time.perf_counter() - start - exclude
+    self.add(stage, elapsed)
+    return elapsed
+  ## }}}
+
+  ## {{{ FeedMetrics.add()
+  def add(self, stage, elapsed):
+    self._elapsed[stage] = self._elapsed.get(stage, 0.0) + elapsed
+    self.metrics.add(stage, elapsed, self.name)
+  ## }}}
+
+  ## {{{ FeedMetrics.count()
+  def count(self, name, n=1):
+    self.metrics.count(name, n)
+  ## }}}
+
+  ## {{{ FeedMetrics.elapsed()
+  def elapsed(self, *stages):
+    # Unlike Metrics.elapsed(), only counts time recorded for this feed, and
+    # so isn't skewed by other feeds being fetched concurrently
+    return sum(self._elapsed.get(stage, 0.0) for stage in stages)
+  ## }}}
+
+  ## {{{ FeedMetrics.feed()
+  def feed(self, name):
+    return self.metrics.feed(name)
+  ## }}}
+
+  ## {{{ FeedMetrics.write()
+  def write(self):
+    self.metrics.write()
+  ## }}}
+
+## class FeedMetrics }}}
+
+## }}} ---- [ Classes ] ----------------------------------------------------------------------------
+
+## {{{ ---- [ Globals ] ----------------------------------------------------------------------------
+
+# Shared sink used wherever no Metrics object was given
+NULL_METRICS = NullMetrics()
+
+## }}} ---- [ Globals ] ----------------------------------------------------------------------------
+
+##
+# vim: ts=2 sw=2 tw=100 et fdm=marker :
+##
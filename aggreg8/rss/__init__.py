@@ -30,9 +30,25 @@
 
 ## }}} ---- [ Header ] -----------------------------------------------------------------------------
 
+from .. import lazy_getattr
+
 from .main import *
 from .errors import *
 
+# Everything else is imported on first use, feedparser and the HTTP stack in
+# particular aren't needed to list or add feeds
+#
+__getattr__ = lazy_getattr(__name__, globals(), [
+  'entries',
+  'bulk',
+  'cache',
+  'dedup',
+  'stream',
+  'parsers',
+  'poll',
+  'daemon',
+])
+
 ##
 # vim: ts=2 sw=2 tw=100 et fdm=marker :
 ##
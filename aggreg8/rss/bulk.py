@@ -0,0 +1,312 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+##
+# aggreg8.git:aggreg8/rss/bulk.py
+##
+
+## {{{ ---- [ Header ] -----------------------------------------------------------------------------
+
+##
+# Copyright (c) 2021 Francis M <francism@destinatech.com>
+#
+# This program is free software; you can redistribute it and/or modify it under
+# the terms of the GNU General Public License version 2.0 as published by the
+# Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE.  See the GNU General Public License for more
+# details.
+#
+# You should have received a copy of the GNU General Public License along with
+# this program; if not, write to:
+#
+#   Free Software Foundation
+#   51 Franklin Street, Fifth Floor
+#   Boston, MA 02110
+#   USA
+##
+
+## }}} ---- [ Header ] -----------------------------------------------------------------------------
+
+## {{{ ---- [ Imports ] ----------------------------------------------------------------------------
+
+import re
+
+import json
+
+import email.utils
+
+import urllib.parse
+
+import xml.etree.ElementTree as ElementTree
+
+from xml.sax.saxutils import quoteattr
+
+from .. import debug, warning
+
+from ..database import SqlStatement
+
+from .main import VALID_NAME_CHARS, VALID_PROPER_NAME_CHARS, validate_feed
+
+from .errors import RssFeedError
+
+## }}} ---- [ Imports ] ----------------------------------------------------------------------------
+
+## {{{ ---- [ Constants ] --------------------------------------------------------------------------
+
+# Supported import/export formats, keyed by the file extensions implying them
+FEED_FORMATS = {
+  'opml': 'opml',
+  'xml': 'opml',
+  'jsonl': 'jsonl',
+  'ndjson': 'jsonl',
+}
+
+# Runs of characters not allowed in feed names/proper names, replaced when
+# deriving them from the titles of OPML outlines
+_INVALID_NAME_RE = re.compile(f'[^{re.escape(VALID_NAME_CHARS)}]+')
+_INVALID_PROPER_NAME_RE = re.compile(f'[^{re.escape(VALID_PROPER_NAME_CHARS)}]+')
+
+## }}} ---- [ Constants ] --------------------------------------------------------------------------
+
+## {{{ ---- [ Statements ] -------------------------------------------------------------------------
+
+# Feeds whose name or URL already exists are skipped rather than aborting
+# the whole import (see import_feeds())
+#
+SQL_INSERT_FEEDS = SqlStatement(
+  'INSERT INTO',
+  'rss_feeds',
+  '(name, proper_name, url, date_added, last_updated)',
+  'VALUES(?, ?, ?, ?, ?)',
+  'ON CONFLICT DO NOTHING'
+)
+
+SQL_SELECT_FEED_URL = SqlStatement(
+  'SELECT',
+  'id',
+  'FROM',
+  'rss_feeds',
+  'WHERE',
+  'url=?'
+)
+
+SQL_SELECT_FEEDS = SqlStatement(
+  'SELECT',
+  'name, proper_name, url',
+  'FROM',
+  'rss_feeds',
+  'ORDER BY',
+  'id'
+)
+
+## }}} ---- [ Statements ] -------------------------------------------------------------------------
+
+## {{{ ---- [ Functions ] --------------------------------------------------------------------------
+
+## {{{ feed_format()
+def feed_format(path, format=None):
+  # Return the format of the feed list at path, as given or implied by its
+  # extension
+  if format is None:
+    format = FEED_FORMATS.get(path.rpartition('.')[2].lower())
+    if format is None:
+      raise RssFeedError("can't tell the format from the file extension")
+  elif format not in FEED_FORMATS.values():
+    raise RssFeedError(f"unsupported feed list format '{format}'")
+
+  return format
+## }}}
+
+## {{{ _outline_feed()
+def _outline_feed(elem):
+  # Return (name, proper_name, url) for an OPML outline; outlines we exported
+  # carry the feed name, others have one derived from their title
+  #
+  url = elem.get('xmlUrl')
+  title = elem.get('text') or elem.get('title') or ''
+
+  name = elem.get('name')
+  if name is None:
+    title = ' '.join(_INVALID_PROPER_NAME_RE.sub(' ', title).split())
+    name = _INVALID_NAME_RE.sub('-', title.lower()).strip('-_')
+    if not name:
+      name = _INVALID_NAME_RE.sub('-', urllib.parse.urlsplit(url).hostname or '')
+
+  return (name, title or name, url)
+## }}}
+
+## {{{ read_opml()
+def read_opml(fp):
+  # Yield (name, proper_name, url) for each feed outline of the OPML document
+  # read from the binary file object fp, nested (folder) outlines included;
+  # outlines are detached from the tree once read, so memory use doesn't
+  # grow with the size of the document
+  #
+  parents = []
+
+  try:
+    for event, elem in ElementTree.iterparse(fp, events=('start', 'end')):
+      if event == 'start':
+        if len(parents) == 0 and elem.tag != 'opml':
+          raise RssFeedError(f"unsupported feed list format '{elem.tag}'")
+
+        parents.append(elem)
+        continue
+
+      parents.pop()
+      if elem.tag != 'outline' or elem.get('xmlUrl') is None:
+        continue
+
+      feed = _outline_feed(elem)
+      if len(parents) > 0:
+        parents[-1].remove(elem)
+
+      yield feed
+  except ElementTree.ParseError as ex:
+    raise RssFeedError(f'failed to parse OPML: {ex}')
+## }}}
+
+## {{{ read_jsonl()
+def read_jsonl(fp):
+  # Yield (name, proper_name, url) for each line of the JSON Lines document
+  # read from fp, each an object with (at least) those keys
+  for lineno, line in enumerate(fp, 1):
+    if not line.strip():
+      continue
+
+    try:
+      feed = json.loads(line)
+      yield (feed['name'], feed['proper_name'], feed['url'])
+    except (ValueError, TypeError, KeyError) as ex:
+      raise RssFeedError(f'line {lineno}: invalid feed record: {ex!r}')
+## }}}
+
+## {{{ read_feeds()
+def read_feeds(fp, format):
+  if format == 'opml':
+    return read_opml(fp)
+  elif format == 'jsonl':
+    return read_jsonl(fp)
+  else:
+    raise RssFeedError(f"unsupported feed list format '{format}'")
+## }}}
+
+## {{{ write_opml()
+def write_opml(fp, feeds, now):
+  # Write feeds, an iterable of (name, proper_name, url) tuples, to the text
+  # file object fp as an OPML 2.0 document, one outline at a time
+  fp.write('<?xml version="1.0" encoding="UTF-8"?>\n')
+  fp.write('<opml version="2.0">\n')
+  fp.write('  <head>\n')
+  fp.write('    <title>aggreg8 feeds</title>\n')
+  fp.write(f'    <dateCreated>{email.utils.formatdate(now, usegmt=True)}</dateCreated>\n')
+  fp.write('  </head>\n')
+  fp.write('  <body>\n')
+
+  for name, proper_name, url in feeds:
+    fp.write(f'    <outline type="rss" name={quoteattr(name)} text={quoteattr(proper_name)} '
+      f'title={quoteattr(proper_name)} xmlUrl={quoteattr(url)}/>\n')
+
+  fp.write('  </body>\n')
+  fp.write('</opml>\n')
+## }}}
+
+## {{{ write_jsonl()
+def write_jsonl(fp, feeds, now):
+  # Write feeds, an iterable of (name, proper_name, url) tuples, to the text
+  # file object fp as JSON Lines
+  for name, proper_name, url in feeds:
+    fp.write(json.dumps({'name': name, 'proper_name': proper_name, 'url': url}) + '\n')
+## }}}
+
+## {{{ write_feeds()
+def write_feeds(fp, feeds, format, now):
+  if format == 'opml':
+    write_opml(fp, feeds, now)
+  elif format == 'jsonl':
+    write_jsonl(fp, feeds, now)
+  else:
+    raise RssFeedError(f"unsupported feed list format '{format}'")
+## }}}
+
+## {{{ _insert_feed()
+def _insert_feed(dbd, name, proper_name, url, now):
+  # Insert a feed unless its URL is already present, returning whether it
+  # was; if only its name is taken (e.g. by another outline of the same
+  # title), it's made unique with a numeric suffix
+  #
+  unique = name
+  suffix = 1
+
+  while True:
+    sql = SQL_INSERT_FEEDS
+
+    debug(f"executing: {sql}")
+    if dbd.execute(str(sql), (unique, proper_name, url, now, now)).rowcount > 0:
+      break
+
+    sql = SQL_SELECT_FEED_URL
+
+    debug(f"executing: {sql}")
+    if dbd.execute(str(sql), (url,)).fetchone() is not None:
+      return False
+
+    suffix += 1
+    unique = f'{name}-{suffix}'
+
+  if unique != name:
+    warning(f"feed '{name}' ({url}) added as '{unique}': name already taken")
+
+  return True
+## }}}
+
+## {{{ import_feeds()
+def import_feeds(dbd, feeds, now):
+  # Insert feeds, an iterable of (name, proper_name, url) tuples, in a single
+  # transaction, returning the number of feeds (added, already present,
+  # invalid); a feed is already present if its URL is. Invalid feeds are
+  # skipped with a warning; feeds are validated and inserted one at a time,
+  # so feeds is never held in memory as a whole
+  #
+  added = present = invalid = 0
+
+  try:
+    for name, proper_name, url in feeds:
+      try:
+        url = validate_feed(name, proper_name, url)
+      except RssFeedError as ex:
+        warning(f"skipping feed '{name}': {ex}")
+        invalid += 1
+        continue
+
+      if _insert_feed(dbd, name, proper_name, url, now):
+        added += 1
+      else:
+        present += 1
+
+    dbd.commit()
+  except Exception:
+    dbd.rollback()
+    raise
+
+  return (added, present, invalid)
+## }}}
+
+## {{{ export_feeds()
+def export_feeds(dbd):
+  # Yield (name, proper_name, url) for every feed, stepping through the
+  # cursor rather than fetching the whole table
+  sql = SQL_SELECT_FEEDS
+
+  debug(f"executing: {sql}")
+  yield from dbd.execute(str(sql))
+## }}}
+
+## }}} ---- [ Functions ] --------------------------------------------------------------------------
+
+##
+# vim: ts=2 sw=2 tw=100 et fdm=marker :
+##
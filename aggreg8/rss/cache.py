@@ -0,0 +1,203 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+##
+# aggreg8.git:aggreg8/rss/cache.py
+##
+
+## {{{ ---- [ Header ] -----------------------------------------------------------------------------
+
+##
+# Copyright (c) 2021 Francis M <francism@destinatech.com>
+#
+# This program is free software; you can redistribute it and/or modify it under
+# the terms of the GNU General Public License version 2.0 as published by the
+# Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE.  See the GNU General Public License for more
+# details.
+#
+# You should have received a copy of the GNU General Public License along with
+# this program; if not, write to:
+#
+#   Free Software Foundation
+#   51 Franklin Street, Fifth Floor
+#   Boston, MA 02110
+#   USA
+##
+
+## }}} ---- [ Header ] -----------------------------------------------------------------------------
+
+## {{{ ---- [ Imports ] ----------------------------------------------------------------------------
+
+import zlib
+
+from .. import debug
+
+from ..database import SqlStatement
+
+from ..url import DEFAULT_CHUNK_SIZE, UrlRequestError, decoder_factory
+
+from .errors import RssFeedError
+
+# Optional zstd support
+try:
+  import zstandard
+except ImportError:
+  zstandard = None
+
+## }}} ---- [ Imports ] ----------------------------------------------------------------------------
+
+## {{{ ---- [ Constants ] --------------------------------------------------------------------------
+
+## Ways the cached copy of a feed (rss_blobs.content) can be stored:
+#
+#   none    = as text
+#   deflate = zlib compressed
+#   zstd    = zstd compressed (needs the zstandard module)
+#   wire    = as received if the server compressed it, saving recompressing
+#             it; zlib compressed otherwise
+#
+CACHE_COMPRESSIONS = ['none', 'deflate', 'wire'] + (['zstd'] if zstandard is not None else [])
+
+# Default cache compression
+DEFAULT_CACHE_COMPRESSION = 'wire'
+
+# zlib compression level used by the deflate compression
+DEFLATE_LEVEL = 6
+
+## }}} ---- [ Constants ] --------------------------------------------------------------------------
+
+## {{{ ---- [ Statements ] -------------------------------------------------------------------------
+
+SQL_SELECT_BLOB = SqlStatement(
+  'SELECT',
+  'id',
+  'FROM',
+  'rss_blobs',
+  'WHERE',
+  'hash=?'
+)
+
+# Cache rows may reference a hash before its blob exists (streamed feeds
+# never store one): the refcount of a new blob starts from those, the
+# triggers counting any written after it
+#
+SQL_INSERT_BLOB = SqlStatement(
+  'INSERT INTO',
+  'rss_blobs',
+  '(hash, content, content_encoding, date_added, refcount)',
+  'SELECT',
+  '?, ?, ?, ?, COUNT(*)',
+  'FROM',
+  'rss_feed_cache',
+  'WHERE',
+  'content_hash=?',
+  'ON CONFLICT (hash) DO NOTHING'
+)
+
+SQL_GC_BLOBS = SqlStatement(
+  'DELETE',
+  'FROM',
+  'rss_blobs',
+  'WHERE',
+  'refcount<=0'
+)
+
+## }}} ---- [ Statements ] -------------------------------------------------------------------------
+
+## {{{ ---- [ Functions ] --------------------------------------------------------------------------
+
+## {{{ compress_content()
+def compress_content(response, compression):
+  # Return the (content, content_encoding) pair to store as the cached copy
+  # of response's body, content_encoding being a Content-Encoding header
+  # value (None if content is text) so decoder_factory() can undo it
+  #
+  if compression not in CACHE_COMPRESSIONS:
+    raise RssFeedError(f"invalid cache compression '{compression}'")
+
+  # Streamed feeds aren't held in memory, so there's no content to cache
+  if response.content is None:
+    return '', None
+
+  if compression == 'none':
+    return response.content, None
+
+  if compression == 'wire' and response.raw_content is not None \
+      and response.encoding not in [None, '', 'identity']:
+    return response.raw_content, response.encoding
+
+  if compression == 'zstd':
+    return zstandard.ZstdCompressor().compress(response.content.encode('utf-8')), 'zstd'
+
+  return zlib.compress(response.content.encode('utf-8'), DEFLATE_LEVEL), 'deflate'
+## }}}
+
+## {{{ decompress_content()
+def decompress_content(content, encoding):
+  # Undo compress_content(), returning the cached copy of a feed as text
+  if encoding is None:
+    return content
+
+  try:
+    decoder = decoder_factory(encoding)
+    data = b''.join(decoder.decode(content, DEFAULT_CHUNK_SIZE)) + decoder.flush()
+    return data.decode('utf-8')
+  except UrlRequestError as ex:
+    raise RssFeedError(f'failed to decompress cached content: {ex}')
+  except UnicodeDecodeError as ex:
+    raise RssFeedError(f'failed to decode cached content: {ex}')
+## }}}
+
+## {{{ store_blob()
+def store_blob(dbd, content_hash, response, compression, now, batch=None):
+  # Store response's body in the blob store under content_hash, unless it's
+  # there already (in which case it isn't even compressed); rows referencing
+  # it (rss_feed_cache.content_hash) may be written before or after it, see
+  # SQL_INSERT_BLOB. Writes are queued on batch (an aggreg8.database.WriteBatch) if given,
+  # which the lookup doesn't see: a blob still queued there is queued again,
+  # the insert leaving the first one be.
+  #
+  if response.content is None or not content_hash:
+    return False
+
+  sql = SQL_SELECT_BLOB
+
+  debug(f"executing: {sql}")
+  if dbd.execute(str(sql), (content_hash,)).fetchone() is not None:
+    return False
+
+  content, content_encoding = compress_content(response, compression)
+
+  sql = SQL_INSERT_BLOB
+  values = (content_hash, content, content_encoding, now, content_hash)
+
+  debug(f"executing: {sql}")
+  if batch is None:
+    dbd.execute(str(sql), values)
+  else:
+    batch.execute(str(sql), values)
+
+  return True
+## }}}
+
+## {{{ gc_blobs()
+def gc_blobs(dbd):
+  # Delete blobs no longer referenced by any cached feed; never run while
+  # writes changing references are still queued (e.g. on a WriteBatch), as
+  # blobs they reference may not have been counted yet
+  #
+  sql = SQL_GC_BLOBS
+
+  debug(f"executing: {sql}")
+  dbd.execute(str(sql))
+## }}}
+
+## }}} ---- [ Functions ] --------------------------------------------------------------------------
+
+##
+# vim: ts=2 sw=2 tw=100 et fdm=marker :
+##
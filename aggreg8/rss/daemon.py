@@ -0,0 +1,242 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+##
+# aggreg8.git:aggreg8/rss/daemon.py
+##
+
+## {{{ ---- [ Header ] -----------------------------------------------------------------------------
+
+##
+# Copyright (c) 2021 Francis M <francism@destinatech.com>
+#
+# This program is free software; you can redistribute it and/or modify it under
+# the terms of the GNU General Public License version 2.0 as published by the
+# Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE.  See the GNU General Public License for more
+# details.
+#
+# You should have received a copy of the GNU General Public License along with
+# this program; if not, write to:
+#
+#   Free Software Foundation
+#   51 Franklin Street, Fifth Floor
+#   Boston, MA 02110
+#   USA
+##
+
+## }}} ---- [ Header ] -----------------------------------------------------------------------------
+
+## {{{ ---- [ Imports ] ----------------------------------------------------------------------------
+
+import heapq
+
+import threading
+
+from .. import debug, time_now
+
+from ..database import SqlStatement
+
+from .main import POLL_COLUMNS, RssFeed
+
+## }}} ---- [ Imports ] ----------------------------------------------------------------------------
+
+## {{{ ---- [ Constants ] --------------------------------------------------------------------------
+
+# Default number of seconds between checks for added/removed feeds
+DEFAULT_DAEMON_RELOAD_INTERVAL = 60
+
+## }}} ---- [ Constants ] --------------------------------------------------------------------------
+
+## {{{ ---- [ Classes ] ----------------------------------------------------------------------------
+
+## {{{ class RssScheduler
+
+class RssScheduler:
+
+  """Min-heap of feeds keyed on the time they're next due to be polled (next_due)"""
+
+  # Heap of (due time, feed ID) tuples
+  _heap = None
+
+  # Feeds and their current due time, keyed by feed ID; heap entries not
+  # matching the latter are stale and skipped when popped
+  _feeds = None
+  _due = None
+
+  ## {{{ RssScheduler.__init__()
+  def __init__(self):
+    self._heap = []
+    self._feeds = {}
+    self._due = {}
+  ## }}}
+
+  def __len__(self):
+    return len(self._feeds)
+
+  def __contains__(self, feed_id):
+    return feed_id in self._feeds
+
+  ## {{{ RssScheduler.ids()
+  def ids(self):
+    return set(self._feeds.keys())
+  ## }}}
+
+  ## {{{ RssScheduler.schedule()
+  def schedule(self, feed, due=None):
+    if due is None:
+      due = feed.get('next_due')
+
+    feed_id = feed.get('id')
+    self._feeds[feed_id] = feed
+    self._due[feed_id] = due
+    heapq.heappush(self._heap, (due, feed_id))
+  ## }}}
+
+  ## {{{ RssScheduler.remove()
+  def remove(self, feed_id):
+    self._feeds.pop(feed_id, None)
+    self._due.pop(feed_id, None)
+  ## }}}
+
+  ## {{{ RssScheduler.next_due()
+  def next_due(self):
+    self._discard_stale()
+    if len(self._heap) < 1:
+      return None
+    return self._heap[0][0]
+  ## }}}
+
+  ## {{{ RssScheduler.pop_due()
+  def pop_due(self, now):
+    # Remove and return all feeds due at or before now; they need to be
+    # scheduled again once polled
+    #
+    feeds = []
+
+    self._discard_stale()
+    while len(self._heap) > 0 and self._heap[0][0] <= now:
+      due, feed_id = heapq.heappop(self._heap)
+      del self._due[feed_id]
+      feeds.append(self._feeds.pop(feed_id))
+      self._discard_stale()
+
+    return feeds
+  ## }}}
+
+  ## {{{ RssScheduler._discard_stale()
+  def _discard_stale(self):
+    while len(self._heap) > 0:
+      due, feed_id = self._heap[0]
+      if self._due.get(feed_id) == due:
+        break
+      heapq.heappop(self._heap)
+  ## }}}
+
+## class RssScheduler }}}
+
+## {{{ class RssDaemon
+
+class RssDaemon:
+
+  """Long-running poller, waking up only when a feed is due"""
+
+  # Database driver object implementing aggreg8.database.Database
+  dbd = None
+
+  # Poller object (aggreg8.rss.RssPoller) due feeds are handed to
+  poller = None
+
+  # Number of seconds between checks for added/removed feeds
+  reload_interval = None
+
+  scheduler = None
+
+  # ID of the most recently added feed we know of
+  _last_id = None
+
+  _stop = None
+
+  ## {{{ RssDaemon.__init__()
+  def __init__(self, dbd, poller, reload_interval=DEFAULT_DAEMON_RELOAD_INTERVAL):
+    self.dbd = dbd
+    self.poller = poller
+    self.reload_interval = reload_interval
+    self.scheduler = RssScheduler()
+    self._last_id = 0
+    self._stop = threading.Event()
+  ## }}}
+
+  ## {{{ RssDaemon.run()
+  def run(self):
+    self.reload()
+    next_reload = time_now() + self.reload_interval
+
+    while not self._stop.is_set():
+      now = time_now()
+
+      if now >= next_reload:
+        self.reload()
+        next_reload = now + self.reload_interval
+
+      feeds = self.scheduler.pop_due(now)
+      if len(feeds) > 0:
+        debug(f"polling {len(feeds)} due feed(s)")
+        self.poller.poll(feeds)
+
+        # Feeds the poller failed to update are retried an update interval
+        # from now rather than straight away
+        #
+        now = time_now()
+        for feed in feeds:
+          due = feed.get('next_due')
+          if due <= now:
+            due = now + feed.get('update_interval')
+          self.scheduler.schedule(feed, due)
+
+      # Sleep until the next feed is due or it's time to look for new ones,
+      # whichever comes first
+      #
+      wake = next_reload
+      next_due = self.scheduler.next_due()
+      if next_due is not None:
+        wake = min(wake, next_due)
+
+      timeout = wake - time_now()
+      if timeout > 0:
+        self._stop.wait(timeout)
+  ## }}}
+
+  ## {{{ RssDaemon.stop()
+  def stop(self):
+    self._stop.set()
+  ## }}}
+
+  ## {{{ RssDaemon.reload()
+  def reload(self):
+    # Only feeds added since the last reload are loaded; removed feeds are
+    # spotted by comparing IDs alone
+    #
+    for feed in RssFeed.feeds(self.dbd, after_id=self._last_id, columns=POLL_COLUMNS):
+      self.scheduler.schedule(feed)
+      self._last_id = max(self._last_id, feed.get('id'))
+
+    sql = SqlStatement('SELECT id FROM rss_feeds')
+
+    debug(f"executing: {sql}")
+    ids = set(row[0] for row in self.dbd.execute(str(sql)))
+
+    for feed_id in self.scheduler.ids() - ids:
+      self.scheduler.remove(feed_id)
+  ## }}}
+
+## class RssDaemon }}}
+
+## }}} ---- [ Classes ] ----------------------------------------------------------------------------
+
+##
+# vim: ts=2 sw=2 tw=100 et fdm=marker :
+##
@@ -0,0 +1,368 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+##
+# aggreg8.git:aggreg8/rss/dedup.py
+##
+
+## {{{ ---- [ Header ] -----------------------------------------------------------------------------
+
+##
+# Copyright (c) 2021 Francis M <francism@destinatech.com>
+#
+# This program is free software; you can redistribute it and/or modify it under
+# the terms of the GNU General Public License version 2.0 as published by the
+# Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE.  See the GNU General Public License for more
+# details.
+#
+# You should have received a copy of the GNU General Public License along with
+# this program; if not, write to:
+#
+#   Free Software Foundation
+#   51 Franklin Street, Fifth Floor
+#   Boston, MA 02110
+#   USA
+##
+
+## }}} ---- [ Header ] -----------------------------------------------------------------------------
+
+## {{{ ---- [ Imports ] ----------------------------------------------------------------------------
+
+import re
+
+import struct
+
+import hashlib
+
+import urllib.parse
+
+from .. import debug
+
+from ..database import SqlStatement
+
+from .errors import RssFeedError
+
+## }}} ---- [ Imports ] ----------------------------------------------------------------------------
+
+## {{{ ---- [ Constants ] --------------------------------------------------------------------------
+
+# Number of hash functions in a MinHash signature, and the number of bands
+# it's split into for lookups (locality-sensitive hashing): entries sharing
+# a band are candidate duplicates. With 8 bands of 4, texts with 90% of
+# their words in common become candidates 99.9% of the time, and texts with
+# 30% in common 6% of the time.
+MINHASH_PERMUTATIONS = 32
+MINHASH_BANDS = 8
+
+# Default minimum (estimated) Jaccard similarity between the words of two
+# entries for them to be considered the same story
+DEFAULT_DEDUP_THRESHOLD = 0.7
+
+# Default number of seconds a story takes new entries for since it last did
+DEFAULT_DEDUP_WINDOW = 7 * 24 * 60 * 60
+
+# Minimum number of distinct title/summary words for an entry to be MinHashed:
+# short texts (e.g. "Live updates") are too alike to tell stories apart by
+MINHASH_MIN_WORDS = 8
+
+# Query parameters that only track where a link was followed from
+TRACKING_PARAMS = ('utm_', 'fbclid', 'gclid', 'mc_cid', 'mc_eid', 'ocid', 'cmpid', 'ref', 'src')
+
+_TAG_RE = re.compile(r'<[^>]*>')
+_WORD_RE = re.compile(r'\w+')
+
+# Format signatures are stored in (rss_stories.signature), which is also that
+# of the per-token hash values they're taken from
+_SIGNATURE_FORMAT = f'>{MINHASH_PERMUTATIONS}I'
+
+## }}} ---- [ Constants ] --------------------------------------------------------------------------
+
+## {{{ ---- [ Statements ] -------------------------------------------------------------------------
+
+SQL_SELECT_STORY_KEYS = SqlStatement(
+  'SELECT',
+  'rss_stories.id',
+  'FROM',
+  'rss_story_keys',
+  'JOIN',
+  'rss_stories ON rss_stories.id=rss_story_keys.story_id',
+  'WHERE',
+  'rss_story_keys.key IN (?, ?)',
+  'AND',
+  'rss_stories.last_updated>=?'
+)
+
+SQL_SELECT_STORY_BANDS = SqlStatement(
+  'SELECT',
+  'rss_stories.id, rss_stories.signature',
+  'FROM',
+  'rss_story_bands',
+  'JOIN',
+  'rss_stories ON rss_stories.id=rss_story_bands.story_id',
+  'WHERE',
+  f"rss_story_bands.band IN ({', '.join(['?'] * MINHASH_BANDS)})",
+  'AND',
+  'rss_stories.last_updated>=?',
+  'AND NOT EXISTS',
+  '(SELECT 1 FROM rss_entries WHERE story_id=rss_stories.id AND feed_id=?)'
+)
+
+SQL_INSERT_STORY = SqlStatement(
+  'INSERT INTO',
+  'rss_stories',
+  '(signature, date_added, last_updated)',
+  'VALUES(?, ?, ?)'
+)
+
+SQL_UPDATE_STORY = SqlStatement(
+  'UPDATE',
+  'rss_stories',
+  'SET',
+  'last_updated=?',
+  'WHERE',
+  'id=?'
+)
+
+SQL_INSERT_STORY_KEY = SqlStatement(
+  'INSERT OR REPLACE INTO',
+  'rss_story_keys',
+  '(key, story_id)',
+  'VALUES(?, ?)'
+)
+
+SQL_INSERT_STORY_BAND = SqlStatement(
+  'INSERT OR IGNORE INTO',
+  'rss_story_bands',
+  '(band, story_id)',
+  'VALUES(?, ?)'
+)
+
+## }}} ---- [ Statements ] -------------------------------------------------------------------------
+
+## {{{ ---- [ Functions ] --------------------------------------------------------------------------
+
+## {{{ normalize_link()
+def normalize_link(link):
+  # Reduce a link to the form syndicated copies of it are most likely to
+  # share: no scheme, "www." prefix, fragment, tracking parameters or
+  # trailing slash, and the remaining query parameters sorted
+  #
+  if not link:
+    return None
+
+  parts = urllib.parse.urlsplit(link.strip())
+  if not parts.netloc:
+    return None
+
+  host = parts.netloc.lower()
+  if host.startswith('www.'):
+    host = host[4:]
+
+  query = urllib.parse.parse_qsl(parts.query, keep_blank_values=True)
+  query = [(name, value) for name, value in query if not name.lower().startswith(TRACKING_PARAMS)]
+
+  path = parts.path.rstrip('/')
+  if query:
+    path += '?' + urllib.parse.urlencode(sorted(query))
+
+  return host + path
+## }}}
+
+## {{{ words()
+def words(text):
+  # Lower-cased words of text, with any markup stripped
+  if not text:
+    return []
+  return _WORD_RE.findall(_TAG_RE.sub(' ', text).lower())
+## }}}
+
+## {{{ minhash()
+def minhash(tokens):
+  # MinHash signature of a set of tokens: the fraction of positions at which
+  # the signatures of two sets agree estimates their Jaccard similarity
+  #
+  # Rather than computing one hash function per position, each token's
+  # SHAKE-128 output is cut into MINHASH_PERMUTATIONS 32-bit values, so
+  # a whole signature costs a hash call per token.
+  #
+  size = struct.calcsize(_SIGNATURE_FORMAT)
+  values = [struct.unpack(_SIGNATURE_FORMAT, hashlib.shake_128(token.encode('utf-8')).digest(size))
+    for token in tokens]
+
+  return list(map(min, zip(*values)))
+## }}}
+
+## {{{ similarity()
+def similarity(a, b):
+  # Estimated Jaccard similarity of the sets two signatures were taken of
+  return sum(1 for x, y in zip(a, b) if x == y) / len(a)
+## }}}
+
+## {{{ minhash_bands()
+def minhash_bands(signature):
+  # Hash each band of a signature (tagged with its index, so equal values in
+  # different bands don't match) to a signed 64-bit integer
+  #
+  rows = MINHASH_PERMUTATIONS // MINHASH_BANDS
+
+  bands = []
+  for band in range(MINHASH_BANDS):
+    data = struct.pack(f'>B{rows}I', band, *signature[band * rows:(band + 1) * rows])
+    bands.append(int.from_bytes(hashlib.blake2b(data, digest_size=8).digest(), 'big', signed=True))
+
+  return bands
+## }}}
+
+## {{{ entry_fingerprint()
+def entry_fingerprint(entry):
+  # Return an entry's exact keys (guid/normalized link) and MinHash signature;
+  # either key and the signature may be None
+  #
+  link = normalize_link(entry.link)
+  if link is not None:
+    link = 'link:' + link
+
+  # Only guids that look globally unique are worth matching across feeds:
+  # many feeds just number their entries
+  #
+  guid = entry.guid
+  if guid is not None and (len(guid) < 8 or guid.isdigit()):
+    guid = None
+  if guid is not None:
+    guid = 'guid:' + guid.strip()
+
+  tokens = set(words(entry.title) + words(entry.summary))
+  if len(tokens) < MINHASH_MIN_WORDS:
+    return guid, link, None
+
+  return guid, link, minhash(tokens)
+## }}}
+
+## }}} ---- [ Functions ] --------------------------------------------------------------------------
+
+## {{{ ---- [ Classes ] ----------------------------------------------------------------------------
+
+## {{{ class RssStoryIndex
+
+class RssStoryIndex:
+
+  """Persistent index clustering entries from different feeds into stories"""
+
+  # Database driver object implementing aggreg8.database.Database
+  dbd = None
+
+  # Minimum estimated Jaccard similarity between entries of the same story
+  threshold = None
+
+  # Number of seconds a story takes new entries for since it last did
+  window = None
+
+  # (story ID, feed ID) of the entries assigned a story so far, which may
+  # still be queued on a write batch rather than in rss_entries
+  _feeds = None
+
+  ## {{{ RssStoryIndex.__init__()
+  def __init__(self, dbd, threshold=DEFAULT_DEDUP_THRESHOLD, window=DEFAULT_DEDUP_WINDOW):
+    if threshold <= 0 or threshold > 1:
+      raise RssFeedError(f"invalid dedup threshold '{threshold}'")
+
+    self.dbd = dbd
+    self.threshold = threshold
+    self.window = window
+    self._feeds = set()
+  ## }}}
+
+  ## {{{ RssStoryIndex.assign()
+  def assign(self, entry, feed_id, now):
+    # Return the ID of the story entry (from feed feed_id) belongs to,
+    # creating one if it's the first of its kind. Lookups are by primary key
+    # (exact keys) or on a handful of MinHash bands, so take constant time on
+    # average whatever the size of the index. Either way, only stories updated
+    # within the window match.
+    #
+    # A feed's own entries are distinct (they have different keys), however
+    # alike their text, so near-duplicates are only looked for among stories
+    # the feed has no entry in yet.
+    #
+    # Writes go straight to the database rather than through a write batch:
+    # the next entry looked up may well be a copy of this one.
+    #
+    guid, link, signature = entry_fingerprint(entry)
+
+    story_id = self._lookup(guid, link, signature, feed_id, now)
+    if story_id is None:
+      sql = SQL_INSERT_STORY
+
+      data = None
+      if signature is not None:
+        data = struct.pack(_SIGNATURE_FORMAT, *signature)
+
+      debug(f"executing: {sql}")
+      story_id = self.dbd.execute(str(sql), (data, now, now)).lastrowid
+
+      if signature is not None:
+        sql = SQL_INSERT_STORY_BAND
+
+        debug(f"executing: {sql}")
+        self.dbd.executemany(str(sql), [(band, story_id) for band in minhash_bands(signature)])
+    else:
+      sql = SQL_UPDATE_STORY
+
+      debug(f"executing: {sql}")
+      self.dbd.execute(str(sql), (now, story_id))
+
+    self._feeds.add((story_id, feed_id))
+
+    # A key seen in a story that has since gone out of the window now leads to
+    # this one
+    #
+    keys = [(key, story_id) for key in [guid, link] if key is not None]
+    if len(keys) > 0:
+      sql = SQL_INSERT_STORY_KEY
+
+      debug(f"executing: {sql}")
+      self.dbd.executemany(str(sql), keys)
+
+    return story_id
+  ## }}}
+
+  ## {{{ RssStoryIndex._lookup()
+  def _lookup(self, guid, link, signature, feed_id, now):
+    if guid is not None or link is not None:
+      sql = SQL_SELECT_STORY_KEYS
+
+      debug(f"executing: {sql}")
+      row = self.dbd.execute(str(sql), (guid, link, now - self.window)).fetchone()
+      if row is not None:
+        return row[0]
+
+    if signature is None:
+      return None
+
+    sql = SQL_SELECT_STORY_BANDS
+
+    # Candidates share at least one band, but only those similar enough
+    # going by the whole signature count
+    #
+    debug(f"executing: {sql}")
+    parameters = minhash_bands(signature) + [now - self.window, feed_id]
+    for story_id, data in self.dbd.execute(str(sql), parameters):
+      if (story_id, feed_id) in self._feeds:
+        continue
+      if similarity(signature, struct.unpack(_SIGNATURE_FORMAT, data)) >= self.threshold:
+        return story_id
+
+    return None
+  ## }}}
+
+## class RssStoryIndex }}}
+
+## }}} ---- [ Classes ] ----------------------------------------------------------------------------
+
+##
+# vim: ts=2 sw=2 tw=100 et fdm=marker :
+##
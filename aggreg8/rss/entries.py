@@ -0,0 +1,242 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+##
+# aggreg8.git:aggreg8/rss/entries.py
+##
+
+## {{{ ---- [ Header ] -----------------------------------------------------------------------------
+
+##
+# Copyright (c) 2021 Francis M <francism@destinatech.com>
+#
+# This program is free software; you can redistribute it and/or modify it under
+# the terms of the GNU General Public License version 2.0 as published by the
+# Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE.  See the GNU General Public License for more
+# details.
+#
+# You should have received a copy of the GNU General Public License along with
+# this program; if not, write to:
+#
+#   Free Software Foundation
+#   51 Franklin Street, Fifth Floor
+#   Boston, MA 02110
+#   USA
+##
+
+## }}} ---- [ Header ] -----------------------------------------------------------------------------
+
+## {{{ ---- [ Imports ] ----------------------------------------------------------------------------
+
+import dataclasses
+
+from .. import debug
+
+from ..database import SqlStatement
+
+## }}} ---- [ Imports ] ----------------------------------------------------------------------------
+
+## {{{ ---- [ Constants ] --------------------------------------------------------------------------
+
+# Entry fields stored in the rss_entries table, in column order
+ENTRY_FIELDS = ('guid', 'link', 'title', 'summary', 'published')
+
+## }}} ---- [ Constants ] --------------------------------------------------------------------------
+
+## {{{ ---- [ Statements ] -------------------------------------------------------------------------
+
+SQL_SELECT_ENTRY_HASHES = SqlStatement(
+  'SELECT',
+  'entry_key, entry_hash',
+  'FROM',
+  'rss_entries',
+  'WHERE',
+  'feed_id=?'
+)
+
+_ENTRY_COLUMNS = 'feed_id, entry_key, guid, link, title, summary, published, date_added, ' \
+  'last_updated, entry_hash, story_id'
+
+SQL_UPSERT_ENTRIES = SqlStatement(
+  'INSERT INTO',
+  'rss_entries',
+  f'({_ENTRY_COLUMNS})',
+  'VALUES(?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)',
+  'ON CONFLICT (feed_id, entry_key) DO UPDATE SET',
+  'guid=excluded.guid,',
+  'link=excluded.link,',
+  'title=excluded.title,',
+  'summary=excluded.summary,',
+  'published=excluded.published,',
+  'last_updated=excluded.last_updated,',
+  'entry_hash=excluded.entry_hash,',
+  'story_id=COALESCE(story_id, excluded.story_id)'
+)
+
+## }}} ---- [ Statements ] -------------------------------------------------------------------------
+
+## {{{ ---- [ Classes ] ----------------------------------------------------------------------------
+
+## {{{ class RssEntry
+
+@dataclasses.dataclass(slots=True)
+class RssEntry:
+
+  """Parsed feed entry, holding the fields stored in the rss_entries table"""
+
+  guid: str = None
+  link: str = None
+  title: str = None
+  summary: str = None
+  published: int = None
+
+## class RssEntry }}}
+
+## }}} ---- [ Classes ] ----------------------------------------------------------------------------
+
+## {{{ ---- [ Functions ] --------------------------------------------------------------------------
+
+## {{{ entry_key()
+def entry_key(entry):
+  # Prefer the guid, which is meant to be stable, over the link, which some
+  # feeds rewrite (tracking parameters etc); fall back to the title and
+  # summary for feeds providing neither
+  #
+  if entry.guid:
+    key = f"guid:{entry.guid}"
+  elif entry.link:
+    key = f"link:{entry.link}"
+  elif entry.title or entry.summary:
+    key = f"text:{entry.title}\0{entry.summary}"
+  else:
+    return None
+
+  # Imported here, like calendar below, as RssFeed pulls this module in for
+  # commands that never hash or normalise an entry; it's a dict lookup once
+  # loaded
+  #
+  import hashlib
+  return hashlib.sha256(key.encode('utf-8')).hexdigest()
+## }}}
+
+## {{{ entry_hash()
+def entry_hash(entry):
+  import hashlib
+  data = '\0'.join('' if value is None else str(value) for value in entry_to_tuple(entry))
+  return hashlib.sha256(data.encode('utf-8')).hexdigest()
+## }}}
+
+## {{{ entry_to_tuple()
+def entry_to_tuple(entry):
+  return (entry.guid, entry.link, entry.title, entry.summary, entry.published)
+## }}}
+
+## {{{ entry_from_tuple()
+def entry_from_tuple(values):
+  return RssEntry(*values)
+## }}}
+
+## {{{ normalize_entry()
+def normalize_entry(entry):
+  published = entry.get('published_parsed') or entry.get('updated_parsed')
+  if published is not None:
+    import calendar
+    published = calendar.timegm(published)
+
+  return RssEntry(
+    entry.get('id'),
+    entry.get('link'),
+    entry.get('title'),
+    entry.get('summary'),
+    published
+  )
+## }}}
+
+## {{{ upsert_entries()
+def upsert_entries(dbd, feed_id, entries, now, batch=None, stories=None):
+  # Fetch the keys/hashes of entries we already have for this feed so only
+  # new or changed entries get written; writes are queued on batch (an
+  # aggreg8.database.WriteBatch) if given, or run straight away otherwise.
+  # If given a story index (aggreg8.rss.RssStoryIndex), new entries are
+  # assigned to stories; changed ones keep theirs.
+  #
+  sql = SQL_SELECT_ENTRY_HASHES
+
+  debug(f"executing: {sql}")
+  stored = dict(tuple(row) for row in dbd.execute(str(sql), (feed_id,)))
+
+  ## Columns:
+  #
+  # 0 = feed_id
+  # 1 = entry_key
+  # 2 = guid
+  # 3 = link
+  # 4 = title
+  # 5 = summary
+  # 6 = published
+  # 7 = date_added
+  # 8 = last_updated
+  # 9 = entry_hash
+  # 10 = story_id
+  #
+
+  # With a batch, rows are queued as entries come in (entries may be parsed
+  # as the feed downloads, see aggreg8.rss.iter_entries()), so no more of
+  # them are held in memory than the batch holds
+  #
+  sql = str(SQL_UPSERT_ENTRIES)
+
+  values = []
+  count = 0
+  for entry in entries:
+    key = entry_key(entry)
+    if key is None:
+      continue
+
+    digest = entry_hash(entry)
+    if stored.get(key) == digest:
+      continue
+
+    story_id = None
+    if stories is not None and key not in stored:
+      story_id = stories.assign(entry, feed_id, now)
+
+    # Feeds occasionally repeat an entry: only keep the first occurrence
+    stored[key] = digest
+
+    row = (
+      feed_id,
+      key,
+      entry.guid,
+      entry.link,
+      entry.title,
+      entry.summary,
+      entry.published,
+      now,
+      now,
+      digest,
+      story_id,
+    )
+
+    count += 1
+    if batch is None:
+      values.append(row)
+    else:
+      batch.execute(sql, row)
+
+  if len(values) > 0:
+    debug(f"executing: {sql}")
+    dbd.executemany(sql, values)
+
+  return count
+## }}}
+
+## }}} ---- [ Functions ] --------------------------------------------------------------------------
+
+##
+# vim: ts=2 sw=2 tw=100 et fdm=marker :
+##
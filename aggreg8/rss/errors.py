@@ -35,6 +35,9 @@ from .. import A8Error
 class RssFeedError(A8Error):
   pass
 
+class RssParseError(RssFeedError):
+  pass
+
 ##
 # vim: ts=2 sw=2 tw=100 et fdm=marker :
 ##
@@ -32,21 +32,24 @@
 
 ## {{{ ---- [ Imports ] ----------------------------------------------------------------------------
 
+import re
+
 import string
 
-import dataclasses
+import sqlite3
 
-import feedparser
+import dataclasses
 
 from .. import (
   debug,
   func_name,
   time_now,
   A8Error,
-  Dict,
 )
 
-from ..database import SqlStatement
+from ..database import DatabaseError, SqlStatement
+
+from .entries import ENTRY_FIELDS, RssEntry
 
 from .errors import RssFeedError
 
@@ -62,29 +65,78 @@ VALID_NAME_CHARS = _ALPHANUMERIC + '-_'
 # Valid feed proper name characters
 VALID_PROPER_NAME_CHARS = _ALPHANUMERIC + "'- "
 
-# Valid URL characters
+# Feed URL schemes, and their default ports (dropped by normalize_feed_url())
+VALID_URL_SCHEMES = {'http': 80, 'https': 443}
+
+# Names are validated with one regex match rather than a Python loop over
+# their characters, as bulk imports validate thousands of them
 #
-# FIXME: there's surely a module exposing an infinitely better list of
-# valid URL characters...
+_VALID_NAME_RE = re.compile(f'[{re.escape(VALID_NAME_CHARS)}]+')
+_VALID_PROPER_NAME_RE = re.compile(f'[{re.escape(VALID_PROPER_NAME_CHARS)}]+')
+
+# Characters left as they are in URL paths and queries (RFC 3986 reserved
+# characters and '%', so existing escapes aren't escaped again); anything
+# else but unreserved characters is percent-encoded
 #
-VALID_URL_CHARS = _ALPHANUMERIC + ':/.?-_%='
+_URL_SAFE_CHARS = "!$&'()*+,;=:@/?%"
+
+# Whitespace and control characters, which no part of a feed URL may hold
+_URL_INVALID_CHARS_RE = re.compile(r'[\s\x00-\x1f\x7f-\x9f]')
+
+# A host name label, once IDNA encoded
+_HOST_LABEL_RE = re.compile(r'[A-Za-z0-9-]{1,63}')
+
+# Columns of the rss_feeds table
+FEED_COLUMNS = ('id', 'name', 'proper_name', 'url', 'update_interval', 'date_added',
+  'last_updated', 'next_due', 'context')
+
+# Columns every RssFeed loaded from the database has
+KEY_COLUMNS = ('id', 'name', 'proper_name', 'url')
+
+# Heavy columns, loaded on first access unless explicitly asked for; entries
+# and content (the feed's cached copy, decompressed) aren't rss_feeds columns
+# as such, but come from the rss_entries and rss_feed_cache/rss_blobs tables
+LAZY_COLUMNS = ('context', 'entries', 'content')
+
+# Columns loaded by default
+DEFAULT_COLUMNS = tuple(column for column in FEED_COLUMNS if column not in LAZY_COLUMNS)
+
+# Columns needed to poll feeds
+POLL_COLUMNS = KEY_COLUMNS + ('update_interval', 'last_updated', 'next_due')
 
 ## }}} ---- [ Constants ] --------------------------------------------------------------------------
 
-## {{{ ---- [ Functions ] --------------------------------------------------------------------------
+## {{{ ---- [ Statements ] -------------------------------------------------------------------------
+
+SQL_SELECT_FEED_CONTENT = SqlStatement(
+  'SELECT',
+  'rss_blobs.content, rss_blobs.content_encoding',
+  'FROM',
+  'rss_feed_cache',
+  'JOIN',
+  'rss_blobs ON rss_blobs.hash=rss_feed_cache.content_hash',
+  'WHERE',
+  'rss_feed_cache.feed_id=?'
+)
 
-## {{{ def parse()
-def parse(str):
-  return feedparser.parse(str).entries
-## }}}
+SQL_SELECT_FEED_ENTRIES = SqlStatement(
+  'SELECT',
+  ', '.join(ENTRY_FIELDS),
+  'FROM',
+  'rss_entries',
+  'WHERE',
+  'feed_id=?',
+  'ORDER BY',
+  'published DESC'
+)
 
-## }}} ---- [ Functions ] --------------------------------------------------------------------------
+## }}} ---- [ Statements ] -------------------------------------------------------------------------
 
 ## {{{ ---- [ Classes ] ----------------------------------------------------------------------------
 
 ## {{{ class RssFeedSpec
 
-@dataclasses.dataclass
+@dataclasses.dataclass(slots=True)
 class RssFeedSpec:
 
   name: str
@@ -95,8 +147,10 @@ class RssFeedSpec:
   update_interval: int = 0
   date_added: int = 0
   last_updated: int = 0
-  entries: str = '[]'
+  next_due: int = 0
   context: str = '{}'
+  entries: list = None
+  content: str = None
 
 ## class RssFeedSpec }}}
 
@@ -104,101 +158,171 @@ class RssFeedSpec:
 
 class RssFeed:
 
-  _spec = None
+  # Daemon-style workloads keep many feeds around: don't give each a __dict__
+  #
+  #   _spec     = RssFeedSpec holding the feed's columns
+  #   _dbd      = database driver object heavy columns are lazily loaded through
+  #   _unloaded = frozenset of columns yet to be loaded, shared between all
+  #               the feeds loaded by a query until one of them loads a column
+  #   _json     = decoded JSON columns, keyed by column name
+  #
+  __slots__ = ('_spec', '_dbd', '_unloaded', '_json')
 
   ## {{{ RssFeed.__init__()
   def __init__(self, name, proper_name, url):
-    if not self._valid_feed_name(name):
-      raise RssFeedError(f"invalid feed name '{feed_name}'")
-    if not self._valid_feed_proper_name(proper_name):
-      raise RssFeedError(f"invalid feed proper name '{feed_proper_name}'")
-    if not self._valid_feed_url(url):
-      raise RssFeedError(f"invalid feed URL '{feed_url}'")
+    url = validate_feed(name, proper_name, url)
 
     self._spec = RssFeedSpec(name, proper_name, url)
+    self._dbd = None
+    self._unloaded = None
+    self._json = None
   ## }}}
 
   def __repr__(self):
     return f"RssFeed('{self._spec.name}', '{self._spec.proper_name}', '{self._spec.url}')"
 
-  ## {{{ RssFeed._valid_feed_name()
-  def _valid_feed_name(self, name):
-    # FIXME: perform proper TLV validation
-    for char in name:
-      if char not in VALID_NAME_CHARS:
-        warning(f"invalid feed name character '{char}'")
-        return False
-    return True
-  ## }}}
-
-  ## {{{ RssFeed._valid_feed_proper_name()
-  def _valid_feed_proper_name(self, name):
-    # FIXME: perform proper TLV validation
-    for char in name:
-      if char not in VALID_PROPER_NAME_CHARS:
-        warning(f"invalid feed proper name character '{char}'")
-        return False
-    return True
-  ## }}}
-
-  ## {{{ RssFeed._valid_feed_url()
-  def _valid_feed_url(self, url):
-    if not url.startswith('http://') and not url.startswith('https://'):
-      return False
-
-    # FIXME: perform proper TLV validation
-    for char in url:
-      if char not in VALID_URL_CHARS:
-        warning(f"invalid feed URL character '{char}'")
-        return False
-    return True
-  ## }}}
-
   def get(self, name):
+    if self._unloaded is not None and name in self._unloaded:
+      self._load(name)
     return getattr(self._spec, name)
 
   def set(self, name, value):
+    if self._unloaded is not None and name in self._unloaded:
+      self._unloaded = self._unloaded - {name}
+    if self._json is not None:
+      self._json.pop(name, None)
     return setattr(self._spec, name, value)
 
+  ## {{{ RssFeed.get_json()
+  def get_json(self, name):
+    # Decode a JSON column on first access, caching the result
+    if self._json is None:
+      self._json = {}
+
+    if name not in self._json:
+      import json
+      self._json[name] = json.loads(self.get(name))
+
+    return self._json[name]
+  ## }}}
+
+  ## {{{ RssFeed._load()
+  def _load(self, name):
+    self._unloaded = self._unloaded - {name}
+
+    if name == 'entries':
+      sql = SQL_SELECT_FEED_ENTRIES
+
+      debug(f"executing: {sql}")
+      rows = self._dbd.execute(str(sql), (self._spec.id,))
+      self._spec.entries = [RssEntry(*row) for row in rows]
+      return
+
+    if name == 'content':
+      from .cache import decompress_content
+
+      sql = SQL_SELECT_FEED_CONTENT
+
+      # Only decompressed now that someone's asked for it
+      debug(f"executing: {sql}")
+      row = self._dbd.execute(str(sql), (self._spec.id,)).fetchone()
+      if row is not None:
+        self._spec.content = decompress_content(row[0], row[1])
+      return
+
+    sql = SqlStatement(
+      'SELECT',
+      name,
+      'FROM',
+      'rss_feeds',
+      'WHERE',
+      'id=?'
+    )
+
+    debug(f"executing: {sql}")
+    row = self._dbd.execute(str(sql), (self._spec.id,)).fetchone()
+    if row is None:
+      raise RssFeedError(f"feed '{self._spec.name}' no longer exists")
+
+    setattr(self._spec, name, row[0])
+  ## }}}
+
   ## {{{ [static] RssFeed.feeds()
   @staticmethod
-  def feeds(dbd):
-    cursor = dbd.cursor()
+  def feeds(dbd, after_id=None, columns=DEFAULT_COLUMNS):
+    # If given an ID, only return feeds added after the feed with that ID
+    if after_id is None:
+      return RssFeed._select(dbd, columns)
+
+    return RssFeed._select(dbd, columns, 'id>?', (after_id,), 'id')
+  ## }}}
 
-    sql = SqlStatement('SELECT * FROM rss_feeds')
+  ## {{{ [static] RssFeed.due()
+  @staticmethod
+  def due(dbd, now, columns=POLL_COLUMNS):
+    # Return the feeds due to be polled at time now, going by the next_due
+    # index rather than scanning the table
+    return RssFeed._select(dbd, columns, 'next_due<=?', (now,), 'next_due')
+  ## }}}
 
-    #debug(f"executing: {sql}")
-    cursor.execute(str(sql))
+  ## {{{ [static] RssFeed._select()
+  @staticmethod
+  def _select(dbd, columns, where=None, parameters=(), order=None):
+    # Load feeds with only the given columns (plus KEY_COLUMNS, which are
+    # always needed); any others are loaded on first access
+    #
+    for column in columns:
+      if column not in FEED_COLUMNS and column not in LAZY_COLUMNS:
+        raise RssFeedError(f"invalid feed column '{column}'")
+
+    columns = KEY_COLUMNS + tuple(column for column in columns
+      if column in FEED_COLUMNS and column not in KEY_COLUMNS)
+
+    sql = SqlStatement('SELECT', ', '.join(columns), 'FROM', 'rss_feeds')
+    if where is not None:
+      sql = SqlStatement(str(sql), 'WHERE', where)
+    if order is not None:
+      sql = SqlStatement(str(sql), 'ORDER BY', order)
 
-    feed_list = []
-    for row in cursor.execute(str(sql)):
-      row = tuple(row)
+    cursor = dbd.cursor()
+    cursor.row_factory = RssFeed._row_factory(dbd, columns)
 
-      ## Columns:
-      #
-      # 0 = id
-      # 1 = name
-      # 2 = proper_name
-      # 3 = url
-      # 4 = update_interval
-      # 5 = date_added
-      # 6 = last_updated
-      # 7 = entries
-      # 8 = context
-      #
+    debug(f"executing: {sql}")
+    try:
+      return cursor.execute(str(sql), parameters).fetchall()
+    except sqlite3.DatabaseError as ex:
+      raise DatabaseError(ex, f'sqlite3.Cursor.execute() failed')
+  ## }}}
 
-      feed = RssFeed(row[1], row[2], row[3])
+  ## {{{ [static] RssFeed._row_factory()
+  @staticmethod
+  def _row_factory(dbd, columns):
+    # Return a sqlite3 row factory building RssFeed objects straight from the
+    # raw row tuples, skipping sqlite3.Row and the per-column set() calls;
+    # columns are as listed in columns, KEY_COLUMNS first
+    #
+    unloaded = frozenset(FEED_COLUMNS + LAZY_COLUMNS) - frozenset(columns)
 
-      feed.set('id', row[0])
-      feed.set('update_interval', row[4])
-      feed.set('date_added', row[5])
-      feed.set('last_updated', row[6])
-      feed.set('entries', row[7])
-      feed.set('context', row[8])
+    def factory(cursor, row):
+      return RssFeed._trusted(RssFeedSpec(**dict(zip(columns, row))), dbd, unloaded)
 
-      feed_list.append(feed)
+    return factory
+  ## }}}
 
-    return feed_list
+  ## {{{ [static] RssFeed._trusted()
+  @staticmethod
+  def _trusted(spec, dbd=None, unloaded=None):
+    # Build a feed around spec without validating it, for feeds read back
+    # from the database: their names and URL were validated on the way in
+    #
+    feed = RssFeed.__new__(RssFeed)
+
+    feed._spec = spec
+    feed._dbd = dbd
+    feed._unloaded = unloaded
+    feed._json = None
+
+    return feed
   ## }}}
 
   ## {{{ RssFeed.insert()
@@ -218,7 +342,7 @@ class RssFeed:
     now = time_now()
     values = (self._spec.name, self._spec.proper_name, self._spec.url, now, now)
 
-    #debug(f"executing: {sql}")
+    debug(f"executing: {sql}")
     cursor.execute(str(sql), values)
 
     dbd.commit()
@@ -234,6 +358,97 @@ class RssFeed:
 
 ## }}} ---- [ Classes ] ----------------------------------------------------------------------------
 
+## {{{ ---- [ Functions ] --------------------------------------------------------------------------
+
+## {{{ valid_feed_name()
+def valid_feed_name(name):
+  return isinstance(name, str) and _VALID_NAME_RE.fullmatch(name) is not None
+## }}}
+
+## {{{ valid_feed_proper_name()
+def valid_feed_proper_name(name):
+  return isinstance(name, str) and _VALID_PROPER_NAME_RE.fullmatch(name) is not None
+## }}}
+
+## {{{ normalize_feed_url()
+def normalize_feed_url(url):
+  # Return url in normal form, or None if it isn't a valid http(s) URL: the
+  # scheme and host are lower-cased (and IDNA encoded), default ports and
+  # fragments dropped, and characters URLs can't hold percent-encoded, so the
+  # same feed can't be added twice under different spellings
+  #
+  import ipaddress
+  import urllib.parse
+
+  if not isinstance(url, str):
+    return None
+
+  url = url.strip()
+  if _URL_INVALID_CHARS_RE.search(url):
+    return None
+
+  try:
+    parts = urllib.parse.urlsplit(url)
+    port = parts.port
+  except ValueError:
+    return None
+
+  scheme = parts.scheme.lower()
+  if scheme not in VALID_URL_SCHEMES or not parts.hostname:
+    return None
+
+  host = parts.hostname
+  if ':' in host:
+    # IPv6 addresses keep their brackets
+    try:
+      ipaddress.IPv6Address(host)
+    except ValueError:
+      return None
+    host = f'[{host}]'
+  else:
+    try:
+      host = host.encode('idna').decode('ascii')
+    except UnicodeError:
+      return None
+    # A fully qualified name's trailing dot is allowed
+    labels = host[:-1].split('.') if host.endswith('.') else host.split('.')
+    if not all(_HOST_LABEL_RE.fullmatch(label) for label in labels):
+      return None
+
+  if port is not None and port != VALID_URL_SCHEMES[scheme]:
+    host = f'{host}:{port}'
+
+  userinfo, _, _ = parts.netloc.rpartition('@')
+  netloc = f'{userinfo}@{host}' if userinfo else host
+
+  return urllib.parse.urlunsplit((
+    scheme,
+    netloc,
+    urllib.parse.quote(parts.path or '/', safe=_URL_SAFE_CHARS),
+    urllib.parse.quote(parts.query, safe=_URL_SAFE_CHARS),
+    ''
+  ))
+## }}}
+
+## {{{ validate_feed()
+def validate_feed(name, proper_name, url):
+  # Check a feed's name, proper name and URL, raising RssFeedError if any of
+  # them is invalid; returns the URL normalised
+  #
+  if not valid_feed_name(name):
+    raise RssFeedError(f"invalid feed name '{name}'")
+  if not valid_feed_proper_name(proper_name):
+    raise RssFeedError(f"invalid feed proper name '{proper_name}'")
+
+  normalized = normalize_feed_url(url)
+  if normalized is None:
+    raise RssFeedError(f"invalid feed URL '{url}'")
+
+  return normalized
+## }}}
+
+## }}} ---- [ Functions ] --------------------------------------------------------------------------
+
 ##
 # vim: ts=2 sw=2 tw=100 et fdm=marker :
 ##
@@ -0,0 +1,184 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+##
+# aggreg8.git:aggreg8/rss/parsers.py
+##
+
+## {{{ ---- [ Header ] -----------------------------------------------------------------------------
+
+##
+# Copyright (c) 2021 Francis M <francism@destinatech.com>
+#
+# This program is free software; you can redistribute it and/or modify it under
+# the terms of the GNU General Public License version 2.0 as published by the
+# Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE.  See the GNU General Public License for more
+# details.
+#
+# You should have received a copy of the GNU General Public License along with
+# this program; if not, write to:
+#
+#   Free Software Foundation
+#   51 Franklin Street, Fifth Floor
+#   Boston, MA 02110
+#   USA
+##
+
+## }}} ---- [ Header ] -----------------------------------------------------------------------------
+
+## {{{ ---- [ Imports ] ----------------------------------------------------------------------------
+
+from .. import debug
+
+from .entries import entry_to_tuple, normalize_entry
+
+from .stream import iter_entries
+
+from .errors import RssFeedError, RssParseError
+
+## }}} ---- [ Imports ] ----------------------------------------------------------------------------
+
+## {{{ ---- [ Globals ] ----------------------------------------------------------------------------
+
+# Parser backend objects used by parse_entries(), keyed by backend name
+_parsers = {}
+
+## }}} ---- [ Globals ] ----------------------------------------------------------------------------
+
+## {{{ ---- [ Functions ] --------------------------------------------------------------------------
+
+## {{{ parser_factory()
+def parser_factory(backend):
+  if backend == 'auto':
+    return AutoRssParser()
+  elif backend == 'native':
+    return NativeRssParser()
+  elif backend == 'feedparser':
+    return FeedparserRssParser()
+  else:
+    raise RssFeedError(f"invalid feed parser backend '{backend}'")
+## }}}
+
+## {{{ parse()
+def parse(content, backend='auto'):
+  return parser_factory(backend).parse(content)
+## }}}
+
+## {{{ parse_entries()
+def parse_entries(backend, content):
+  # Parser process entry point: entries are returned as plain tuples (see
+  # entry_to_tuple()), which are far cheaper to send back to the parent
+  # process than RssEntry objects
+  #
+  if backend not in _parsers:
+    _parsers[backend] = parser_factory(backend)
+
+  return [entry_to_tuple(entry) for entry in _parsers[backend].parse(content)]
+## }}}
+
+## }}} ---- [ Functions ] --------------------------------------------------------------------------
+
+## {{{ ---- [ Classes ] ----------------------------------------------------------------------------
+
+## {{{ class RssParser
+
+class RssParser:
+
+  """Base class for Aggreg8's feed parser backends"""
+
+  # Backend name, as accepted by parser_factory()
+  name = None
+
+  # Whether documents can be parsed as they download, through iter_entries()
+  streaming = False
+
+  # Parser backend object documents this one fails to parse are handed to,
+  # if any
+  fallback = None
+
+  ## {{{ RssParser.parse()
+  def parse(self, content):
+    # Return the list of normalised entries (see normalize_entry()) in the
+    # given feed document
+    raise NotImplementedError(f'{type(self).__name__}.parse()')
+  ## }}}
+
+## class RssParser }}}
+
+## {{{ class NativeRssParser
+
+class NativeRssParser(RssParser):
+
+  """Lean RSS 2.0/Atom 1.0 parser extracting only the entry fields we store"""
+
+  name = 'native'
+  streaming = True
+
+  ## {{{ NativeRssParser.parse()
+  def parse(self, content):
+    # Raises RssParseError for malformed documents and other feed formats
+    return list(iter_entries([content]))
+  ## }}}
+
+## class NativeRssParser }}}
+
+## {{{ class FeedparserRssParser
+
+class FeedparserRssParser(RssParser):
+
+  """Parser backend built on feedparser, slower but far more forgiving"""
+
+  name = 'feedparser'
+
+  ## {{{ FeedparserRssParser.parse()
+  def parse(self, content):
+    # Imported here as it's by far the heaviest of our dependencies, and the
+    # native parser handles most feeds without it
+    #
+    try:
+      import feedparser
+    except ImportError as ex:
+      raise RssParseError(f'feedparser backend unavailable: {ex}')
+
+    return [normalize_entry(entry) for entry in feedparser.parse(content).entries]
+  ## }}}
+
+## class FeedparserRssParser }}}
+
+## {{{ class AutoRssParser
+
+class AutoRssParser(RssParser):
+
+  """Native parser backend falling back to feedparser when it can't cope"""
+
+  name = 'auto'
+  streaming = True
+
+  native = None
+
+  ## {{{ AutoRssParser.__init__()
+  def __init__(self):
+    self.native = NativeRssParser()
+    self.fallback = FeedparserRssParser()
+  ## }}}
+
+  ## {{{ AutoRssParser.parse()
+  def parse(self, content):
+    try:
+      return self.native.parse(content)
+    except RssParseError:
+      debug(f"native parser failed, falling back to feedparser")
+      return self.fallback.parse(content)
+  ## }}}
+
+## class AutoRssParser }}}
+
+## }}} ---- [ Classes ] ----------------------------------------------------------------------------
+
+##
+# vim: ts=2 sw=2 tw=100 et fdm=marker :
+##
@@ -0,0 +1,771 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+##
+# aggreg8.git:aggreg8/rss/poll.py
+##
+
+## {{{ ---- [ Header ] -----------------------------------------------------------------------------
+
+##
+# Copyright (c) 2021 Francis M <francism@destinatech.com>
+#
+# This program is free software; you can redistribute it and/or modify it under
+# the terms of the GNU General Public License version 2.0 as published by the
+# Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE.  See the GNU General Public License for more
+# details.
+#
+# You should have received a copy of the GNU General Public License along with
+# this program; if not, write to:
+#
+#   Free Software Foundation
+#   51 Franklin Street, Fifth Floor
+#   Boston, MA 02110
+#   USA
+##
+
+## }}} ---- [ Header ] -----------------------------------------------------------------------------
+
+## {{{ ---- [ Imports ] ----------------------------------------------------------------------------
+
+import threading
+
+import multiprocessing
+
+import urllib.parse
+
+import concurrent.futures
+
+from .. import (
+  debug,
+  time_now,
+  warning,
+)
+
+from ..database import (
+  DEFAULT_BATCH_INTERVAL,
+  DEFAULT_BATCH_SIZE,
+  SqlStatement,
+  WriteBatch,
+)
+
+from ..metrics import NULL_METRICS, MetricsError
+
+from ..url import ACCEPT_ENCODING, HttpConnectionPool, UrlRequest, UrlRequestError
+
+from .entries import SQL_UPSERT_ENTRIES, entry_from_tuple, entry_key, upsert_entries
+
+from .cache import (
+  CACHE_COMPRESSIONS,
+  DEFAULT_CACHE_COMPRESSION,
+  SQL_INSERT_BLOB,
+  gc_blobs,
+  store_blob,
+)
+
+from .dedup import DEFAULT_DEDUP_THRESHOLD, DEFAULT_DEDUP_WINDOW, RssStoryIndex
+
+from .stream import iter_entries
+
+from .parsers import parse_entries, parser_factory
+
+from .errors import RssFeedError, RssParseError
+
+## }}} ---- [ Imports ] ----------------------------------------------------------------------------
+
+## {{{ ---- [ Constants ] --------------------------------------------------------------------------
+
+# Default maximum number of feeds fetched concurrently
+DEFAULT_POLL_WORKERS = 16
+
+# Default maximum number of feeds fetched concurrently from the same host
+DEFAULT_POLL_HOST_WORKERS = 2
+
+# Default feed request timeout, in seconds
+DEFAULT_POLL_TIMEOUT = 30
+
+# Default (decoded) size above which feeds are parsed as they download
+DEFAULT_POLL_STREAM_THRESHOLD = 4 * 1024 * 1024
+
+# Default feed parser backend
+DEFAULT_POLL_PARSER = 'auto'
+
+# Default number of feed parser processes (0 to parse in the writer thread)
+DEFAULT_POLL_PARSE_WORKERS = 0
+
+# Whether new entries are clustered into stories by default
+DEFAULT_POLL_DEDUP = True
+
+# Number of a feed's most recent stored entries a streamed parse looks out for
+# to stop early
+STREAM_SEEN_ENTRIES = 16
+
+## }}} ---- [ Constants ] --------------------------------------------------------------------------
+
+## {{{ ---- [ Statements ] -------------------------------------------------------------------------
+
+# Statements are built once, here, keeping string building off the poll path
+
+SQL_SELECT_CACHE = SqlStatement(
+  'SELECT',
+  'etag, last_modified, content_hash',
+  'FROM',
+  'rss_feed_cache',
+  'WHERE',
+  'feed_id=?'
+)
+
+SQL_SELECT_SEEN = SqlStatement(
+  'SELECT',
+  'entry_key',
+  'FROM',
+  'rss_entries',
+  'WHERE',
+  'feed_id=?',
+  'ORDER BY',
+  'published DESC',
+  'LIMIT',
+  str(STREAM_SEEN_ENTRIES)
+)
+
+## Columns:
+#
+# 0 = id
+# 1 = feed_id
+# 2 = url
+# 3 = date_added
+# 4 = last_updated
+# 5 = content_hash
+# 6 = etag
+# 7 = last_modified
+#
+
+_CACHE_COLUMNS = 'feed_id, url, date_added, last_updated, content_hash, etag, last_modified'
+
+SQL_UPSERT_CACHE = SqlStatement(
+  'INSERT INTO',
+  'rss_feed_cache',
+  f'({_CACHE_COLUMNS})',
+  'VALUES(?, ?, ?, ?, ?, ?, ?)',
+  'ON CONFLICT (feed_id) DO UPDATE SET',
+  'url=excluded.url,',
+  'last_updated=excluded.last_updated,',
+  'content_hash=excluded.content_hash,',
+  'etag=excluded.etag,',
+  'last_modified=excluded.last_modified'
+)
+
+SQL_TOUCH_CACHE = SqlStatement(
+  'UPDATE',
+  'rss_feed_cache',
+  'SET',
+  'last_updated=?,',
+  'etag=COALESCE(?, etag),',
+  'last_modified=COALESCE(?, last_modified)',
+  'WHERE',
+  'feed_id=?'
+)
+
+SQL_UPDATE_POLLED = SqlStatement(
+  'UPDATE',
+  'rss_feeds',
+  'SET',
+  'last_updated=?,',
+  'next_due=?+update_interval',
+  'WHERE',
+  'id=?'
+)
+
+# Statements polled feeds are written out with, in the order the write batch
+# runs them: blobs go in before the cache rows referencing them, whose
+# triggers count the references
+#
+SQL_BATCH_ORDER = tuple(str(sql) for sql in (
+  SQL_INSERT_BLOB,
+  SQL_UPSERT_CACHE,
+  SQL_TOUCH_CACHE,
+  SQL_UPSERT_ENTRIES,
+  SQL_UPDATE_POLLED,
+))
+
+## }}} ---- [ Statements ] -------------------------------------------------------------------------
+
+## {{{ ---- [ Classes ] ----------------------------------------------------------------------------
+
+## {{{ class RssPoller
+
+class RssPoller:
+
+  """Concurrent RSS feed poller"""
+
+  # Database driver object implementing aggreg8.database.Database
+  dbd = None
+
+  # Maximum number of concurrent fetches, overall and per host
+  workers = None
+  host_workers = None
+
+  # Feed request timeout, in seconds
+  timeout = None
+
+  # (Decoded) size above which feeds are parsed as they download
+  stream_threshold = None
+
+  # Feed parser backend object implementing aggreg8.rss.RssParser
+  parser = None
+
+  # Number of feed parser processes
+  parse_workers = None
+
+  # HTTP connection pool object (aggreg8.url.HttpConnectionPool) feeds are
+  # fetched through
+  pool = None
+
+  # How the cached copy of each feed is stored (see CACHE_COMPRESSIONS)
+  cache_compression = None
+
+  # Write batch (aggreg8.database.WriteBatch) polled feeds are stored through
+  batch = None
+
+  # Story index (aggreg8.rss.RssStoryIndex) new entries are clustered with,
+  # or None if deduplication is disabled
+  stories = None
+
+  # Metrics object (aggreg8.metrics.Metrics) stage timings and counters are
+  # recorded on, written out at the end of every poll
+  metrics = None
+
+  # Per-host semaphores, keyed by lower-cased network location
+  _host_sems = None
+
+  # Feed parser process pool, created on first use
+  _parse_executor = None
+
+  ## {{{ RssPoller.__init__()
+  def __init__(self, dbd, workers=DEFAULT_POLL_WORKERS, host_workers=DEFAULT_POLL_HOST_WORKERS,
+      timeout=DEFAULT_POLL_TIMEOUT, stream_threshold=DEFAULT_POLL_STREAM_THRESHOLD,
+      parser=DEFAULT_POLL_PARSER, parse_workers=DEFAULT_POLL_PARSE_WORKERS, pool=None,
+      batch_size=DEFAULT_BATCH_SIZE, batch_interval=DEFAULT_BATCH_INTERVAL,
+      cache_compression=DEFAULT_CACHE_COMPRESSION, dedup=DEFAULT_POLL_DEDUP,
+      dedup_threshold=DEFAULT_DEDUP_THRESHOLD, dedup_window=DEFAULT_DEDUP_WINDOW,
+      metrics=None):
+    if workers < 1:
+      raise RssFeedError(f"invalid number of poll workers '{workers}'")
+    if host_workers < 1:
+      raise RssFeedError(f"invalid number of per-host poll workers '{host_workers}'")
+    if parse_workers < 0:
+      raise RssFeedError(f"invalid number of parse workers '{parse_workers}'")
+    if batch_size < 1:
+      raise RssFeedError(f"invalid write batch size '{batch_size}'")
+    if cache_compression not in CACHE_COMPRESSIONS:
+      raise RssFeedError(f"invalid cache compression '{cache_compression}'")
+
+    self.dbd = dbd
+    self.workers = workers
+    self.host_workers = host_workers
+    self.timeout = timeout
+    self.stream_threshold = stream_threshold
+    self.parser = parser_factory(parser)
+    self.parse_workers = parse_workers
+    self.cache_compression = cache_compression
+
+    self.pool = pool
+    if self.pool is None:
+      self.pool = HttpConnectionPool()
+
+    self.metrics = metrics
+    if self.metrics is None:
+      self.metrics = NULL_METRICS
+
+    # Feeds are written out in batches rather than a transaction each, see
+    # _store()
+    self.batch = WriteBatch(dbd, size=batch_size, interval=batch_interval, metrics=self.metrics,
+      order=SQL_BATCH_ORDER)
+
+    if dedup:
+      self.stories = RssStoryIndex(dbd, threshold=dedup_threshold, window=dedup_window)
+
+    self._host_sems = {}
+  ## }}}
+
+  ## {{{ RssPoller.poll()
+  def poll(self, feeds):
+    # Feeds are expected to be due already (see RssFeed.due()); look up what
+    # we have cached for them in the calling thread: worker threads only ever
+    # touch the network, leaving this thread as the sole user (and thus the
+    # single writer) of the database connection
+    #
+    due = []
+    for feed in feeds:
+      cache = self._cache(feed)
+      if cache is None:
+        due.append((feed, cache, set()))
+      else:
+        due.append((feed, cache, self._seen(feed)))
+
+    if len(due) < 1:
+      return 0
+
+    for feed, cache, seen in due:
+      host = self._host(feed)
+      if host not in self._host_sems:
+        self._host_sems[host] = threading.BoundedSemaphore(self.host_workers)
+
+    workers = min(self.workers, len(due))
+
+    parse_pool = self._parse_pool()
+
+    try:
+      polled = self._poll(due, workers, parse_pool)
+    finally:
+      # Whatever happens, write out what's been polled so far; only then,
+      # with every reference counted, drop the cached copies it replaced, in
+      # a transaction of its own
+      #
+      self.batch.flush()
+
+      gc_blobs(self.dbd)
+      self.dbd.commit()
+
+      try:
+        self.metrics.write()
+      except MetricsError as ex:
+        warning(f'{ex}')
+
+    return polled
+  ## }}}
+
+  ## {{{ RssPoller._poll()
+  def _poll(self, due, workers, parse_pool):
+    polled = 0
+
+    # Downloaded feeds are handed to a pool of parser processes (if any), the
+    # results of which come back to this thread to be written out
+    #
+    fetching = {}
+    parsing = {}
+
+    with concurrent.futures.ThreadPoolExecutor(max_workers=workers) as executor:
+      for feed, cache, seen in self._interleave(due):
+        fetching[executor.submit(self._fetch, feed, cache)] = (feed, cache, seen)
+
+      pending = set(fetching)
+      while len(pending) > 0:
+        done, pending = concurrent.futures.wait(pending,
+          return_when=concurrent.futures.FIRST_COMPLETED)
+
+        for future in done:
+          if future in parsing:
+            feed, response, start = parsing.pop(future)
+            metrics = self.metrics.feed(feed.get('name'))
+
+            # Parsed in another process: this includes the time spent
+            # queueing for it. Should the process itself fail (or the
+            # document or its entries not survive being sent across), the
+            # feed is parsed here instead.
+            #
+            try:
+              entries = [entry_from_tuple(entry) for entry in future.result()]
+              metrics.time('parse', start)
+            except RssFeedError as ex:
+              warning(f"feed '{feed.get('name')}': {ex}")
+              metrics.count('errors')
+              continue
+            except Exception as ex:
+              warning(f"feed '{feed.get('name')}': parser process failed: {ex!r}")
+              if isinstance(ex, concurrent.futures.BrokenExecutor):
+                parse_pool = self._drop_parse_pool()
+
+              entries = self._parse(feed, response)
+              if entries is None:
+                continue
+
+            self._store(feed, response, entries)
+            polled += 1
+            continue
+
+          feed, cache, seen = fetching.pop(future)
+          metrics = self.metrics.feed(feed.get('name'))
+
+          try:
+            response, streamed = future.result()
+          except (UrlRequestError, RssFeedError) as ex:
+            warning(f"feed '{feed.get('name')}': fetch failed: {ex}")
+            metrics.count('errors')
+            continue
+
+          debug(f"feed '{feed.get('name')}' returned HTTP status code {response.status}")
+          if response.status == 304:
+            metrics.count('not_modified')
+            self._touch(feed, response)
+            polled += 1
+            continue
+          elif response.status != 200:
+            # Other 2xx codes (e.g. 204 No Content) have no feed to parse
+            warning(f"feed '{feed.get('name')}': unexpected HTTP status code {response.status}")
+            metrics.count('errors')
+            continue
+
+          metrics.count('fetched')
+
+          if streamed is not None:
+            if self._stream(feed, cache, seen, response, streamed):
+              polled += 1
+            continue
+
+          # Servers ignoring conditional requests still often return the exact
+          # same body: if so, there's nothing to parse or rewrite
+          #
+          content_hash = f'{response.content_hash_alg}:{response.content_hash}'
+          if cache is not None and cache['content_hash'] == content_hash:
+            debug(f"feed '{feed.get('name')}' content unchanged ({content_hash})")
+            metrics.count('cache_hits')
+            self._touch(feed, response)
+            polled += 1
+            continue
+
+          if parse_pool is not None:
+            start = metrics.clock()
+            try:
+              future = parse_pool.submit(parse_entries, self.parser.name, response.content)
+            except concurrent.futures.BrokenExecutor as ex:
+              warning(f"feed '{feed.get('name')}': parser process failed: {ex!r}")
+              parse_pool = self._drop_parse_pool()
+            else:
+              parsing[future] = (feed, response, start)
+              pending.add(future)
+              continue
+
+          entries = self._parse(feed, response)
+          if entries is None:
+            continue
+
+          self._store(feed, response, entries)
+          polled += 1
+
+    return polled
+  ## }}}
+
+  ## {{{ RssPoller.close()
+  def close(self):
+    if self._parse_executor is not None:
+      self._parse_executor.shutdown()
+      self._parse_executor = None
+  ## }}}
+
+  ## {{{ RssPoller._parse_pool()
+  def _parse_pool(self):
+    if self.parse_workers < 1:
+      return None
+
+    # Worker processes are spawned rather than forked as the fetch threads
+    # are already running by the time the first of them starts; they're
+    # started on demand and kept until close() so long-running pollers don't
+    # pay for spawning them on every poll
+    #
+    if self._parse_executor is None:
+      self._parse_executor = concurrent.futures.ProcessPoolExecutor(
+        max_workers=self.parse_workers,
+        mp_context=multiprocessing.get_context('spawn')
+      )
+
+    return self._parse_executor
+  ## }}}
+
+  ## {{{ RssPoller._drop_parse_pool()
+  def _drop_parse_pool(self):
+    # A pool whose process died can't take any more work: let the rest of
+    # the poll parse in this thread, and the next one start a new pool
+    #
+    if self._parse_executor is not None:
+      self._parse_executor.shutdown(wait=False, cancel_futures=True)
+      self._parse_executor = None
+
+    return None
+  ## }}}
+
+  ## {{{ RssPoller._parse()
+  def _parse(self, feed, response):
+    # Parse a feed in this thread, returning its entries or None if it can't
+    # be parsed
+    metrics = self.metrics.feed(feed.get('name'))
+
+    start = metrics.clock()
+    try:
+      entries = self.parser.parse(response.content)
+    except RssFeedError as ex:
+      warning(f"feed '{feed.get('name')}': {ex}")
+      metrics.count('errors')
+      return None
+    metrics.time('parse', start)
+
+    return entries
+  ## }}}
+
+  ## {{{ RssPoller._host()
+  def _host(self, feed):
+    return urllib.parse.urlsplit(feed.get('url')).netloc.lower()
+  ## }}}
+
+  ## {{{ RssPoller._interleave()
+  def _interleave(self, due):
+    # Order feeds round-robin by host so that feeds sharing a host are spread
+    # across the run instead of queueing up behind its semaphore and starving
+    # the pool of workers
+    #
+    by_host = {}
+    for item in due:
+      by_host.setdefault(self._host(item[0]), []).append(item)
+
+    queues = list(by_host.values())
+    while len(queues) > 0:
+      for queue in queues:
+        yield queue.pop(0)
+      queues = [queue for queue in queues if len(queue) > 0]
+  ## }}}
+
+  ## {{{ RssPoller._cache()
+  def _cache(self, feed):
+    cursor = self.dbd.cursor()
+
+    sql = SQL_SELECT_CACHE
+
+    debug(f"executing: {sql}")
+    return cursor.execute(str(sql), (feed.get('id'),)).fetchone()
+  ## }}}
+
+  ## {{{ RssPoller._seen()
+  def _seen(self, feed):
+    sql = SQL_SELECT_SEEN
+
+    debug(f"executing: {sql}")
+    return set(row[0] for row in self.dbd.execute(str(sql), (feed.get('id'),)))
+  ## }}}
+
+  ## {{{ RssPoller._fetch()
+  def _fetch(self, feed, cache):
+    # NOTE: runs in a worker thread, so must not touch self.dbd
+    headers = {'Accept-Encoding': ACCEPT_ENCODING}
+    metrics = self.metrics.feed(feed.get('name'))
+
+    # Make the request conditional if we have validators from the last poll
+    if cache is not None:
+      if cache['etag'] is not None:
+        headers['If-None-Match'] = cache['etag']
+      if cache['last_modified'] is not None:
+        headers['If-Modified-Since'] = cache['last_modified']
+
+    with self._host_sems[self._host(feed)]:
+      response = UrlRequest(feed.get('url'), headers=headers, timeout=self.timeout, stream=True,
+        pool=self.pool, keep_raw=self.cache_compression == 'wire', metrics=metrics)
+      if response.status != 200:
+        response.close()
+        return response, None
+
+      if not self.parser.streaming:
+        response.read()
+        return response, None
+
+      # Large feeds are left to the writer thread to parse as they download
+      # (see _stream()), flagged by the time already spent reading them: those
+      # whose Content-Length says so are left unread, others (compressed, or
+      # of unknown length) are read until their decoded size does
+      #
+      if response.length is not None and response.length > self.stream_threshold:
+        return response, 0.0
+
+      start = metrics.clock()
+      if response.read(self.stream_threshold) is None:
+        return response, metrics.clock() - start
+
+      return response, None
+  ## }}}
+
+  ## {{{ RssPoller._stream()
+  def _stream(self, feed, cache, seen, response, read):
+    # Parse a large feed as it downloads rather than holding the whole
+    # document in memory, queueing its entries on self.batch as they come in;
+    # parsing stops as soon as we get to an entry we've already stored, the
+    # rest of the body only being downloaded to hash it. Returns whether the
+    # feed was polled.
+    #
+    # Runs in the writer thread, as it writes as it goes; the feed's host
+    # slot was given back once the response started, so large feeds can go
+    # over the per-host limit. Parse time is what's left once the time spent
+    # downloading, decompressing, hashing and writing is taken out; the time
+    # spent reading the body before it was handed over (read seconds, not
+    # recorded until it's been read in full) isn't part of it.
+    #
+    metrics = self.metrics.feed(feed.get('name'))
+    start = metrics.clock()
+    excluded = metrics.elapsed('download', 'decompress', 'hash') \
+      + self.metrics.elapsed('db_write') + read
+
+    now = time_now()
+
+    error = None
+
+    chunks = response.iter_content(keep_raw=False)
+    try:
+      entries = iter_entries(chunks, lambda entry: entry_key(entry) in seen)
+      upsert_entries(self.dbd, feed.get('id'), entries, now, self.batch, self.stories)
+
+      for chunk in chunks:
+        pass
+    except RssParseError as ex:
+      error = ex
+    except UrlRequestError as ex:
+      warning(f"feed '{feed.get('name')}': fetch failed: {ex}")
+      metrics.count('errors')
+      return False
+    finally:
+      chunks.close()
+      response.close()
+
+    # Not something the native parser copes with: fetch the feed again, in
+    # full, for the configured backend's fallback (if any)
+    #
+    if error is not None:
+      if self.parser.fallback is None:
+        warning(f"feed '{feed.get('name')}': {error}")
+        metrics.count('errors')
+        return False
+
+      debug(f"feed '{feed.get('name')}': {error}, falling back to {self.parser.fallback.name}")
+      return self._refetch(feed)
+
+    excluded = metrics.elapsed('download', 'decompress', 'hash') \
+      + self.metrics.elapsed('db_write') - excluded
+    metrics.time('parse', start, excluded)
+
+    # Only now that the body has been downloaded in full is its hash known:
+    # if it's the same as last time, there's nothing else to rewrite
+    #
+    content_hash = f'{response.content_hash_alg}:{response.content_hash}'
+    if cache is not None and cache['content_hash'] == content_hash:
+      debug(f"feed '{feed.get('name')}' content unchanged ({content_hash})")
+      metrics.count('cache_hits')
+      self._touch(feed, response)
+      return True
+
+    self._store(feed, response)
+    return True
+  ## }}}
+
+  ## {{{ RssPoller._refetch()
+  def _refetch(self, feed):
+    # Fetch a feed in full and parse it with the parser backend's fallback,
+    # returning whether it was polled
+    metrics = self.metrics.feed(feed.get('name'))
+    headers = {'Accept-Encoding': ACCEPT_ENCODING}
+
+    try:
+      with self._host_sems[self._host(feed)]:
+        response = UrlRequest(feed.get('url'), headers=headers, timeout=self.timeout, stream=True,
+          pool=self.pool, keep_raw=self.cache_compression == 'wire', metrics=metrics)
+        if response.status != 200:
+          response.close()
+          raise UrlRequestError(f'HTTP status code {response.status}')
+        response.read()
+
+      start = metrics.clock()
+      entries = self.parser.fallback.parse(response.content)
+      metrics.time('parse', start)
+    except (UrlRequestError, RssFeedError) as ex:
+      warning(f"feed '{feed.get('name')}': {ex}")
+      metrics.count('errors')
+      return False
+
+    self._store(feed, response, entries)
+    return True
+  ## }}}
+
+  ## {{{ RssPoller._store()
+  def _store(self, feed, response, entries=None):
+    # Writes are queued on self.batch, which commits them along with those of
+    # other feeds once it fills up (or at the end of the poll); any commit
+    # that happens on the way is timed as db_write rather than serialize.
+    # Entries of streamed feeds are queued as they're parsed (see _stream()),
+    # so aren't given.
+    #
+    metrics = self.metrics.feed(feed.get('name'))
+    start = metrics.clock()
+    flushed = self.metrics.elapsed('db_write')
+
+    # Replace the cached copy of the feed, if any
+    sql = SQL_UPSERT_CACHE
+
+    content_hash = ''
+    if response.content_hash is not None:
+      content_hash = f'{response.content_hash_alg}:{response.content_hash}'
+
+    now = time_now()
+
+    # The body goes in the blob store, where identical bodies are only stored
+    # once; the cache row only references it by hash
+    #
+    store_blob(self.dbd, content_hash, response, self.cache_compression, now, self.batch)
+
+    values = (
+      feed.get('id'),
+      feed.get('url'),
+      now,
+      now,
+      content_hash,
+      response.etag,
+      response.last_modified,
+    )
+
+    debug(f"executing: {sql}")
+    self.batch.execute(str(sql), values)
+
+    if entries is not None:
+      upsert_entries(self.dbd, feed.get('id'), entries, now, self.batch, self.stories)
+
+    metrics.time('serialize', start, self.metrics.elapsed('db_write') - flushed)
+
+    self._polled(feed, now)
+  ## }}}
+
+  ## {{{ RssPoller._touch()
+  def _touch(self, feed, response):
+    # The feed hasn't changed since the last poll: just record that we've
+    # checked it (along with any new validators), leaving the cached content
+    # and the feed's entries as they are
+    #
+    sql = SQL_TOUCH_CACHE
+
+    now = time_now()
+    values = (now, response.etag, response.last_modified, feed.get('id'))
+
+    debug(f"executing: {sql}")
+    self.batch.execute(str(sql), values)
+
+    self._polled(feed, now)
+  ## }}}
+
+  ## {{{ RssPoller._polled()
+  def _polled(self, feed, now):
+    # Record when the feed was polled, and so when it's next due
+    sql = SQL_UPDATE_POLLED
+
+    values = (now, now, feed.get('id'))
+
+    debug(f"executing: {sql}")
+    self.batch.execute(str(sql), values)
+
+    feed.set('last_updated', now)
+    feed.set('next_due', now + feed.get('update_interval'))
+  ## }}}
+
+## class RssPoller }}}
+
+## }}} ---- [ Classes ] ----------------------------------------------------------------------------
+
+##
+# vim: ts=2 sw=2 tw=100 et fdm=marker :
+##
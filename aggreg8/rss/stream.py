@@ -0,0 +1,171 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+##
+# aggreg8.git:aggreg8/rss/stream.py
+##
+
+## {{{ ---- [ Header ] -----------------------------------------------------------------------------
+
+##
+# Copyright (c) 2021 Francis M <francism@destinatech.com>
+#
+# This program is free software; you can redistribute it and/or modify it under
+# the terms of the GNU General Public License version 2.0 as published by the
+# Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE.  See the GNU General Public License for more
+# details.
+#
+# You should have received a copy of the GNU General Public License along with
+# this program; if not, write to:
+#
+#   Free Software Foundation
+#   51 Franklin Street, Fifth Floor
+#   Boston, MA 02110
+#   USA
+##
+
+## }}} ---- [ Header ] -----------------------------------------------------------------------------
+
+## {{{ ---- [ Imports ] ----------------------------------------------------------------------------
+
+import datetime
+
+import email.utils
+
+import xml.etree.ElementTree as ElementTree
+
+from .entries import RssEntry
+
+from .errors import RssParseError
+
+## }}} ---- [ Imports ] ----------------------------------------------------------------------------
+
+## {{{ ---- [ Constants ] --------------------------------------------------------------------------
+
+# XML namespaces
+ATOM_NS = '{http://www.w3.org/2005/Atom}'
+DC_NS = '{http://purl.org/dc/elements/1.1/}'
+
+# Tags of the supported document elements (RSS 2.0 and Atom 1.0)
+ROOT_TAGS = ('rss', f'{ATOM_NS}feed')
+
+# Tags of the elements holding individual entries
+ENTRY_TAGS = ('item', f'{ATOM_NS}entry')
+
+## }}} ---- [ Constants ] --------------------------------------------------------------------------
+
+## {{{ ---- [ Functions ] --------------------------------------------------------------------------
+
+## {{{ parse_date()
+def parse_date(value):
+  if not value:
+    return None
+
+  value = value.strip()
+
+  # RSS uses RFC 822 dates, Atom (and Dublin Core) RFC 3339 ones
+  try:
+    date = email.utils.parsedate_to_datetime(value)
+  except (TypeError, ValueError):
+    try:
+      date = datetime.datetime.fromisoformat(value)
+    except ValueError:
+      return None
+
+  if date.tzinfo is None:
+    date = date.replace(tzinfo=datetime.timezone.utc)
+
+  return int(date.timestamp())
+## }}}
+
+## {{{ _text()
+def _text(elem, tag):
+  child = elem.find(tag)
+  if child is None or child.text is None:
+    return None
+  return child.text.strip()
+## }}}
+
+## {{{ _atom_link()
+def _atom_link(elem):
+  for link in elem.iterfind(f'{ATOM_NS}link'):
+    if link.get('rel', 'alternate') == 'alternate':
+      return link.get('href')
+  return None
+## }}}
+
+## {{{ entry_from_element()
+def entry_from_element(elem):
+  if elem.tag == 'item':
+    return RssEntry(
+      _text(elem, 'guid'),
+      _text(elem, 'link'),
+      _text(elem, 'title'),
+      _text(elem, 'description'),
+      parse_date(_text(elem, 'pubDate') or _text(elem, f'{DC_NS}date'))
+    )
+
+  return RssEntry(
+    _text(elem, f'{ATOM_NS}id'),
+    _atom_link(elem),
+    _text(elem, f'{ATOM_NS}title'),
+    _text(elem, f'{ATOM_NS}summary') or _text(elem, f'{ATOM_NS}content'),
+    parse_date(_text(elem, f'{ATOM_NS}published') or _text(elem, f'{ATOM_NS}updated'))
+  )
+## }}}
+
+## {{{ iter_entries()
+def iter_entries(chunks, stop=None):
+  # Incrementally parse an RSS 2.0/Atom 1.0 document fed to us as an iterable
+  # of byte chunks, yielding normalised entries as soon as each is complete
+  #
+  # Every entry is detached from the tree once yielded, so memory use is
+  # bounded by the chunk size and the size of the largest entry rather than
+  # that of the document. If given, stop() is called with each entry and
+  # parsing ends as soon as it returns True (e.g. upon reaching an entry
+  # that's already been seen), without consuming the rest of the document.
+  #
+  parser = ElementTree.XMLPullParser(events=('start', 'end'))
+  parents = []
+
+  try:
+    for chunk in chunks:
+      parser.feed(chunk)
+
+      for event, elem in parser.read_events():
+        if event == 'start':
+          # Anything but RSS 2.0 or Atom 1.0 (RSS 1.0/RDF etc) is left to
+          # feedparser
+          if len(parents) == 0 and elem.tag not in ROOT_TAGS:
+            raise RssParseError(f"unsupported feed format '{elem.tag}'")
+
+          parents.append(elem)
+          continue
+
+        parents.pop()
+        if elem.tag not in ENTRY_TAGS:
+          continue
+
+        entry = entry_from_element(elem)
+        if len(parents) > 0:
+          parents[-1].remove(elem)
+
+        if stop is not None and stop(entry):
+          return
+
+        yield entry
+
+    parser.close()
+  except ElementTree.ParseError as ex:
+    raise RssParseError(f'failed to parse feed: {ex}')
+## }}}
+
+## }}} ---- [ Functions ] --------------------------------------------------------------------------
+
+##
+# vim: ts=2 sw=2 tw=100 et fdm=marker :
+##
@@ -30,9 +30,19 @@
 
 ## }}} ---- [ Header ] -----------------------------------------------------------------------------
 
-from .main import *
+from .. import lazy_getattr
+
 from .errors import *
 
+# urllib.request, http.client, ssl and the optional decompression modules are
+# only imported once something asks for them
+#
+__getattr__ = lazy_getattr(__name__, globals(), [
+  'decoders',
+  'main',
+  'pool',
+])
+
 ##
 # vim: ts=2 sw=2 tw=100 et fdm=marker :
 ##
@@ -0,0 +1,317 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+##
+# aggreg8.git:aggreg8/url/decoders.py
+##
+
+## {{{ ---- [ Header ] -----------------------------------------------------------------------------
+
+##
+# Copyright (c) 2021 Francis M <francism@destinatech.com>
+#
+# This program is free software; you can redistribute it and/or modify it under
+# the terms of the GNU General Public License version 2.0 as published by the
+# Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE.  See the GNU General Public License for more
+# details.
+#
+# You should have received a copy of the GNU General Public License along with
+# this program; if not, write to:
+#
+#   Free Software Foundation
+#   51 Franklin Street, Fifth Floor
+#   Boston, MA 02110
+#   USA
+##
+
+## }}} ---- [ Header ] -----------------------------------------------------------------------------
+
+## {{{ ---- [ Imports ] ----------------------------------------------------------------------------
+
+import zlib
+
+from .errors import UrlRequestError
+
+# Optional brotli/zstd support
+try:
+  import brotli
+except ImportError:
+  brotli = None
+
+try:
+  import zstandard
+except ImportError:
+  zstandard = None
+
+## }}} ---- [ Imports ] ----------------------------------------------------------------------------
+
+## {{{ ---- [ Constants ] --------------------------------------------------------------------------
+
+# Supported content codings, in order of preference
+CONTENT_ENCODINGS = ['gzip', 'deflate'] \
+  + (['br'] if brotli is not None else []) \
+  + (['zstd'] if zstandard is not None else [])
+
+# Value for the Accept-Encoding request header
+ACCEPT_ENCODING = ', '.join(CONTENT_ENCODINGS)
+
+## }}} ---- [ Constants ] --------------------------------------------------------------------------
+
+## {{{ ---- [ Functions ] --------------------------------------------------------------------------
+
+## {{{ decoder_factory()
+def decoder_factory(encoding):
+  # Content-Encoding lists codings in the order they were applied, so they
+  # need undoing in reverse
+  #
+  codings = []
+  if encoding is not None:
+    codings = [coding.strip().lower() for coding in encoding.split(',')]
+    codings = [coding for coding in codings if coding not in ['', 'identity']]
+
+  decoders = []
+  for coding in reversed(codings):
+    if coding in ['gzip', 'x-gzip']:
+      decoders.append(GzipDecoder())
+    elif coding == 'deflate':
+      decoders.append(DeflateDecoder())
+    elif coding == 'br' and brotli is not None:
+      decoders.append(BrotliDecoder())
+    elif coding == 'zstd' and zstandard is not None:
+      decoders.append(ZstdDecoder())
+    else:
+      raise UrlRequestError(f"unsupported content-encoding type '{coding}'")
+
+  if len(decoders) == 0:
+    return IdentityDecoder()
+  elif len(decoders) == 1:
+    return decoders[0]
+  else:
+    return ChainedDecoder(decoders)
+## }}}
+
+## }}} ---- [ Functions ] --------------------------------------------------------------------------
+
+## {{{ ---- [ Classes ] ----------------------------------------------------------------------------
+
+## {{{ class ContentDecoder
+
+class ContentDecoder:
+
+  """Base class for Aggreg8's content decoders"""
+
+  ## {{{ ContentDecoder.decode()
+  def decode(self, data, max_length):
+    # Yield the decoded form of data, in chunks of at most max_length bytes
+    # where the underlying decompressor allows bounding its output
+    raise NotImplementedError(f'{type(self).__name__}.decode()')
+  ## }}}
+
+  ## {{{ ContentDecoder.flush()
+  def flush(self):
+    return b''
+  ## }}}
+
+## class ContentDecoder }}}
+
+## {{{ class IdentityDecoder
+
+class IdentityDecoder(ContentDecoder):
+
+  ## {{{ IdentityDecoder.decode()
+  def decode(self, data, max_length):
+    # Callers may hand us a view of a buffer they'll reuse, so copy it
+    yield bytes(data)
+  ## }}}
+
+## class IdentityDecoder }}}
+
+## {{{ class ZlibDecoder
+
+class ZlibDecoder(ContentDecoder):
+
+  _wbits = None
+  _decompressor = None
+
+  ## {{{ ZlibDecoder.__init__()
+  def __init__(self, wbits):
+    self._wbits = wbits
+    self._decompressor = zlib.decompressobj(wbits)
+  ## }}}
+
+  ## {{{ ZlibDecoder.decode()
+  def decode(self, data, max_length):
+    try:
+      while data:
+        yield self._decompressor.decompress(data, max_length)
+        data = self._decompressor.unconsumed_tail
+
+        # Concatenated streams (e.g. multi-member gzip files): start over
+        # with whatever follows the end of the current one. Trailing NUL
+        # padding (e.g. from tape or block-padded writes) is skipped, as
+        # gzip does; it may arrive in a later chunk than the end of stream.
+        #
+        if self._decompressor.eof and self._decompressor.unused_data:
+          data = self._decompressor.unused_data.lstrip(b'\0')
+          if data:
+            self._decompressor = zlib.decompressobj(self._wbits)
+    except zlib.error as ex:
+      raise UrlRequestError(f'failed to decompress response: {ex}')
+  ## }}}
+
+  ## {{{ ZlibDecoder.flush()
+  def flush(self):
+    try:
+      data = self._decompressor.flush()
+    except zlib.error as ex:
+      raise UrlRequestError(f'failed to decompress response: {ex}')
+
+    if not self._decompressor.eof:
+      raise UrlRequestError('failed to decompress response: truncated stream')
+
+    return data
+  ## }}}
+
+## class ZlibDecoder }}}
+
+## {{{ class GzipDecoder
+
+class GzipDecoder(ZlibDecoder):
+
+  ## {{{ GzipDecoder.__init__()
+  def __init__(self):
+    super().__init__(16 + zlib.MAX_WBITS)
+  ## }}}
+
+## class GzipDecoder }}}
+
+## {{{ class DeflateDecoder
+
+class DeflateDecoder(ZlibDecoder):
+
+  # Leading bytes seen before the stream format could be determined
+  _head = None
+
+  ## {{{ DeflateDecoder.__init__()
+  def __init__(self):
+    # "deflate" is meant to be zlib-wrapped (RFC 1950), but plenty of
+    # servers send raw deflate data (RFC 1951): tell them apart by whether
+    # the first two bytes make a valid zlib header
+    #
+    self._head = b''
+  ## }}}
+
+  ## {{{ DeflateDecoder.decode()
+  def decode(self, data, max_length):
+    if self._decompressor is None:
+      self._head += bytes(data)
+      if len(self._head) < 2:
+        return
+
+      cmf, flg = self._head[0], self._head[1]
+      if cmf & 0x0f == 8 and (cmf << 8 | flg) % 31 == 0:
+        super().__init__(zlib.MAX_WBITS)
+      else:
+        super().__init__(-zlib.MAX_WBITS)
+
+      data, self._head = self._head, None
+
+    yield from super().decode(data, max_length)
+  ## }}}
+
+  ## {{{ DeflateDecoder.flush()
+  def flush(self):
+    if self._decompressor is None:
+      raise UrlRequestError('failed to decompress response: truncated deflate stream')
+    return super().flush()
+  ## }}}
+
+## class DeflateDecoder }}}
+
+## {{{ class BrotliDecoder
+
+class BrotliDecoder(ContentDecoder):
+
+  _decompressor = None
+
+  ## {{{ BrotliDecoder.__init__()
+  def __init__(self):
+    self._decompressor = brotli.Decompressor()
+  ## }}}
+
+  ## {{{ BrotliDecoder.decode()
+  def decode(self, data, max_length):
+    try:
+      yield self._decompressor.process(bytes(data))
+    except brotli.error as ex:
+      raise UrlRequestError(f'failed to decompress response: {ex}')
+  ## }}}
+
+## class BrotliDecoder }}}
+
+## {{{ class ZstdDecoder
+
+class ZstdDecoder(ContentDecoder):
+
+  _decompressor = None
+
+  ## {{{ ZstdDecoder.__init__()
+  def __init__(self):
+    self._decompressor = zstandard.ZstdDecompressor().decompressobj()
+  ## }}}
+
+  ## {{{ ZstdDecoder.decode()
+  def decode(self, data, max_length):
+    try:
+      yield self._decompressor.decompress(data)
+    except zstandard.ZstdError as ex:
+      raise UrlRequestError(f'failed to decompress response: {ex}')
+  ## }}}
+
+## class ZstdDecoder }}}
+
+## {{{ class ChainedDecoder
+
+class ChainedDecoder(ContentDecoder):
+
+  _decoders = None
+
+  ## {{{ ChainedDecoder.__init__()
+  def __init__(self, decoders):
+    self._decoders = decoders
+  ## }}}
+
+  ## {{{ ChainedDecoder.decode()
+  def decode(self, data, max_length, index=0):
+    if index == len(self._decoders):
+      yield data
+      return
+
+    for chunk in self._decoders[index].decode(data, max_length):
+      yield from self.decode(chunk, max_length, index + 1)
+  ## }}}
+
+  ## {{{ ChainedDecoder.flush()
+  def flush(self):
+    # Flush each decoder in turn, passing whatever is left over from the ones
+    # before it through it first
+    #
+    data = b''
+    for decoder in self._decoders:
+      if data:
+        data = b''.join(decoder.decode(data, 0))
+      data += decoder.flush()
+    return data
+  ## }}}
+
+## class ChainedDecoder }}}
+
+## }}} ---- [ Classes ] ----------------------------------------------------------------------------
+
+##
+# vim: ts=2 sw=2 tw=100 et fdm=marker :
+##
@@ -30,14 +30,28 @@
 
 ## }}} ---- [ Header ] -----------------------------------------------------------------------------
 
+import urllib.error
 import urllib.request
 
-import gzip
+import http.client
 
 import hashlib
 
+import itertools
+
+from ..metrics import NULL_METRICS
+
+from .decoders import decoder_factory
+
 from .errors import UrlRequestError
 
+## {{{ ---- [ Constants ] --------------------------------------------------------------------------
+
+# Default size of the chunks content is read and decompressed in
+DEFAULT_CHUNK_SIZE = 64 * 1024
+
+## }}} ---- [ Constants ] --------------------------------------------------------------------------
+
 ## {{{ class UrlRequest
 
 class UrlRequest:
@@ -52,47 +66,284 @@ class UrlRequest:
 
   status = None
 
+  # Cache validators returned by the server, if any
+  etag = None
+  last_modified = None
+
+  # Value of the Content-Length response header, if any
+  length = None
+
   content = None
   content_hash_alg = None
   content_hash = None
 
+  # Body as received, before decoding; only kept if asked for (keep_raw)
+  raw_content = None
+
+  # Value of the Content-Encoding response header, if any
+  encoding = None
+
   gzip = False
   deflate = False
 
-  def __init__(self, url, headers=None):
+  # Content decoder object implementing aggreg8.url.ContentDecoder
+  _decoder = None
+
+  # Whether to keep the body as received (see raw_content)
+  _keep_raw = False
+
+  # What's left of the body once read() gets to its limit, starting with what
+  # it had read
+  _rest = None
+
+  # Metrics object (aggreg8.metrics.Metrics) the request's timings and byte
+  # counts are recorded on
+  _metrics = NULL_METRICS
+
+  # Connection pool object (aggreg8.url.HttpConnectionPool) the request was
+  # made through, if any, and the connection used
+  _pool = None
+  _connection = None
+
+  ## {{{ UrlRequest.__init__()
+  def __init__(self, url, headers=None, timeout=None, stream=False, pool=None, keep_raw=False,
+      metrics=None):
     self.url = url
+    self.request_headers = headers
+    self._keep_raw = keep_raw
+
+    if metrics is not None:
+      self._metrics = metrics
 
-    if headers is None:
-      self.request = urllib.request.Request(url)
+    if pool is None:
+      self._urlopen(timeout)
     else:
-      self.request_headers = headers
-      self.request = urllib.request.Request(url, headers=headers)
+      self._pool_urlopen(pool, timeout)
 
-    self.response = urllib.request.urlopen(self.request)
     self.status = self.response.status
 
     self.response_headers = {}
-    for header, value in self.response.getheaders():
+    for header, value in self.response.headers.items():
       self.response_headers[header] = value
 
-    encoding = self.response.info().get('Content-Encoding')
-    if encoding not in ['gzip', 'deflate']:
-      raise UrlRequestError((f"unexpected content-encoding type '{encoding}'"))
+    self.etag = self.response.headers.get('ETag')
+    self.last_modified = self.response.headers.get('Last-Modified')
+
+    # Not modified: there's no body to download
+    if self.status == 304:
+      self.close()
+      return
+
+    self.encoding = self.response.headers.get('Content-Encoding')
+
+    try:
+      self._decoder = decoder_factory(self.encoding)
+    except UrlRequestError as ex:
+      self.close()
+      raise UrlRequestError(f'{url}: {ex}')
 
-    if encoding == 'gzip':
-      self.content = gzip.decompress(self.response.read())
+    if self.encoding == 'gzip':
       self.gzip = True
-    elif encoding == 'deflate':
+    elif self.encoding == 'deflate':
       self.deflate = True
-      self.content = self.response.read()
-    else:
-      self.content = self.response.read()
+
+    length = self.response.headers.get('Content-Length')
+    if length is not None and length.isdigit():
+      self.length = int(length)
+
+    # When streaming, the caller consumes the body with iter_content()
+    if not stream:
+      self.read()
+  ## }}}
+
+  ## {{{ UrlRequest.iter_content()
+  def iter_content(self, chunk_size=DEFAULT_CHUNK_SIZE, keep_raw=None):
+    # Yield the decoded body in chunks of (mostly) at most chunk_size bytes,
+    # hashing it as we go; content_hash is only set once the body has been
+    # consumed in full. keep_raw, if given, overrides the request's (see
+    # raw_content). After a read() that got to its limit, this picks up
+    # where it left off, starting with what it had read.
+    #
+    if self._rest is not None:
+      rest, self._rest = self._rest, None
+      yield from rest
+      return
+
+    # The raw body is read straight into one reused buffer, from which it's
+    # decompressed, so it's never held in memory as a whole.
+    #
+    # Time spent reading, decompressing and hashing is added up locally and
+    # recorded once done, leaving out the time the caller spends on each
+    # chunk we yield
+    #
+    hasher = hashlib.sha256()
+
+    buffer = bytearray(chunk_size)
+    view = memoryview(buffer)
+
+    if keep_raw is None:
+      keep_raw = self._keep_raw
+
+    raw = None
+    if keep_raw:
+      raw = bytearray()
+
+    metrics = self._metrics
+    clock = metrics.clock
+    download = decompress = hashing = 0
+    received = decoded = 0
+
+    try:
+      while True:
+        start = clock()
+        n = self.response.readinto(buffer)
+        download += clock() - start
+        if not n:
+          break
+
+        received += n
+        if raw is not None:
+          if self._keep_raw:
+            raw += view[:n]
+          else:
+            raw = None
+
+        chunks = self._decoder.decode(view[:n], chunk_size)
+        while True:
+          start = clock()
+          data = next(chunks, None)
+          decompress += clock() - start
+          if data is None:
+            break
+
+          if data:
+            start = clock()
+            hasher.update(data)
+            hashing += clock() - start
+
+            decoded += len(data)
+            yield data
+
+      start = clock()
+      data = self._decoder.flush()
+      decompress += clock() - start
+      if data:
+        start = clock()
+        hasher.update(data)
+        hashing += clock() - start
+
+        decoded += len(data)
+        yield data
+    except UrlRequestError as ex:
+      self.close()
+      raise UrlRequestError(f'{self.url}: {ex}')
+    except (OSError, http.client.HTTPException) as ex:
+      self.close()
+      raise UrlRequestError(f'{self.url}: failed to read response: {ex}')
+    finally:
+      # Also reached when a streaming caller stops early
+      metrics.add('download', download)
+      metrics.add('decompress', decompress)
+      metrics.add('hash', hashing)
+      metrics.count('bytes_received', received)
+      metrics.count('bytes_decoded', decoded)
 
     self.content_hash_alg = 'sha256'
-    self.content_hash = hashlib.sha256(self.content).hexdigest()
+    self.content_hash = hasher.hexdigest()
+
+    if raw is not None:
+      self.raw_content = bytes(raw)
+
+    self.close()
+  ## }}}
+
+  ## {{{ UrlRequest.read()
+  def read(self, limit=None):
+    # Read the body in full, returning it as text. Given a limit, reading
+    # stops as soon as more than limit bytes of it have been decoded, None
+    # being returned instead; the raw body is no longer kept, and the body
+    # is left to iter_content() to go through, from the start
+    #
+    chunks = self.iter_content()
+
+    content = bytearray()
+    for data in chunks:
+      content += data
+      if limit is not None and len(content) > limit:
+        self._keep_raw = False
+        self._rest = itertools.chain([bytes(content)], chunks)
+        return None
+
+    # Finally, convert the content to UTF-8
+    try:
+      self.content = content.decode('utf-8')
+    except UnicodeDecodeError as ex:
+      raise UrlRequestError(f'{self.url}: failed to decode response: {ex}')
+
+    return self.content
+  ## }}}
+
+  ## {{{ UrlRequest.close()
+  def close(self):
+    # Pooled connections go back to their pool, to be reused if the response
+    # was read in full
+    #
+    if self._pool is None:
+      self.response.close()
+    elif self._connection is not None:
+      self._pool.release(self._connection, self.response)
+      self._connection = None
+  ## }}}
+
+  ## {{{ UrlRequest._urlopen()
+  def _urlopen(self, timeout):
+    if self.request_headers is None:
+      self.request = urllib.request.Request(self.url)
+    else:
+      self.request = urllib.request.Request(self.url, headers=self.request_headers)
+
+    # urlopen() connects and waits for the response in one go, so without a
+    # pool connection setup counts towards time to first byte
+    #
+    start = self._metrics.clock()
+
+    try:
+      if timeout is None:
+        self.response = urllib.request.urlopen(self.request)
+      else:
+        self.response = urllib.request.urlopen(self.request, timeout=timeout)
+    except urllib.error.HTTPError as ex:
+      # urllib treats anything but 2xx as an error, including the 304 we get
+      # back for conditional requests when the resource hasn't changed
+      if ex.code != 304:
+        raise UrlRequestError(f'{self.url}: HTTP status {ex.code}: {ex.reason}')
+      self.response = ex
+    except urllib.error.URLError as ex:
+      raise UrlRequestError(f'{self.url}: {ex.reason}')
+    except (OSError, http.client.HTTPException) as ex:
+      raise UrlRequestError(f'{self.url}: {ex}')
+
+    self._metrics.time('ttfb', start)
+  ## }}}
+
+  ## {{{ UrlRequest._pool_urlopen()
+  def _pool_urlopen(self, pool, timeout):
+    self._pool = pool
+
+    try:
+      self._connection, self.response = pool.urlopen(self.url, self.request_headers, timeout,
+        self._metrics)
+    except (OSError, http.client.HTTPException) as ex:
+      raise UrlRequestError(f'{self.url}: {ex}')
 
-    # Finally, convert self.content to UTF-8
-    self.content = self.content.decode('utf-8')
+    status = self.response.status
+    if status == 304:
+      # No body, but reading it is what marks the response as complete
+      self.response.read()
+    elif status < 200 or status > 299:
+      self.close()
+      raise UrlRequestError(f'{self.url}: HTTP status {status}: {self.response.reason}')
+  ## }}}
 
 ## class UrlRequest }}}
 
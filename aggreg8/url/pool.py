@@ -0,0 +1,297 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+##
+# aggreg8.git:aggreg8/url/pool.py
+##
+
+## {{{ ---- [ Header ] -----------------------------------------------------------------------------
+
+##
+# Copyright (c) 2021 Francis M <francism@destinatech.com>
+#
+# This program is free software; you can redistribute it and/or modify it under
+# the terms of the GNU General Public License version 2.0 as published by the
+# Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE.  See the GNU General Public License for more
+# details.
+#
+# You should have received a copy of the GNU General Public License along with
+# this program; if not, write to:
+#
+#   Free Software Foundation
+#   51 Franklin Street, Fifth Floor
+#   Boston, MA 02110
+#   USA
+##
+
+## }}} ---- [ Header ] -----------------------------------------------------------------------------
+
+## {{{ ---- [ Imports ] ----------------------------------------------------------------------------
+
+import ssl
+
+import time
+
+import threading
+
+import http.client
+
+import urllib.parse
+
+from ..metrics import NULL_METRICS
+
+from .errors import UrlRequestError
+
+## }}} ---- [ Imports ] ----------------------------------------------------------------------------
+
+## {{{ ---- [ Constants ] --------------------------------------------------------------------------
+
+# Default maximum number of idle connections kept per (scheme, host, port)
+DEFAULT_POOL_SIZE = 4
+
+# Default number of seconds idle connections are kept around for
+DEFAULT_POOL_IDLE_TIMEOUT = 30
+
+# Maximum number of redirects followed per request
+MAX_REDIRECTS = 5
+
+# Redirect status codes
+REDIRECT_CODES = [301, 302, 303, 307, 308]
+
+# Default "User-Agent" request header
+DEFAULT_USER_AGENT = 'Aggreg8: news aggregation bot'
+
+## }}} ---- [ Constants ] --------------------------------------------------------------------------
+
+## {{{ ---- [ Classes ] ----------------------------------------------------------------------------
+
+## {{{ class _HTTPSConnection
+
+class _HTTPSConnection(http.client.HTTPSConnection):
+
+  """HTTPS connection resuming TLS sessions saved by its HttpConnectionPool"""
+
+  _pool = None
+
+  ## {{{ _HTTPSConnection.connect()
+  def connect(self):
+    http.client.HTTPConnection.connect(self)
+
+    self.sock = self._context.wrap_socket(
+      self.sock,
+      server_hostname=self.host,
+      session=self._pool._tls_session(self._a8_key)
+    )
+  ## }}}
+
+## class _HTTPSConnection }}}
+
+## {{{ class HttpConnectionPool
+
+class HttpConnectionPool:
+
+  """Pool of persistent HTTP(S) connections, keyed by (scheme, host, port)"""
+
+  # Maximum number of idle connections kept per key
+  size = None
+
+  # Number of seconds idle connections are kept around for
+  idle_timeout = None
+
+  # SSL context shared by all HTTPS connections
+  context = None
+
+  # Idle connections, as lists of (connection, time released) tuples, and
+  # the last TLS session seen, both keyed by (scheme, host, port)
+  _idle = None
+  _sessions = None
+
+  _lock = None
+
+  ## {{{ HttpConnectionPool.__init__()
+  def __init__(self, size=DEFAULT_POOL_SIZE, idle_timeout=DEFAULT_POOL_IDLE_TIMEOUT, context=None):
+    if size < 0:
+      raise UrlRequestError(f"invalid connection pool size '{size}'")
+
+    self.size = size
+    self.idle_timeout = idle_timeout
+
+    self.context = context
+    if self.context is None:
+      self.context = ssl.create_default_context()
+
+    self._idle = {}
+    self._sessions = {}
+    self._lock = threading.Lock()
+  ## }}}
+
+  ## {{{ HttpConnectionPool.urlopen()
+  def urlopen(self, url, headers=None, timeout=None, metrics=NULL_METRICS):
+    # Send a GET request for url, following redirects, and return a
+    # (connection, response) tuple; once done with the response, the
+    # connection must be handed back with release(). Connection setup and
+    # time to first byte are recorded on metrics (an aggreg8.metrics.Metrics)
+    #
+    headers = dict(headers or {})
+    if not any(header.lower() == 'user-agent' for header in headers):
+      headers['User-Agent'] = DEFAULT_USER_AGENT
+
+    for i in range(MAX_REDIRECTS + 1):
+      connection, response = self._request(url, headers, timeout, metrics)
+      if response.status not in REDIRECT_CODES:
+        return connection, response
+
+      location = response.headers.get('Location')
+
+      # Discard the redirect's body so the connection can be reused
+      response.read()
+      self.release(connection, response)
+
+      if location is None:
+        raise UrlRequestError(f'{url}: HTTP status {response.status} without location')
+
+      url = urllib.parse.urljoin(url, location)
+
+    raise UrlRequestError(f'{url}: too many redirects')
+  ## }}}
+
+  ## {{{ HttpConnectionPool.release()
+  def release(self, connection, response):
+    # Keep the connection around if the server is happy for us to and its
+    # response has been read in full; close it otherwise
+    #
+    if response.will_close or not response.isclosed() or self.size < 1:
+      connection.close()
+      return
+
+    key = connection._a8_key
+    if isinstance(connection.sock, ssl.SSLSocket) and connection.sock.session is not None:
+      with self._lock:
+        self._sessions[key] = connection.sock.session
+
+    with self._lock:
+      idle = self._idle.setdefault(key, [])
+      if len(idle) < self.size:
+        idle.append((connection, time.monotonic()))
+        return
+
+    connection.close()
+  ## }}}
+
+  ## {{{ HttpConnectionPool.close()
+  def close(self):
+    with self._lock:
+      idle, self._idle = self._idle, {}
+
+    for connections in idle.values():
+      for connection, released in connections:
+        connection.close()
+  ## }}}
+
+  ## {{{ HttpConnectionPool._tls_session()
+  def _tls_session(self, key):
+    with self._lock:
+      return self._sessions.get(key)
+  ## }}}
+
+  ## {{{ HttpConnectionPool._checkout()
+  def _checkout(self, key, timeout):
+    # Return an idle connection for key, if there's one that hasn't expired
+    now = time.monotonic()
+
+    with self._lock:
+      idle = self._idle.get(key, [])
+      while len(idle) > 0:
+        connection, released = idle.pop()
+        if now - released < self.idle_timeout:
+          break
+        connection.close()
+      else:
+        return None
+
+    connection.timeout = timeout
+    if connection.sock is not None:
+      connection.sock.settimeout(timeout)
+
+    return connection
+  ## }}}
+
+  ## {{{ HttpConnectionPool._connection()
+  def _connection(self, key, timeout):
+    scheme, host, port = key
+
+    if scheme == 'https':
+      connection = _HTTPSConnection(host, port, timeout=timeout, context=self.context)
+      connection._pool = self
+    else:
+      connection = http.client.HTTPConnection(host, port, timeout=timeout)
+
+    connection._a8_key = key
+    return connection
+  ## }}}
+
+  ## {{{ HttpConnectionPool._request()
+  def _request(self, url, headers, timeout, metrics):
+    parts = urllib.parse.urlsplit(url)
+    if parts.scheme not in ['http', 'https'] or not parts.hostname:
+      raise UrlRequestError(f'{url}: unsupported URL')
+
+    port = parts.port
+    if port is None:
+      port = 443 if parts.scheme == 'https' else 80
+
+    key = (parts.scheme, parts.hostname.lower(), port)
+
+    path = parts.path or '/'
+    if parts.query:
+      path += f'?{parts.query}'
+
+    # A reused connection may have been closed by the server while idle, in
+    # which case the request is retried once on a fresh connection
+    #
+    connection = self._checkout(key, timeout)
+    reused = connection is not None
+
+    while True:
+      if connection is None:
+        connection = self._connection(key, timeout)
+
+      try:
+        # New connections are opened here rather than by request(), so the
+        # time spent resolving, connecting and handshaking is told apart
+        # from the time spent waiting for the response
+        #
+        if connection.sock is None:
+          start = metrics.clock()
+          connection.connect()
+          metrics.time('connect', start)
+
+        start = metrics.clock()
+        connection.request('GET', path, headers=headers)
+        response = connection.getresponse()
+        metrics.time('ttfb', start)
+
+        return connection, response
+      except (ConnectionError, http.client.RemoteDisconnected, http.client.BadStatusLine):
+        connection.close()
+        if not reused:
+          raise
+      except Exception:
+        connection.close()
+        raise
+
+      connection = None
+      reused = False
+  ## }}}
+
+## class HttpConnectionPool }}}
+
+## }}} ---- [ Classes ] ----------------------------------------------------------------------------
+
+##
+# vim: ts=2 sw=2 tw=100 et fdm=marker :
+##
@@ -16,6 +16,86 @@ A8_DATABASE_DRIVER = 'sqlite'
 # Path to SQLite database file
 A8_SQLITE_DATABASE = os.path.join(A8_DATA_DIR, 'aggreg8.sqlite')
 
+# Pragmas applied, in order, to every SQLite connection: WAL lets readers (e.g.
+# 'a8 rss list') run alongside a poll, and only needs synchronous=NORMAL to be
+# safe against corruption; a negative cache_size is in KiB
+A8_SQLITE_PRAGMAS = {
+  'journal_mode': 'WAL',
+  'synchronous': 'NORMAL',
+  'busy_timeout': 5000,
+  'cache_size': -16 * 1024,
+  'mmap_size': 64 * 1024 * 1024,
+  'temp_store': 'MEMORY',
+}
+
+# Number of prepared statements cached per SQLite connection: enough for every
+# statement polling runs, so none of them get re-prepared on each use
+A8_SQLITE_CACHED_STATEMENTS = 256
+
+# Maximum number of feeds fetched concurrently by 'a8 rss poll'
+A8_POLL_WORKERS = 16
+
+# Maximum number of feeds fetched concurrently from any single host
+A8_POLL_HOST_WORKERS = 2
+
+# Feed request timeout, in seconds
+A8_POLL_TIMEOUT = 30
+
+# Maximum number of idle keep-alive connections kept per (scheme, host, port)
+A8_HTTP_POOL_SIZE = 4
+
+# Number of seconds idle keep-alive connections are kept for
+A8_HTTP_POOL_IDLE_TIMEOUT = 30
+
+# Feeds larger than this (decoded, or going by Content-Length if it says so)
+# are parsed incrementally as they download instead of being read into memory
+# in full, unless the parser backend is 'feedparser', which can't
+A8_POLL_STREAM_THRESHOLD = 4 * 1024 * 1024
+
+# Feed parser backend: 'native' (RSS 2.0/Atom 1.0 only), 'feedparser', or 'auto'
+# to use the native parser and fall back to feedparser when it fails
+A8_RSS_PARSER = 'auto'
+
+# Number of processes feeds are parsed in during 'a8 rss poll', or 0 to parse
+# them in the (single) database writer thread. Parser processes are spawned
+# anew by every 'a8 rss poll' run, which only pays off for polls of many (or
+# large) feeds; the daemon keeps its own between polls.
+A8_POLL_PARSE_WORKERS = 0
+
+# Polled feeds are written out in batches, each committed in one transaction:
+# a batch is flushed once it holds this many rows (feeds, entries etc.)...
+A8_POLL_BATCH_SIZE = 1000
+
+# ...or its oldest row is this many seconds old, or the poll ends
+A8_POLL_BATCH_INTERVAL = 1.0
+
+# How the cached copy of each polled feed is stored: 'none' (text), 'deflate'
+# (zlib compressed), 'zstd' (needs the zstandard module), or 'wire' to keep
+# the body exactly as the server sent it if compressed, deflate otherwise
+A8_CACHE_COMPRESSION = 'wire'
+
+# Whether to cluster new entries carrying the same story (e.g. syndicated wire
+# copy) across feeds, going by their guid, link, or the words of their text
+A8_DEDUP = True
+
+# Minimum fraction of words (Jaccard similarity, estimated by MinHash) the
+# texts of two entries must share for them to be considered the same story
+A8_DEDUP_THRESHOLD = 0.7
+
+# Number of seconds a story keeps taking new entries for since it last did
+A8_DEDUP_WINDOW = 7 * 24 * 60 * 60
+
+# Number of seconds between checks for added/removed feeds by 'a8 rss daemon'
+A8_DAEMON_RELOAD_INTERVAL = 60
+
+# File poll metrics (per-stage timings and counters) are written to at the end
+# of every poll, or None not to record any; e.g. a node_exporter textfile
+# collector directory for Prometheus
+A8_METRICS_FILE = None
+
+# Format metrics are written in: 'prometheus' (text exposition format) or 'json'
+A8_METRICS_FORMAT = 'prometheus'
+
 ##
 # vim: ts=2 sw=2 tw=100 et fdm=marker :
 ##
@@ -1,3 +1,7 @@
+-- Schema version (see aggreg8.database.SCHEMA_VERSION), bumped along with a
+-- migration (aggreg8.database.MIGRATIONS) on every change to this file
+PRAGMA user_version=1;
+
 CREATE TABLE IF NOT EXISTS rss_feeds
 (
   id INTEGER PRIMARY KEY,
@@ -8,11 +12,40 @@ CREATE TABLE IF NOT EXISTS rss_feeds
   date_added INTEGER NOT NULL,
   last_updated INTEGER NOT NULL,
 
+  -- Time the feed is next due to be polled (last_updated + update_interval,
+  -- or 0 if it never has been)
+  next_due INTEGER NOT NULL DEFAULT 0,
+
   -- JSON payloads
-  entries TEXT NOT NULL DEFAULT '[]',
   context TEXT NOT NULL DEFAULT '{}'
 );
 
+CREATE INDEX IF NOT EXISTS rss_feeds_next_due ON rss_feeds (next_due);
+
+-- Content-addressed store of cached feed bodies, so identical bodies (mirrors,
+-- syndicated feeds) are only stored once
+CREATE TABLE IF NOT EXISTS rss_blobs
+(
+  id INTEGER PRIMARY KEY,
+
+  -- Hash of the (uncompressed) content, as per rss_feed_cache.content_hash
+  hash TEXT NOT NULL UNIQUE,
+
+  -- Text if content_encoding is NULL, otherwise compressed as per
+  -- content_encoding (a Content-Encoding header value)
+  content BLOB NOT NULL,
+  content_encoding TEXT,
+
+  date_added INTEGER NOT NULL,
+
+  -- Number of rss_feed_cache rows referencing the blob, counted when it's
+  -- inserted (rows may reference it before it exists) and kept up to date by
+  -- the triggers below from then on; unreferenced blobs are garbage collected
+  refcount INTEGER NOT NULL DEFAULT 0
+);
+
+CREATE INDEX IF NOT EXISTS rss_blobs_unreferenced ON rss_blobs (id) WHERE refcount<=0;
+
 CREATE TABLE IF NOT EXISTS rss_feed_cache
 (
   id INTEGER PRIMARY KEY,
@@ -20,10 +53,97 @@ CREATE TABLE IF NOT EXISTS rss_feed_cache
   url TEXT NOT NULL UNIQUE,
   date_added INTEGER NOT NULL,
   last_updated INTEGER NOT NULL,
-  content TEXT NOT NULL,
-  content_hash TEXT NOT NULL
+
+  -- Hash of the cached copy of the feed, stored in rss_blobs; feeds too
+  -- large to cache (streamed) have no blob of their own
+  content_hash TEXT NOT NULL,
+
+  -- HTTP cache validators, sent back on the next poll as If-None-Match and
+  -- If-Modified-Since respectively
+  etag TEXT,
+  last_modified TEXT
 );
 
+CREATE INDEX IF NOT EXISTS rss_feed_cache_content_hash ON rss_feed_cache (content_hash);
+
+CREATE TRIGGER IF NOT EXISTS rss_feed_cache_insert AFTER INSERT ON rss_feed_cache
+BEGIN
+  UPDATE rss_blobs SET refcount=refcount+1 WHERE hash=NEW.content_hash;
+END;
+
+CREATE TRIGGER IF NOT EXISTS rss_feed_cache_update AFTER UPDATE OF content_hash ON rss_feed_cache
+  WHEN OLD.content_hash IS NOT NEW.content_hash
+BEGIN
+  UPDATE rss_blobs SET refcount=refcount-1 WHERE hash=OLD.content_hash;
+  UPDATE rss_blobs SET refcount=refcount+1 WHERE hash=NEW.content_hash;
+END;
+
+CREATE TRIGGER IF NOT EXISTS rss_feed_cache_delete AFTER DELETE ON rss_feed_cache
+BEGIN
+  UPDATE rss_blobs SET refcount=refcount-1 WHERE hash=OLD.content_hash;
+END;
+
+CREATE TABLE IF NOT EXISTS rss_entries
+(
+  id INTEGER PRIMARY KEY,
+  feed_id INTEGER NOT NULL,
+
+  -- Hash of the entry's guid (or link, failing that) identifying it within
+  -- its feed
+  entry_key TEXT NOT NULL,
+
+  guid TEXT,
+  link TEXT,
+  title TEXT,
+  summary TEXT,
+  published INTEGER,
+
+  date_added INTEGER NOT NULL,
+  last_updated INTEGER NOT NULL,
+
+  -- Hash of the fields above, used to detect entries that changed
+  entry_hash TEXT NOT NULL,
+
+  -- Story (rss_stories) the entry is a copy of, if deduplication is enabled
+  story_id INTEGER,
+
+  UNIQUE (feed_id, entry_key)
+);
+
+CREATE INDEX IF NOT EXISTS rss_entries_feed_published ON rss_entries (feed_id, published);
+CREATE INDEX IF NOT EXISTS rss_entries_published ON rss_entries (published);
+CREATE INDEX IF NOT EXISTS rss_entries_story ON rss_entries (story_id);
+
+-- Stories: clusters of entries from different feeds carrying the same story
+-- (e.g. syndicated wire copy)
+CREATE TABLE IF NOT EXISTS rss_stories
+(
+  id INTEGER PRIMARY KEY,
+
+  -- MinHash signature of the words of the title/summary of the story's first
+  -- entry, if it had enough to be worth one
+  signature BLOB,
+
+  date_added INTEGER NOT NULL,
+  last_updated INTEGER NOT NULL
+);
+
+-- Exact keys (globally unique guids and normalized links) of story entries
+CREATE TABLE IF NOT EXISTS rss_story_keys
+(
+  key TEXT PRIMARY KEY,
+  story_id INTEGER NOT NULL
+) WITHOUT ROWID;
+
+-- Hashed bands of story MinHash signatures, for finding near-duplicate entries
+CREATE TABLE IF NOT EXISTS rss_story_bands
+(
+  band INTEGER NOT NULL,
+  story_id INTEGER NOT NULL,
+
+  PRIMARY KEY (band, story_id)
+) WITHOUT ROWID;
+
 /*
 
 CREATE TABLE IF NOT EXISTS log_domains
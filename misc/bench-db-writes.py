@@ -0,0 +1,198 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+##
+# aggreg8.git:misc/bench-db-writes.py
+##
+
+## {{{ ---- [ Header ] -----------------------------------------------------------------------------
+
+##
+# Copyright (c) 2021 Francis M <francism@destinatech.com>
+#
+# This program is free software; you can redistribute it and/or modify it under
+# the terms of the GNU General Public License version 2.0 as published by the
+# Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE.  See the GNU General Public License for more
+# details.
+#
+# You should have received a copy of the GNU General Public License along with
+# this program; if not, write to:
+#
+#   Free Software Foundation
+#   51 Franklin Street, Fifth Floor
+#   Boston, MA 02110
+#   USA
+##
+
+## }}} ---- [ Header ] -----------------------------------------------------------------------------
+
+##
+# Compare the rate feeds are persisted at with and without write batching
+#
+# Usage: bench-db-writes.py [feeds] [entries]
+#
+# Stores the given number of feeds (default 2000), each with the given number
+# of new entries (default 20), into a scratch database: once the way feeds
+# used to be stored (DELETE and INSERT of the cached copy, UPDATE of the feed
+# and a commit per feed), and once through RssPoller's write batch. Both runs
+# use the A8_SQLITE_PRAGMAS profile from config.py.
+##
+
+import os
+import sys
+
+import tempfile
+import time
+import types
+
+# Path to aggreg8 instance directory
+INSTANCE_DIR = os.path.abspath(os.path.dirname(__file__) + '/..')
+
+sys.path.append(INSTANCE_DIR)
+
+from aggreg8 import *
+
+import aggreg8.rss as rss
+
+from aggreg8.database import SqliteDatabase
+
+import config
+
+# Default number of feeds stored, and of entries per feed
+FEEDS = 2000
+ENTRIES = 20
+
+# Size of the cached copy of each feed
+CONTENT_SIZE = 16 * 1024
+
+## {{{ database()
+def database(path, count):
+  dbd = SqliteDatabase()
+  dbd.connect(path, config.A8_SQLITE_PRAGMAS)
+
+  with open(f'{INSTANCE_DIR}/data/init.sql', encoding='utf-8') as fp:
+    dbd.executescript(fp.read())
+
+  dbd.executemany(
+    'INSERT INTO rss_feeds (name, proper_name, url, update_interval, date_added, last_updated) '
+    'VALUES(?, ?, ?, ?, ?, ?)',
+    ((f'feed{i}', f'Feed {i}', f'https://example.com/feeds/{i}.xml', 60, 0, 0)
+      for i in range(count))
+  )
+  dbd.commit()
+
+  return dbd
+## }}}
+
+## {{{ polled()
+def polled(dbd, count, entries, round):
+  # Fake poll results: one response and list of entries per feed
+  results = []
+  for feed in rss.RssFeed.feeds(dbd):
+    response = types.SimpleNamespace(
+      content='x' * CONTENT_SIZE,
+      raw_content=None,
+      encoding=None,
+      content_hash_alg='sha256',
+      content_hash=f'{round}:{feed.get("id")}',
+      etag=f'"{round}"',
+      last_modified=None
+    )
+
+    results.append((feed, response, [
+      rss.RssEntry(
+        f'urn:example:{feed.get("id")}:{round}:{i}',
+        f'https://example.com/news/{feed.get("id")}/{round}/{i}',
+        f'Story {i}',
+        f'Summary of story {i}',
+        1704103200 + i
+      )
+      for i in range(entries)
+    ]))
+
+  return results
+## }}}
+
+## {{{ store_legacy()
+def store_legacy(dbd, results):
+  for feed, response, entries in results:
+    now = time_now()
+
+    content_hash = f'{response.content_hash_alg}:{response.content_hash}'
+
+    dbd.execute('DELETE FROM rss_feed_cache WHERE feed_id=?', (feed.get('id'),))
+    dbd.execute(
+      'INSERT INTO rss_blobs (hash, content, date_added) VALUES(?, ?, ?) '
+      'ON CONFLICT (hash) DO NOTHING',
+      (content_hash, response.content, now)
+    )
+    dbd.execute(
+      'INSERT INTO rss_feed_cache (feed_id, url, date_added, last_updated, content_hash, '
+      'etag, last_modified) VALUES(?, ?, ?, ?, ?, ?, ?)',
+      (feed.get('id'), feed.get('url'), now, now, content_hash, response.etag,
+        response.last_modified)
+    )
+    dbd.execute('UPDATE rss_feeds SET last_updated=?, next_due=?+update_interval WHERE id=?',
+      (now, now, feed.get('id')))
+
+    rss.upsert_entries(dbd, feed.get('id'), entries, now)
+
+    dbd.commit()
+## }}}
+
+## {{{ store_batched()
+def store_batched(poller, results):
+  for feed, response, entries in results:
+    poller._store(feed, response, entries)
+  poller.batch.flush()
+## }}}
+
+## {{{ main()
+def main(argv):
+  count = int(argv[1]) if len(argv) > 1 else FEEDS
+  entries = int(argv[2]) if len(argv) > 2 else ENTRIES
+
+  pout(f'{count} feeds, {entries} entries each, pragmas: {config.A8_SQLITE_PRAGMAS}\n')
+
+  tmpdir = tempfile.TemporaryDirectory()
+
+  for name in ['legacy', 'batched']:
+    dbd = database(f'{tmpdir.name}/{name}.sqlite', count)
+    # Compression and story clustering are left out, as the legacy path has
+    # neither
+    #
+    poller = rss.RssPoller(dbd, batch_size=config.A8_POLL_BATCH_SIZE,
+      batch_interval=config.A8_POLL_BATCH_INTERVAL, cache_compression='none', dedup=False)
+
+    # First round inserts every cached copy/entry, the second replaces them
+    for round in range(2):
+      results = polled(dbd, count, entries, round)
+
+      start = time.perf_counter()
+      if name == 'legacy':
+        store_legacy(dbd, results)
+      else:
+        store_batched(poller, results)
+      elapsed = time.perf_counter() - start
+
+      pout(f'{name:<8} round {round}  {elapsed:8.3f}s  {count / elapsed:10.0f} feeds/s')
+
+    poller.close()
+    poller.pool.close()
+    dbd.close()
+
+  tmpdir.cleanup()
+
+  return 0
+## }}}
+
+if __name__ == '__main__':
+  exit(main(sys.argv))
+
+##
+# vim: ts=2 sw=2 tw=100 et fdm=marker :
+##
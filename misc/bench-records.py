@@ -0,0 +1,235 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+##
+# aggreg8.git:misc/bench-records.py
+##
+
+## {{{ ---- [ Header ] -----------------------------------------------------------------------------
+
+##
+# Copyright (c) 2021 Francis M <francism@destinatech.com>
+#
+# This program is free software; you can redistribute it and/or modify it under
+# the terms of the GNU General Public License version 2.0 as published by the
+# Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE.  See the GNU General Public License for more
+# details.
+#
+# You should have received a copy of the GNU General Public License along with
+# this program; if not, write to:
+#
+#   Free Software Foundation
+#   51 Franklin Street, Fifth Floor
+#   Boston, MA 02110
+#   USA
+##
+
+## }}} ---- [ Header ] -----------------------------------------------------------------------------
+
+##
+# Compare the memory use and construction time of feed/entry records
+#
+# Usage: bench-records.py [count]
+#
+# Builds count (default 100000) feeds from a scratch database, both through
+# RssFeed.feeds() and the way feeds used to be loaded (sqlite3.Row, tuple(),
+# per-character validation and a set() call per column, with a __dict__ based
+# spec), as well as count parsed entries as RssEntry objects and as dicts.
+##
+
+import os
+import sys
+
+import dataclasses
+import tempfile
+import time
+import tracemalloc
+
+# Path to aggreg8 instance directory
+INSTANCE_DIR = os.path.abspath(os.path.dirname(__file__) + '/..')
+
+sys.path.append(INSTANCE_DIR)
+
+from aggreg8 import *
+
+import aggreg8.rss as rss
+
+from aggreg8.database import SqliteDatabase
+
+# Default number of records built
+COUNT = 100000
+
+## {{{ class LegacyFeedSpec
+
+@dataclasses.dataclass
+class LegacyFeedSpec:
+
+  name: str
+  proper_name: str
+  url: str
+
+  id: int = 0
+  update_interval: int = 0
+  date_added: int = 0
+  last_updated: int = 0
+  next_due: int = 0
+  context: str = '{}'
+
+## class LegacyFeedSpec }}}
+
+## {{{ class LegacyFeed
+
+class LegacyFeed:
+
+  """RssFeed as it was before it grew __slots__ and a row factory"""
+
+  _spec = None
+
+  def __init__(self, name, proper_name, url):
+    self._spec = LegacyFeedSpec(name, proper_name, legacy_validate(name, proper_name, url))
+
+  def set(self, name, value):
+    return setattr(self._spec, name, value)
+
+## class LegacyFeed }}}
+
+## {{{ legacy_validate()
+def legacy_validate(name, proper_name, url):
+  # Validation as every feed loaded used to go through: a Python loop over
+  # each character, testing it against a string of valid ones
+  #
+  chars = [
+    (name, rss.VALID_NAME_CHARS),
+    (proper_name, rss.VALID_PROPER_NAME_CHARS),
+    (url, rss.VALID_NAME_CHARS + ':/.?%='),
+  ]
+  for value, valid in chars:
+    for char in value:
+      if char not in valid:
+        raise rss.RssFeedError(f"invalid character '{char}'")
+
+  return url
+## }}}
+
+## {{{ database()
+def database(path, count):
+  dbd = SqliteDatabase()
+  dbd.connect(path)
+
+  with open(f'{INSTANCE_DIR}/data/init.sql', encoding='utf-8') as fp:
+    dbd.executescript(fp.read())
+
+  dbd.executemany(
+    'INSERT INTO rss_feeds (name, proper_name, url, update_interval, date_added, last_updated) '
+    'VALUES(?, ?, ?, ?, ?, ?)',
+    ((f'feed{i}', f'Feed {i}', f'https://example.com/feeds/{i}.xml', 60, i, i)
+      for i in range(count))
+  )
+  dbd.commit()
+
+  return dbd
+## }}}
+
+## {{{ legacy_feeds()
+def legacy_feeds(dbd):
+  feed_list = []
+  for row in dbd.cursor().execute('SELECT * FROM rss_feeds'):
+    row = tuple(row)
+
+    feed = LegacyFeed(row[1], row[2], row[3])
+    feed.set('id', row[0])
+    feed.set('update_interval', row[4])
+    feed.set('date_added', row[5])
+    feed.set('last_updated', row[6])
+    feed.set('next_due', row[7])
+    feed.set('context', row[8])
+
+    feed_list.append(feed)
+
+  return feed_list
+## }}}
+
+## {{{ dict_entries()
+def dict_entries(count):
+  return [
+    {
+      'guid': f'urn:example:{i}',
+      'link': f'https://example.com/news/{i}',
+      'title': f'Story {i}',
+      'summary': f'Summary of story {i}',
+      'published': 1704103200 + i,
+    }
+    for i in range(count)
+  ]
+## }}}
+
+## {{{ record_entries()
+def record_entries(count):
+  return [
+    rss.RssEntry(
+      f'urn:example:{i}',
+      f'https://example.com/news/{i}',
+      f'Story {i}',
+      f'Summary of story {i}',
+      1704103200 + i
+    )
+    for i in range(count)
+  ]
+## }}}
+
+## {{{ measure()
+def measure(build):
+  # Time a build first, then measure the memory a second one holds on to;
+  # tracemalloc slows allocation down too much for it to do both
+  #
+  start = time.perf_counter()
+  records = build()
+  elapsed = time.perf_counter() - start
+  del records
+
+  tracemalloc.start()
+  before = tracemalloc.get_traced_memory()[0]
+  records = build()
+  size = tracemalloc.get_traced_memory()[0] - before
+  tracemalloc.stop()
+
+  return elapsed, size, len(records)
+## }}}
+
+## {{{ main()
+def main(argv):
+  count = int(argv[1]) if len(argv) > 1 else COUNT
+
+  tmpdir = tempfile.TemporaryDirectory()
+  dbd = database(f'{tmpdir.name}/bench.sqlite', count)
+
+  benchmarks = [
+    ('feeds: legacy', lambda: legacy_feeds(dbd)),
+    ('feeds: RssFeed.feeds()', lambda: rss.RssFeed.feeds(dbd)),
+    ('feeds: list columns', lambda: rss.RssFeed.feeds(dbd, columns=['name', 'proper_name', 'url'])),
+    ('entries: dict', lambda: dict_entries(count)),
+    ('entries: RssEntry', lambda: record_entries(count)),
+  ]
+
+  pout(f'{count} records\n')
+  for name, build in benchmarks:
+    elapsed, size, n = measure(build)
+    pout(f'{name:<24} {elapsed:8.3f}s  {n / elapsed:10.0f} records/s  '
+      f'{size / 1024 / 1024:8.2f} MiB  {size / n:6.0f} bytes/record')
+
+  dbd.close()
+  tmpdir.cleanup()
+
+  return 0
+## }}}
+
+if __name__ == '__main__':
+  exit(main(sys.argv))
+
+##
+# vim: ts=2 sw=2 tw=100 et fdm=marker :
+##
@@ -0,0 +1,153 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+##
+# aggreg8.git:misc/bench-rss-parse.py
+##
+
+## {{{ ---- [ Header ] -----------------------------------------------------------------------------
+
+##
+# Copyright (c) 2021 Francis M <francism@destinatech.com>
+#
+# This program is free software; you can redistribute it and/or modify it under
+# the terms of the GNU General Public License version 2.0 as published by the
+# Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE.  See the GNU General Public License for more
+# details.
+#
+# You should have received a copy of the GNU General Public License along with
+# this program; if not, write to:
+#
+#   Free Software Foundation
+#   51 Franklin Street, Fifth Floor
+#   Boston, MA 02110
+#   USA
+##
+
+## }}} ---- [ Header ] -----------------------------------------------------------------------------
+
+##
+# Compare the throughput of aggreg8.rss parser backends
+#
+# Usage: bench-rss-parse.py [file|directory ...]
+#
+# Feed documents are read from the given files/directories; with no arguments
+# a synthetic corpus of RSS 2.0 and Atom 1.0 documents is generated instead.
+##
+
+import os
+import sys
+
+import time
+
+# Path to aggreg8 instance directory
+INSTANCE_DIR = os.path.abspath(os.path.dirname(__file__) + '/..')
+
+sys.path.append(INSTANCE_DIR)
+
+from aggreg8 import *
+
+# Number of times the corpus is parsed by each backend
+ROUNDS = 5
+
+## {{{ rss_document()
+def rss_document(n):
+  items = ''.join(
+    f'<item><title>Story {i} &amp; more</title><link>https://example.com/news/{i}</link>'
+    f'<guid isPermaLink="false">example-{i}</guid><pubDate>Mon, 01 Jan 2024 10:{i % 60:02}:00 GMT'
+    f'</pubDate><description>&lt;p&gt;Summary of story {i}, which is about something.&lt;/p&gt;'
+    f'</description><dc:creator>Reporter {i % 7}</dc:creator></item>'
+    for i in range(n)
+  )
+
+  return '<?xml version="1.0" encoding="UTF-8"?>' \
+    '<rss version="2.0" xmlns:dc="http://purl.org/dc/elements/1.1/"><channel>' \
+    f'<title>Example</title><link>https://example.com/</link>{items}</channel></rss>'
+## }}}
+
+## {{{ atom_document()
+def atom_document(n):
+  entries = ''.join(
+    f'<entry><id>urn:example:{i}</id><title>Story {i}</title>'
+    f'<link rel="alternate" href="https://example.com/news/{i}"/>'
+    f'<updated>2024-01-01T10:{i % 60:02}:00Z</updated>'
+    f'<summary>Summary of story {i}, which is about something.</summary></entry>'
+    for i in range(n)
+  )
+
+  return '<?xml version="1.0" encoding="utf-8"?><feed xmlns="http://www.w3.org/2005/Atom">' \
+    f'<title>Example</title><id>urn:example</id><updated>2024-01-01T10:00:00Z</updated>{entries}</feed>'
+## }}}
+
+## {{{ corpus()
+def corpus(paths):
+  if len(paths) < 1:
+    return [f(n) for f in [rss_document, atom_document] for n in [10, 50, 200]]
+
+  documents = []
+  for path in paths:
+    if os.path.isdir(path):
+      names = sorted(os.path.join(path, name) for name in os.listdir(path))
+    else:
+      names = [path]
+
+    for name in names:
+      with open(name, encoding='utf-8') as fp:
+        documents.append(fp.read())
+
+  return documents
+## }}}
+
+## {{{ bench()
+def bench(parser, documents):
+  entries = 0
+  start = time.perf_counter()
+  for i in range(ROUNDS):
+    for document in documents:
+      entries += len(parser.parse(document))
+  return time.perf_counter() - start, entries
+## }}}
+
+## {{{ main()
+def main(argv):
+  # Import late so a missing feedparser is reported nicely
+  try:
+    import aggreg8.rss as rss
+  except ImportError as ex:
+    die(f'failed to import aggreg8.rss: {ex}')
+
+  documents = corpus(argv[1:])
+  size = sum(len(document) for document in documents)
+  pout(f'corpus: {len(documents)} documents, {size / 1024:.1f} KiB, {ROUNDS} rounds\n')
+
+  results = {}
+  for backend in ['native', 'feedparser', 'auto']:
+    parser = rss.parser_factory(backend)
+    elapsed, entries = bench(parser, documents)
+    results[backend] = elapsed
+    pout(f'{backend:<12} {elapsed:8.3f}s  {entries / elapsed:12.0f} entries/s  '
+      f'{size * ROUNDS / elapsed / 1024 / 1024:8.2f} MiB/s')
+
+  pout(f"\nnative speedup over feedparser: {results['feedparser'] / results['native']:.1f}x")
+
+  # Both backends should agree on which entries each document holds
+  native, fallback = rss.parser_factory('native'), rss.parser_factory('feedparser')
+  for n, document in enumerate(documents):
+    a = [(entry.guid, entry.link) for entry in native.parse(document)]
+    b = [(entry.guid, entry.link) for entry in fallback.parse(document)]
+    if a != b:
+      warning(f'document {n}: backends disagree on entries')
+
+  return 0
+## }}}
+
+if __name__ == '__main__':
+  exit(main(sys.argv))
+
+##
+# vim: ts=2 sw=2 tw=100 et fdm=marker :
+##
@@ -0,0 +1,160 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+##
+# aggreg8.git:misc/bench-startup.py
+##
+
+## {{{ ---- [ Header ] -----------------------------------------------------------------------------
+
+##
+# Copyright (c) 2021 Francis M <francism@destinatech.com>
+#
+# This program is free software; you can redistribute it and/or modify it under
+# the terms of the GNU General Public License version 2.0 as published by the
+# Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE.  See the GNU General Public License for more
+# details.
+#
+# You should have received a copy of the GNU General Public License along with
+# this program; if not, write to:
+#
+#   Free Software Foundation
+#   51 Franklin Street, Fifth Floor
+#   Boston, MA 02110
+#   USA
+##
+
+## }}} ---- [ Header ] -----------------------------------------------------------------------------
+
+##
+# Check the import time of `a8 rss list` against a budget
+#
+# Usage: bench-startup.py [budget] [runs]
+#
+# Runs `python -X importtime bin/a8 rss list` the given number of times
+# (default 10) against a scratch instance, and sums the time spent importing
+# modules the interpreter doesn't import by itself at startup. Exits non-zero
+# if the best run exceeds the budget in milliseconds (default IMPORT_BUDGET),
+# or if any module in DEFERRED_MODULES was imported at all; the slowest
+# imports of the best run are listed either way.
+##
+
+import os
+import sys
+
+import subprocess
+import tempfile
+
+# Path to aggreg8 instance directory
+INSTANCE_DIR = os.path.abspath(os.path.dirname(__file__) + '/..')
+
+sys.path.append(INSTANCE_DIR)
+
+from aggreg8 import *
+
+# Default import budget in milliseconds, and number of runs
+IMPORT_BUDGET = 80
+RUNS = 10
+
+# Modules `a8 rss list` has no use for, and mustn't import
+DEFERRED_MODULES = [
+  'feedparser',
+  'ssl',
+  'http.client',
+  'urllib.request',
+  'concurrent.futures',
+  'multiprocessing',
+  'json',
+  'hashlib',
+]
+
+# Number of slowest imports listed
+TOP = 10
+
+## {{{ instance()
+def instance(path):
+  # Scratch instance sharing this one's code and schema, but not its database
+  os.mkdir(f'{path}/data')
+  for name in ['aggreg8', 'bin', 'config.py', 'data/init.sql']:
+    os.symlink(f'{INSTANCE_DIR}/{name}', f'{path}/{name}')
+
+  subprocess.run([sys.executable, f'{path}/bin/a8', 'init'], check=True)
+## }}}
+
+## {{{ importtime()
+def importtime(argv):
+  # Map each top-level module imported to its cumulative import time in
+  # microseconds, as reported by -X importtime; set through the environment
+  # so it also covers any bin/a8-<command> exec()ed by bin/a8
+  #
+  proc = subprocess.run([sys.executable] + argv, check=True,
+    env=dict(os.environ, PYTHONPROFILEIMPORTTIME='1'),
+    stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True)
+
+  modules = {}
+  for line in proc.stderr.splitlines():
+    if not line.startswith('import time:'):
+      continue
+
+    # Nested imports are indented by two spaces per level
+    _, cumulative, name = line[12:].split('|')
+    if cumulative.strip().isdigit():
+      modules[name.strip()] = (int(cumulative), name.startswith('   '))
+
+  return modules
+## }}}
+
+## {{{ main()
+def main(argv):
+  budget = int(argv[1]) if len(argv) > 1 else IMPORT_BUDGET
+  runs = int(argv[2]) if len(argv) > 2 else RUNS
+
+  tmpdir = tempfile.TemporaryDirectory()
+  instance(tmpdir.name)
+
+  # Whatever the interpreter imports on its own doesn't count
+  startup = importtime(['-c', 'pass'])
+
+  best = None
+  for i in range(runs):
+    modules = importtime([f'{tmpdir.name}/bin/a8', 'rss', 'list'])
+    total = sum(cumulative for name, (cumulative, nested) in modules.items()
+      if not nested and name not in startup)
+
+    if best is None or total < best[0]:
+      best = (total, modules)
+
+  tmpdir.cleanup()
+
+  total, modules = best
+  slowest = sorted((cumulative, name) for name, (cumulative, nested) in modules.items()
+    if name not in startup)
+
+  for cumulative, name in reversed(slowest[-TOP:]):
+    pout(f'{cumulative / 1000:8.1f}ms  {name}')
+
+  pout(f'\ntotal {total / 1000:.1f}ms, budget {budget}ms (best of {runs} runs)')
+
+  status = 0
+  for name in DEFERRED_MODULES:
+    if name in modules:
+      error(f'{name} imported, but not needed to list feeds')
+      status = 1
+
+  if total > budget * 1000:
+    error(f'import time over budget by {total / 1000 - budget:.1f}ms')
+    status = 1
+
+  return status
+## }}}
+
+if __name__ == '__main__':
+  exit(main(sys.argv))
+
+##
+# vim: ts=2 sw=2 tw=100 et fdm=marker :
+##
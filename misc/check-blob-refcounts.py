@@ -0,0 +1,145 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+##
+# aggreg8.git:misc/check-blob-refcounts.py
+##
+
+## {{{ ---- [ Header ] -----------------------------------------------------------------------------
+
+##
+# Copyright (c) 2021 Francis M <francism@destinatech.com>
+#
+# This program is free software; you can redistribute it and/or modify it under
+# the terms of the GNU General Public License version 2.0 as published by the
+# Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE.  See the GNU General Public License for more
+# details.
+#
+# You should have received a copy of the GNU General Public License along with
+# this program; if not, write to:
+#
+#   Free Software Foundation
+#   51 Franklin Street, Fifth Floor
+#   Boston, MA 02110
+#   USA
+##
+
+## }}} ---- [ Header ] -----------------------------------------------------------------------------
+
+##
+# Check blob refcounts survive cache rows referencing blobs that don't exist
+#
+# Usage: check-blob-refcounts.py
+#
+# Streamed feeds cache a hash without storing its blob. Replays, against a
+# scratch database: streamed feed S caching hash H, feed N then storing H's
+# blob and caching it, S moving on to H2, and blob garbage collection; then
+# checks H's blob survived, and every blob's refcount matches the rows
+# referencing it. Exits non-zero if not.
+##
+
+import os
+import sys
+
+import tempfile
+import types
+
+# Path to aggreg8 instance directory
+INSTANCE_DIR = os.path.abspath(os.path.dirname(__file__) + '/..')
+
+sys.path.append(INSTANCE_DIR)
+
+from aggreg8 import *
+
+from aggreg8.database import SqliteDatabase
+
+from aggreg8.rss.cache import gc_blobs, store_blob
+
+from aggreg8.rss.poll import SQL_UPSERT_CACHE
+
+## {{{ database()
+def database(path):
+  dbd = SqliteDatabase()
+  dbd.connect(path)
+
+  with open(f'{INSTANCE_DIR}/data/init.sql', encoding='utf-8') as fp:
+    dbd.executescript(fp.read())
+
+  dbd.executemany(
+    'INSERT INTO rss_feeds (name, proper_name, url, date_added, last_updated)'
+    ' VALUES(?, ?, ?, 0, 0)',
+    [('s', 'Streamed', 'http://localhost/s.xml'), ('n', 'Mirror', 'http://localhost/n.xml')]
+  )
+  dbd.commit()
+
+  return dbd
+## }}}
+
+## {{{ cache()
+def cache(dbd, feed_id, content_hash, content=None):
+  # Cache a polled feed the way RssPoller._store() does, streamed if there's
+  # no content
+  response = types.SimpleNamespace(content=content, raw_content=None, encoding=None)
+  store_blob(dbd, content_hash, response, 'none', 0)
+
+  url = f'http://localhost/{feed_id}.xml'
+  dbd.execute(str(SQL_UPSERT_CACHE), (feed_id, url, 0, 0, content_hash, None, None))
+  dbd.commit()
+## }}}
+
+## {{{ check()
+def check(dbd):
+  errors = 0
+
+  rows = dbd.execute(
+    'SELECT hash, refcount, (SELECT COUNT(*) FROM rss_feed_cache WHERE content_hash=hash)'
+    ' FROM rss_blobs'
+  ).fetchall()
+  for content_hash, refcount, references in rows:
+    if refcount != references:
+      perr(f'{content_hash}: refcount {refcount}, expected {references}')
+      errors += 1
+
+  row = dbd.execute(
+    'SELECT rss_blobs.content FROM rss_feed_cache'
+    ' LEFT JOIN rss_blobs ON rss_blobs.hash=rss_feed_cache.content_hash WHERE feed_id=2'
+  ).fetchone()
+  if row is None or row[0] != 'body H':
+    perr('h:H: cached content of feed N lost')
+    errors += 1
+
+  return errors
+## }}}
+
+## {{{ main()
+def main(argv):
+  tmpdir = tempfile.TemporaryDirectory()
+
+  dbd = database(f'{tmpdir.name}/blobs.sqlite')
+
+  cache(dbd, 1, 'h:H')
+  cache(dbd, 2, 'h:H', 'body H')
+  cache(dbd, 1, 'h:H2')
+
+  gc_blobs(dbd)
+  dbd.commit()
+
+  errors = check(dbd)
+  pout(f'refcounts {"FAIL" if errors else "ok"}')
+
+  dbd.close()
+  tmpdir.cleanup()
+
+  return 1 if errors else 0
+## }}}
+
+if __name__ == '__main__':
+  exit(main(sys.argv))
+
+##
+# vim: ts=2 sw=2 tw=100 et fdm=marker :
+##
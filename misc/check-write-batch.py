@@ -0,0 +1,140 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+##
+# aggreg8.git:misc/check-write-batch.py
+##
+
+## {{{ ---- [ Header ] -----------------------------------------------------------------------------
+
+##
+# Copyright (c) 2021 Francis M <francism@destinatech.com>
+#
+# This program is free software; you can redistribute it and/or modify it under
+# the terms of the GNU General Public License version 2.0 as published by the
+# Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE.  See the GNU General Public License for more
+# details.
+#
+# You should have received a copy of the GNU General Public License along with
+# this program; if not, write to:
+#
+#   Free Software Foundation
+#   51 Franklin Street, Fifth Floor
+#   Boston, MA 02110
+#   USA
+##
+
+## }}} ---- [ Header ] -----------------------------------------------------------------------------
+
+##
+# Check WriteBatch replays queued writes with dependent rows after those they
+# depend on
+#
+# Usage: check-write-batch.py
+#
+# Queues the writes of three polled feeds into a scratch database (the first
+# one's body cached already, so it queues no blob of its own), through a
+# batch in queue order and through one in RssPoller's statement order, and
+# checks every cached body then has a blob counting its references. Exits
+# non-zero if not.
+##
+
+import os
+import sys
+
+import tempfile
+
+# Path to aggreg8 instance directory
+INSTANCE_DIR = os.path.abspath(os.path.dirname(__file__) + '/..')
+
+sys.path.append(INSTANCE_DIR)
+
+from aggreg8 import *
+
+from aggreg8.database import SqliteDatabase, WriteBatch
+
+from aggreg8.rss.cache import SQL_INSERT_BLOB
+
+from aggreg8.rss.poll import SQL_BATCH_ORDER, SQL_UPDATE_POLLED, SQL_UPSERT_CACHE
+
+## {{{ database()
+def database(path):
+  dbd = SqliteDatabase()
+  dbd.connect(path)
+
+  with open(f'{INSTANCE_DIR}/data/init.sql', encoding='utf-8') as fp:
+    dbd.executescript(fp.read())
+
+  dbd.executemany(
+    'INSERT INTO rss_feeds (name, proper_name, url, date_added, last_updated)'
+    ' VALUES(?, ?, ?, 0, 0)',
+    [(f'f{n}', f'Feed {n}', f'http://localhost/f{n}.xml') for n in range(3)]
+  )
+  dbd.execute(str(SQL_INSERT_BLOB), ('h:0', 'body 0', None, 0, 'h:0'))
+  dbd.commit()
+
+  return dbd
+## }}}
+
+## {{{ queue()
+def queue(batch):
+  # The order RssPoller._store() queues writes in, one feed after another
+  for n in range(3):
+    if n > 0:
+      batch.execute(str(SQL_INSERT_BLOB), (f'h:{n}', f'body {n}', None, 0, f'h:{n}'))
+    batch.execute(str(SQL_UPSERT_CACHE), (n + 1, f'http://localhost/f{n}.xml', 0, 0, f'h:{n}', None,
+      None))
+    batch.execute(str(SQL_UPDATE_POLLED), (0, 0, n + 1))
+## }}}
+
+## {{{ check()
+def check(dbd):
+  # Every cached body has a blob, counting exactly the rows referencing it
+  rows = dbd.execute(
+    'SELECT c.content_hash, b.refcount, (SELECT COUNT(*) FROM rss_feed_cache r'
+    ' WHERE r.content_hash=c.content_hash) FROM rss_feed_cache c'
+    ' LEFT JOIN rss_blobs b ON b.hash=c.content_hash'
+  ).fetchall()
+
+  errors = 0
+  for content_hash, refcount, references in rows:
+    if refcount != references:
+      perr(f'{content_hash}: refcount {refcount}, expected {references}')
+      errors += 1
+
+  return errors
+## }}}
+
+## {{{ main()
+def main(argv):
+  tmpdir = tempfile.TemporaryDirectory()
+
+  errors = 0
+  for name, order in [('queued', None), ('poller', SQL_BATCH_ORDER)]:
+    dbd = database(f'{tmpdir.name}/{name}.sqlite')
+
+    batch = WriteBatch(dbd, order=order)
+    queue(batch)
+    batch.flush()
+
+    failed = check(dbd)
+    pout(f'{name:<8} {"FAIL" if failed else "ok"}')
+    errors += failed
+
+    dbd.close()
+
+  tmpdir.cleanup()
+
+  return 1 if errors else 0
+## }}}
+
+if __name__ == '__main__':
+  exit(main(sys.argv))
+
+##
+# vim: ts=2 sw=2 tw=100 et fdm=marker :
+##